@@ -6,4 +6,14 @@
 #
 
 
-from .cmdmodule import *
+from . import cmdmodule
+
+
+def __getattr__(name):
+    if name not in cmdmodule.PLUGIN_MODULES:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    return getattr(cmdmodule, name)
+
+
+def __dir__():
+    return sorted([ *globals().keys(), *cmdmodule.PLUGIN_MODULES.keys() ])
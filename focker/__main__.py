@@ -9,18 +9,29 @@
 from .command import create_parser
 from .plugin import PLUGIN_MANAGER
 from .misc import focker_lock
+from .core import ZfsInventory
+from contextlib import ExitStack
 import sys
 
 
-@focker_lock()
 def main(args=None):
     PLUGIN_MANAGER.load()
     PLUGIN_MANAGER.change_defaults()
-    parser = create_parser()
+    if args is None:
+        args = sys.argv[1:]
+    parser = create_parser(args)
     args = parser.parse_args(args)
     if not hasattr(args, 'func'): # pragma: no cover
         parser.print_usage()
         sys.exit('You must choose an action')
+    with ExitStack() as stack:
+        if args.lock != 'none':
+            stack.enter_context(focker_lock(shared=( args.lock == 'shared' )))
+        stack.enter_context(ZfsInventory())
+        execute(args)
+
+
+def execute(args):
     PLUGIN_MANAGER.execute_pre_hooks(args.hook_name, args)
     args.func(args)
     PLUGIN_MANAGER.execute_post_hooks(args.hook_name, args)
@@ -6,8 +6,27 @@
 #
 
 
-from .image import ImagePlugin
-from .bootstrap import BootstrapPlugin
-from .volume import VolumePlugin
-from .jail import JailPlugin
-from .compose import ComposePlugin
+import importlib
+
+
+# plugins are imported on first access, so that
+# running one command does not import all of them
+PLUGIN_MODULES = {
+    'ImagePlugin': 'image',
+    'BootstrapPlugin': 'bootstrap',
+    'VolumePlugin': 'volume',
+    'JailPlugin': 'jail',
+    'ComposePlugin': 'compose',
+    'DaemonPlugin': 'daemon'
+}
+
+
+def __getattr__(name):
+    if name not in PLUGIN_MODULES:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    m = importlib.import_module(f'.{PLUGIN_MODULES[name]}', __name__)
+    return getattr(m, name)
+
+
+def __dir__():
+    return sorted([ *globals().keys(), *PLUGIN_MODULES.keys() ])
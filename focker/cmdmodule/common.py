@@ -7,10 +7,14 @@
 
 
 from tabulate import tabulate
+from contextlib import ExitStack
 import argparse
+import json
+import sys
 from ..core import JlsCache, \
-    ZfsPropertyCache, \
-    JailConfCache
+    ZfsPropertyCache
+from ..misc import nicenum, \
+    jailconf_find_jail
 
 
 DISPLAY_FIELDS = ['name', 'tags', 'sha256', 'mountpoint', 'is_protected',
@@ -19,6 +23,22 @@ DISPLAY_FIELDS = ['name', 'tags', 'sha256', 'mountpoint', 'is_protected',
 
 DEFAULT_DISPLAY_FIELDS = ['tags', 'size', 'mountpoint']
 
+# ZFS properties needed to display each of the fields
+FIELD_PROPERTIES = {
+    'tags': [ 'focker:tags' ],
+    'sha256': [ 'focker:sha256' ],
+    'mountpoint': [ 'mountpoint' ],
+    'is_protected': [ 'focker:protect' ],
+    'is_finalized': [ 'rdonly' ],
+    'size': [ 'used' ],
+    'referred_size': [ 'referenced' ],
+    'origin_tags': [ 'origin', 'focker:tags' ],
+    'origin_mountpoint': [ 'origin', 'mountpoint' ],
+    'origin_sha256': [ 'origin', 'focker:sha256' ]
+}
+
+SIZE_FIELDS = [ 'size', 'referred_size' ]
+
 
 def standard_fobject_commands(fobject_class,
     display_fields=DISPLAY_FIELDS,
@@ -29,6 +49,8 @@ def standard_fobject_commands(fobject_class,
         list=dict(
             aliases=['lst', 'ls', 'l'],
             func=kwargs.get('list', lambda args: cmd_taggable_list(args, fobject_class)),
+            lock='shared',
+            daemon=True,
             output=dict(
                 aliases=['o'],
                 type=str,
@@ -45,6 +67,12 @@ def standard_fobject_commands(fobject_class,
             tagged=dict(
                 aliases=['t'],
                 action='store_true'
+            ),
+            format=dict(
+                aliases=['f'],
+                type=str,
+                default='table',
+                choices=[ 'table', 'json', 'jsonl', 'tsv' ]
             )
         ),
         create=dict(
@@ -58,7 +86,11 @@ def standard_fobject_commands(fobject_class,
         ),
         prune=dict(
             aliases=['pru', 'p'],
-            func=kwargs.get('prune', lambda args: cmd_fobject_prune(args, fobject_class))
+            func=kwargs.get('prune', lambda args: cmd_fobject_prune(args, fobject_class)),
+            dry_run=dict(
+                aliases=['n'],
+                action='store_true'
+            )
         ),
         tag=dict(
             aliases=['t'],
@@ -106,6 +138,8 @@ def standard_fobject_commands(fobject_class,
         ),
         get=dict(
             func=kwargs.get('get', lambda args: cmd_fobject_get(args, fobject_class)),
+            lock='shared',
+            daemon=True,
             reference=dict(
                 positional=True,
                 type=str
@@ -135,31 +169,142 @@ def standard_fobject_commands(fobject_class,
     )
 
 
+def list_properties(fields, tagged=False):
+    res = [ p for f in fields for p in FIELD_PROPERTIES.get(f, []) ]
+    if tagged:
+        res.append('focker:tags')
+    return list(dict.fromkeys(res))
+
+
+def list_value_str(s, field=None):
+    if s is None:
+        return '-'
+    elif isinstance(s, bool):
+        return 'on' if s else 'off'
+    elif isinstance(s, set):
+        return ', '.join(sorted(s)) if s else '-'
+    elif field in SIZE_FIELDS:
+        return nicenum(s)
+    else:
+        return str(s)
+
+
+def list_value_raw(s, field=None):
+    if isinstance(s, set):
+        return sorted(s)
+    elif field in SIZE_FIELDS:
+        return int(s) if s is not None and s.isdigit() else None
+    else:
+        return s
+
+
+def list_sort_key(s, field):
+    if field in SIZE_FIELDS:
+        s = list_value_raw(s, field)
+        return -1 if s is None else s
+    return list_value_str(s)
+
+
+def _tags(s):
+    return set(t for t in s.split(' ') if t != '-') if s else set()
+
+
+def list_rows(lst, fields):
+    # Values come from the rows of the ZfsPropertyCache, origins
+    # are joined by name against the same cache and jids by path
+    # against the jail configuration and JlsCache, so that nothing
+    # is looked up dataset by dataset.
+    zc = ZfsPropertyCache.instance()
+    jls = JlsCache.instance()
+    for t in lst:
+        zrow = zc.get(t.name)
+        orig = None
+        orow = None
+        if zrow is not None and any(f.startswith('origin_') for f in fields):
+            orig = '@'.join(zrow.get('origin', '-').split('@')[:-1])
+            orow = zc.get(orig) if orig else None
+        res = {}
+        for f in fields:
+            if zrow is None or (orig and orow is None and f.startswith('origin_')):
+                res[f] = getattr(t, f)
+            elif f == 'tags':
+                res[f] = _tags(zrow.get('focker:tags'))
+            elif f in SIZE_FIELDS:
+                res[f] = zrow.get(FIELD_PROPERTIES[f][0])
+            elif f.startswith('origin_') and orow is None:
+                res[f] = None
+            elif f == 'origin_tags':
+                res[f] = _tags(orow.get('focker:tags'))
+            elif f == 'origin_mountpoint':
+                res[f] = orow.get('mountpoint')
+            elif f == 'origin_sha256':
+                res[f] = orow.get('focker:sha256')
+            elif f == 'jid' and jls is not None:
+                j = jls.data.get(jailconf_find_jail(path=zrow.get('mountpoint')))
+                res[f] = None if j is None else int(j['jid'])
+            else:
+                res[f] = getattr(t, f)
+        yield res
+
+
+def list_format_table(rows, fields):
+    res = [ [ list_value_str(r[f], f) for f in fields ] for r in rows ]
+    headers = [ f[0].upper() + f[1:].replace('_', ' ') for f in fields ]
+    print(tabulate(res, headers))
+
+
+def list_format_json(rows, fields):
+    sep = '['
+    for r in rows:
+        sys.stdout.write(sep + '\n' + json.dumps({ f: list_value_raw(r[f], f) for f in fields }))
+        sep = ','
+    print('[]' if sep == '[' else '\n]')
+
+
+def list_format_jsonl(rows, fields):
+    for r in rows:
+        print(json.dumps({ f: list_value_raw(r[f], f) for f in fields }))
+
+
+def list_format_tsv(rows, fields):
+    print('\t'.join(fields))
+    for r in rows:
+        print('\t'.join('-' if r[f] is None else \
+            ' '.join(sorted(r[f])) if isinstance(r[f], set) else \
+            list_value_str(r[f]) for f in fields))
+
+
+LIST_FORMATS = dict(
+    table=list_format_table,
+    json=list_format_json,
+    jsonl=list_format_jsonl,
+    tsv=list_format_tsv
+)
+
+
 def cmd_taggable_list(args, tcls):
-    with ZfsPropertyCache(), \
-        JlsCache(), \
-        JailConfCache():
-        
+    fields = args.output + ([ args.sort ] if args.sort is not None else [])
+    fields = list(dict.fromkeys(fields))
+    focker_types = [ tcls._meta_focker_type ]
+    # origins are images
+    if any(f.startswith('origin_') for f in fields) and 'image' not in focker_types:
+        focker_types.append('image')
+    with ExitStack() as stack:
+        stack.enter_context(ZfsPropertyCache(focker_type=focker_types,
+            properties=list_properties(fields, args.tagged)))
+        if 'jid' in fields:
+            stack.enter_context(JlsCache())
+
         lst = tcls.list()
         if args.tagged:
             lst = [ t for t in lst if t.tags ]
-        def to_string(s):
-            if s is None:
-                return '-'
-            elif isinstance(s, bool):
-                return 'on' if s else 'off'
-            elif isinstance(s, set):
-                return ', '.join(s) if s else '-'
-            else:
-                return str(s)
-        res = [ [ to_string(getattr(t, o)) for o in args.output  ] for t in lst ]
-        headers = [ o[0].upper() + o[1:].replace('_', ' ') for o in args.output ]
+        rows = list_rows(lst, fields)
         if args.sort is not None:
-            key = [ to_string(getattr(t, args.sort)) for t in lst ]
-            order = sorted(range(len(lst)), key=lambda i: key[i])
-            res = [ res[i] for i in order ]
-        # res = [ (' '.join(im.tags), im.mountpoint, ) for im in Image.list() ]
-        print(tabulate(res, headers))
+            rows = sorted(rows, key=lambda r: list_sort_key(r[args.sort], args.sort))
+        # rows are written as they are produced, except
+        # for the table which needs all of them for the layout
+        LIST_FORMATS[getattr(args, 'format', 'table')](rows, args.output)
+        sys.stdout.flush()
 
 
 def cmd_fobject_create(args, fobject_class):
@@ -169,7 +314,13 @@ def cmd_fobject_create(args, fobject_class):
 
 
 def cmd_fobject_prune(args, fobject_class):
-    fobject_class.prune()
+    batches, reclaimable = fobject_class.prune(dry_run=args.dry_run)
+    if not args.dry_run:
+        return
+    for i, bat in enumerate(batches):
+        print(f'Level {i}: {", ".join(bat)}')
+    print(f'Would remove {sum(map(len, batches))} {fobject_class._meta_focker_type}(s), ' \
+        f'reclaiming {reclaimable} bytes')
 
 
 def cmd_fobject_tag(args, fobject_class):
@@ -7,15 +7,12 @@
 
 
 from ...plugin import Plugin
-from .image import build_images
-from .volume import build_volumes
-from .jail import build_jails
+from .plan import ComposePlan
 from .hook import exec_prebuild, \
     exec_postbuild
 from ... import yaml
 from ...core.fenv import fenv_from_arg, \
     fenv_from_spec
-from ...core import OSJail
 import os
 
 
@@ -40,21 +37,24 @@ class ComposePlugin(Plugin):
                             aliases=['e'],
                             type=str,
                             nargs='+'
+                        ),
+                        no_hash_cache=dict(
+                            action='store_true'
+                        ),
+                        jobs=dict(
+                            aliases=['j'],
+                            type=int,
+                            default=1
+                        ),
+                        force=dict(
+                            aliases=['f'],
+                            action='store_true'
                         )
                     )
                 )
             )
         )
 
-    
-def stop_jails(jail_refs):
-    for ref in jail_refs:
-        j = OSJail.from_any_id(ref, raise_exc=False)
-        if j is None:
-            continue
-        if j.is_running:
-            j.stop()
-    
 
 def cmd_compose_build(args):
     with open(args.spec_filename, 'r') as f:
@@ -65,10 +65,8 @@ def cmd_compose_build(args):
     fenv = fenv_from_arg(args.fenv, {})
     fenv = fenv_from_spec(spec, fenv)
 
-    stop_jails(spec.get('jails', {}).keys())
     exec_prebuild(spec.get('exec.prebuild', []), spec_dir, fenv=fenv)
-    build_images(spec.get('images', {}), spec_dir, fenv=fenv, squeeze=args.squeeze)
-    build_volumes(spec.get('volumes', {}), fenv=fenv)
-    if 'jails' in spec:
-        build_jails(spec['jails'], fenv=fenv)
+    plan = ComposePlan(spec, spec_dir, fenv=fenv, squeeze=args.squeeze,
+        hash_cache=not args.no_hash_cache, force=args.force)
+    plan.run(max_workers=args.jobs)
     exec_postbuild(spec.get('exec.postbuild', []), spec_dir, fenv=fenv)
@@ -10,10 +10,15 @@ from ...core import ImageBuilder
 import os
 
 
-def build_images(spec, spec_dir, fenv, squeeze=False):
+def build_image(tag, focker_dir, fenv, squeeze=False, hash_cache=True):
+    bld = ImageBuilder(focker_dir, squeeze=squeeze, fenv=fenv, hash_cache=hash_cache)
+    im = bld.build()
+    im.add_tags([ tag ])
+    print(f'Created image {im.name} mounted at {im.mountpoint} with tags: {", ".join(im.tags)}')
+    return im
+
+
+def build_images(spec, spec_dir, fenv, squeeze=False, hash_cache=True):
     for tag, focker_dir in spec.items():
         focker_dir = os.path.join(spec_dir, focker_dir)
-        bld = ImageBuilder(focker_dir, squeeze=squeeze, fenv=fenv)
-        im = bld.build()
-        im.add_tags([ tag ])
-        print(f'Created image {im.name} mounted at {im.mountpoint} with tags: {", ".join(im.tags)}')
+        build_image(tag, focker_dir, fenv, squeeze=squeeze, hash_cache=hash_cache)
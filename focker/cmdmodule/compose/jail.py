@@ -9,25 +9,68 @@
 from ...core import clone_image_jailspec, \
     OSJailSpec, \
     JailFs, \
-    OSJail
+    OSJail, \
+    Image, \
+    Volume, \
+    ensure_list
 from ...core.fenv import rec_subst_fenv_vars
+import hashlib
+import json
 
 
-def build_jails(spec, fenv):
-    print('Removing existing jails...')
-    for tag, _ in spec.items():
-        # tag = substitute_focker_env_vars(tag, fenv)
-        jfs = JailFs.from_tag(tag, raise_exc=False)
-        if jfs is not None:
-            jfs.destroy()
+SPEC_DIGEST_PROPERTY = 'focker:spec_digest'
+
+
+def jail_spec_digest(jspec):
+    image = jspec.get('image')
+    if image is not None:
+        image = Image.from_any_id(image, strict=True).sha256
+    volumes = {}
+    for source in jspec.get('mounts', {}).keys():
+        if source.startswith('/'):
+            continue
+        vol = Volume.from_any_id(source.split('/')[0], strict=True, raise_exc=False)
+        volumes[source] = vol.sha256 if vol is not None else None
+    # jail.conf refers to dependencies by their OSJail names,
+    # which change whenever a dependency is recreated
+    depend = {}
+    for dep in ensure_list(jspec.get('depend', [])):
+        oj = OSJail.from_any_id(dep, strict=True, raise_exc=False)
+        depend[dep] = oj.name if oj is not None else None
+    data = json.dumps({ 'spec': jspec, 'image': image, 'volumes': volumes,
+        'depend': depend },
+        sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def remove_jail(tag):
+    # tag = substitute_focker_env_vars(tag, fenv)
+    jfs = JailFs.from_tag(tag, raise_exc=False)
+    if jfs is not None:
+        jfs.destroy()
+
+
+def build_jail(tag, jspec, force=False):
+    jspec = dict(jspec)
+    jspec['host.hostname'] = jspec.get('host.hostname', tag)
+    digest = jail_spec_digest(jspec)
+    jfs = JailFs.from_tag(tag, raise_exc=False)
+    if not force and jfs is not None and \
+        jfs.get_property(SPEC_DIGEST_PROPERTY) == digest and \
+        OSJail.from_mountpoint(jfs.path, raise_exc=False) is not None:
+        print(f'Jail {tag} is up to date')
+        return jfs
+    remove_jail(tag)
+    with clone_image_jailspec(jspec) as (jspec, _, jfs_take_ownership):
+        jfs = jfs_take_ownership()
+        jfs.add_tags([ tag ])
+        ospec = OSJailSpec.from_jailspec(jspec)
+        ospec.add()
+    jfs.set_props({ SPEC_DIGEST_PROPERTY: digest })
+    return jfs
+
 
-    print('Building new jails...')
+def build_jails(spec, fenv, force=False):
     for tag, jspec in spec.items():
         # tag = substitute_focker_env_vars(tag, fenv)
-        jspec = rec_subst_fenv_vars(jspec, fenv)
-        jspec['host.hostname'] = jspec.get('host.hostname', tag)
-        with clone_image_jailspec(jspec) as (jspec, _, jfs_take_ownership):
-            jfs = jfs_take_ownership()
-            jfs.add_tags([ tag ])
-            ospec = OSJailSpec.from_jailspec(jspec)
-            ospec.add()
+        build_jail(tag, rec_subst_fenv_vars(jspec, fenv), force=force)
@@ -0,0 +1,113 @@
+#
+# Copyright (C) Stanislaw Adaszewski, 2020-2021
+# License: GNU General Public License v3.0
+# URL: https://github.com/sadaszewski/focker
+# URL: https://adared.ch/focker
+#
+
+
+from .image import build_image
+from .volume import build_volume
+from .jail import build_jail
+from ...core import JailScheduler, \
+    FileHashCache
+from ...core.fenv import rec_subst_fenv_vars
+from ... import yaml
+from contextlib import ExitStack
+from typing import Dict, \
+    List
+import os
+
+
+class ComposeScheduler(JailScheduler):
+    def __init__(self, plan, max_workers: int = None):
+        super().__init__(plan.depends, max_workers=max_workers)
+        self.plan = plan
+
+    def dependencies(self) -> Dict[str, List[str]]:
+        return { name: list(d) for name, d in self.plan.depends.items() }
+
+
+class ComposePlan:
+    def __init__(self, spec, spec_dir, fenv, squeeze=False, hash_cache=True, force=False):
+        self.spec = spec
+        self.spec_dir = spec_dir
+        self.fenv = fenv
+        self.squeeze = squeeze
+        self.hash_cache = hash_cache
+        self.force = force
+        self.tasks = {}
+        self.depends = {}
+        self.planned = { f'{kind}/{tag}' for kind in [ 'images', 'volumes', 'jails' ] \
+            for tag in spec.get(kind, {}).keys() }
+        self._plan_images()
+        self._plan_volumes()
+        self._plan_jails()
+
+    def _add(self, name, func, depends):
+        self.tasks[name] = func
+        self.depends[name] = [ d for d in dict.fromkeys(depends) \
+            if d in self.planned and d != name ]
+
+    def image_base(self, focker_dir):
+        fname = os.path.join(self.spec_dir, focker_dir, 'Fockerfile')
+        if not os.path.exists(fname):
+            return None
+        with open(fname) as f:
+            base = yaml.safe_load(f).get('base')
+        return base if isinstance(base, str) else None
+
+    def _plan_images(self):
+        for tag, focker_dir in self.spec.get('images', {}).items():
+            base = self.image_base(focker_dir)
+            self._add(f'images/{tag}',
+                lambda tag=tag, focker_dir=focker_dir: \
+                    build_image(tag, os.path.join(self.spec_dir, focker_dir),
+                        fenv=self.fenv, squeeze=self.squeeze,
+                        hash_cache=self.hash_cache),
+                [ f'images/{base}' ] if base is not None else [])
+
+    def _plan_volumes(self):
+        for tag, params in self.spec.get('volumes', {}).items():
+            self._add(f'volumes/{tag}',
+                lambda tag=tag, params=params: \
+                    build_volume(tag, params, fenv=self.fenv),
+                [])
+
+    def _plan_jails(self):
+        for tag, jspec in self.spec.get('jails', {}).items():
+            jspec = rec_subst_fenv_vars(jspec, self.fenv)
+            depends = []
+            if 'image' in jspec:
+                depends.append(f'images/{jspec["image"]}')
+            for source in jspec.get('mounts', {}).keys():
+                if not source.startswith('/'):
+                    depends.append(f'volumes/{source.split("/")[0]}')
+            depend = jspec.get('depend', [])
+            if not isinstance(depend, list):
+                depend = [ depend ]
+            depends.extend(f'jails/{d}' for d in depend)
+            self._add(f'jails/{tag}',
+                lambda tag=tag, jspec=jspec: build_jail(tag, jspec, force=self.force),
+                depends)
+
+    def topological_order(self) -> List[str]:
+        return ComposeScheduler(self).topological_order()
+
+    def run(self, max_workers: int = None):
+        sched = ComposeScheduler(self, max_workers=max_workers)
+        def report(res):
+            if res.ok:
+                print(f'Built {res.name} in {res.elapsed:.2f}s')
+            elif not res.skipped:
+                print(f'Failed to build {res.name} - {res.error}')
+        with ExitStack() as stack:
+            hc = stack.enter_context(FileHashCache()) \
+                if self.hash_cache else None
+            results = sched.run(lambda name: self.tasks[name](), callback=report)
+            if hc is not None and hc.hits + hc.misses > 0:
+                print(f'File hash cache: {hc.hits} hit(s), {hc.misses} miss(es)')
+        for name in sched.topological_order():
+            if not results[name].ok and not results[name].skipped:
+                raise results[name].error
+        return results
@@ -6,28 +6,31 @@
 #
 
 
-from ...core import Volume
+from ...core import Volume, \
+    ZfsTransaction
 import os
 from ...core.fenv import rec_subst_fenv_vars
 
 
-def build_volumes(spec, fenv):
-    for tag, params in spec.items():
-        # tag = substitute_focker_env_vars(tag, fenv)
-        if Volume.exists_tag(tag):
-            v = Volume.from_tag(tag)
-        else:
-            v = Volume.create()
-            v.add_tags([ tag ])
-        params = rec_subst_fenv_vars(params, fenv)
-        print('params:', params)
-        if 'chown' in params:
-            os.chown(v.path, *map(int, params['chown'].split(':')))
-        if 'chmod' in params:
-            mode = params['chmod']
-            if isinstance(mode, str):
-                mode = int(mode, 0)
-            os.chmod(v.path, mode)
+def build_volume(tag, params, fenv):
+    # tag = substitute_focker_env_vars(tag, fenv)
+    # tagged right away, a volume left behind by a failing
+    # step below is still found by the next run
+    if Volume.exists_tag(tag):
+        v = Volume.from_tag(tag)
+    else:
+        v = Volume.create()
+        v.add_tags([ tag ])
+    params = rec_subst_fenv_vars(params, fenv)
+    print('params:', params)
+    if 'chown' in params:
+        os.chown(v.path, *map(int, params['chown'].split(':')))
+    if 'chmod' in params:
+        mode = params['chmod']
+        if isinstance(mode, str):
+            mode = int(mode, 0)
+        os.chmod(v.path, mode)
+    with ZfsTransaction():
         if 'zfs' in params:
             v.set_props(params['zfs'])
         if 'protect' in params:
@@ -35,3 +38,9 @@ def build_volumes(spec, fenv):
                 v.protect()
             else:
                 v.unprotect()
+    return v
+
+
+def build_volumes(spec, fenv):
+    for tag, params in spec.items():
+        build_volume(tag, params, fenv)
@@ -0,0 +1,45 @@
+#
+# Copyright (C) Stanislaw Adaszewski, 2020-2021
+# License: GNU General Public License v3.0
+# URL: https://github.com/sadaszewski/focker
+# URL: https://adared.ch/focker
+#
+
+
+from ..plugin import Plugin
+from ..daemon import FockerDaemon, \
+    daemon_socket_path
+import signal
+import sys
+
+
+class DaemonPlugin(Plugin):
+    @staticmethod
+    def provide_parsers():
+        return dict(
+            daemon=dict(
+                func=cmd_daemon,
+                lock='none',
+                socket=dict(
+                    type=str,
+                    default=None
+                ),
+                max_age=dict(
+                    type=float,
+                    default=60
+                )
+            )
+        )
+
+
+def cmd_daemon(args):
+    server = FockerDaemon(args.socket or daemon_socket_path(),
+        max_age=args.max_age)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f'Listening on {server.socket_path}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
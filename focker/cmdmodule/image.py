@@ -24,6 +24,7 @@ class ImagePlugin(Plugin):
                     build=dict(
                         aliases=['bld', 'b'],
                         func=cmd_image_build,
+                        lock='shared',
                         focker_dir=dict(
                             positional=True,
                             type=str
@@ -46,6 +47,9 @@ class ImagePlugin(Plugin):
                             aliases=['e'],
                             type=str,
                             nargs='+'
+                        ),
+                        no_hash_cache=dict(
+                            action='store_true'
                         )
                     )
                 )
@@ -55,7 +59,8 @@ class ImagePlugin(Plugin):
 
 def cmd_image_build(args):
     fenv = fenv_from_arg(args.fenv, {})
-    bld = ImageBuilder(args.focker_dir, squeeze=args.squeeze, atomic=args.atomic, fenv=fenv)
+    bld = ImageBuilder(args.focker_dir, squeeze=args.squeeze, atomic=args.atomic, fenv=fenv,
+        hash_cache=not args.no_hash_cache)
     im = bld.build()
     im.add_tags(args.tags)
     print(f'Created {im.name}, mounted at {im.path}, with tags: {", ".join(args.tags)}')
@@ -14,12 +14,17 @@ from ..core import JailFs, \
     OSJail, \
     one_exec_jailspec, \
     TemporaryOSJail, \
-    clone_image_jailspec
+    clone_image_jailspec, \
+    JailScheduler, \
+    JlsCache
 from ..core.jailspec import JailSpec
+from ..misc import load_jailconf
 from .common import standard_fobject_commands, \
     DISPLAY_FIELDS, \
     DEFAULT_DISPLAY_FIELDS
 from contextlib import ExitStack
+import subprocess
+import time
 
 
 class JailPlugin(Plugin):
@@ -98,7 +103,16 @@ class JailPlugin(Plugin):
                         func=cmd_jail_start,
                         jail_reference=dict(
                             positional=True,
-                            type=str
+                            type=str,
+                            nargs='?'
+                        ),
+                        all=dict(
+                            aliases=['a'],
+                            action='store_true'
+                        ),
+                        jobs=dict(
+                            aliases=['j'],
+                            type=int
                         )
                     ),
                     stop=dict(
@@ -106,7 +120,16 @@ class JailPlugin(Plugin):
                         func=cmd_jail_stop,
                         jail_reference=dict(
                             positional=True,
-                            type=str
+                            type=str,
+                            nargs='?'
+                        ),
+                        all=dict(
+                            aliases=['a'],
+                            action='store_true'
+                        ),
+                        jobs=dict(
+                            aliases=['j'],
+                            type=int
                         )
                     ),
                     restart=dict(
@@ -114,7 +137,16 @@ class JailPlugin(Plugin):
                         func=cmd_jail_restart,
                         jail_reference=dict(
                             positional=True,
-                            type=str
+                            type=str,
+                            nargs='?'
+                        ),
+                        all=dict(
+                            aliases=['a'],
+                            action='store_true'
+                        ),
+                        jobs=dict(
+                            aliases=['j'],
+                            type=int
                         )
                     )
                 )
@@ -155,12 +187,60 @@ def cmd_jail_fromimage(args):
         print('Added jail', ospec.name, 'with path', jfs.path)
 
 
+def jail_reference_or_all(args):
+    if args.all and args.jail_reference is not None:
+        raise ValueError('A jail reference and --all are mutually exclusive')
+    if not args.all and args.jail_reference is None:
+        raise ValueError('You must specify a jail reference or --all')
+
+
+def schedule_all_jails(args, action, reverse, verbs):
+    conf = load_jailconf()
+    sched = JailScheduler(conf, max_workers=args.jobs)
+    with JlsCache() as jls:
+        running = set(jls.data.keys())
+    if reverse:
+        skip = lambda name: name not in running
+    else:
+        skip = lambda name: name in running
+    ing, ed = verbs
+    def report(res):
+        if res.skipped and res.ok:
+            return
+        hostname = conf[res.name].get('host.hostname', res.name)
+        if res.ok:
+            print(f'{ed}: {res.name} ({hostname}) in {res.elapsed:.2f}s')
+        else:
+            print(f'{ing} failed: {res.name} ({hostname}) - {res.error}')
+    print(f'{ing} Focker jails in parallel ({sched.max_workers}) ...')
+    t_0 = time.perf_counter()
+    results = sched.run(lambda name: action(OSJail.from_name(name)),
+        reverse=reverse, skip=skip, callback=report)
+    n_ok = len([ r for r in results.values() if r.ok and not r.skipped ])
+    n_failed = len([ r for r in results.values() if not r.ok ])
+    print(f'{ed} {n_ok} jail(s) in {time.perf_counter() - t_0:.2f}s, ' \
+        f'{n_failed} failed, {len(results) - n_ok - n_failed} already done')
+    if n_failed > 0:
+        raise RuntimeError(f'{n_failed} jail(s) failed')
+    return results
+
+
 def cmd_jail_start(args):
+    jail_reference_or_all(args)
+    if args.all:
+        schedule_all_jails(args, lambda j: j.start(stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL), reverse=False, verbs=('Starting', 'Started'))
+        return
     j = OSJail.from_any_id(args.jail_reference)
     j.start()
 
 
 def cmd_jail_stop(args):
+    jail_reference_or_all(args)
+    if args.all:
+        schedule_all_jails(args, lambda j: j.stop(stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL), reverse=True, verbs=('Stopping', 'Stopped'))
+        return
     j = OSJail.from_any_id(args.jail_reference)
     j.stop()
 
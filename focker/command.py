@@ -22,9 +22,13 @@ def materialize_parsers(defs, subp, overrides, hook_name=[]):
         if 'subparsers' in v:
             materialize_parsers(v['subparsers'], parser.add_subparsers(), o, hook_name + [ k ])
         elif 'func' in v:
-            parser.set_defaults(func=v['func'], hook_name='.'.join(hook_name + [ k ]))
+            # commands which only read, or only lock what they create,
+            # declare lock='shared', lock='none' runs without the lock,
+            # daemon=True lets a running focker daemon serve the command
+            parser.set_defaults(func=v['func'], hook_name='.'.join(hook_name + [ k ]),
+                lock=v.get('lock', 'exclusive'), daemon=v.get('daemon', False))
             for k_1, v_1 in v.items():
-                if k_1 in ['func', 'aliases']:
+                if k_1 in ['func', 'aliases', 'lock', 'daemon']:
                     continue
                 v_2 = { k: v for k, v in v_1.items()
                     if k not in [ 'aliases', 'positional' ]}
@@ -39,10 +43,29 @@ def materialize_parsers(defs, subp, overrides, hook_name=[]):
                         **v_2)
 
 
-def create_parser():
+def requested_command(argv):
+    for a in argv:
+        if not a.startswith('-'):
+            return a
+    return None
+
+
+def create_parser(argv=None):
+    # with argv only the requested command is materialized and only
+    # the plugins providing it are imported, the other commands get
+    # empty placeholders so that they still show up in the usage
     parser = ArgumentParser('focker')
     subp = parser.add_subparsers()
 
+    manifest = PLUGIN_MANAGER.manifest
+    if argv is None or manifest is None:
+        PLUGIN_MANAGER.load_all()
+        name = None
+    else:
+        name = manifest.resolve(requested_command(argv))
+        if name is not None:
+            PLUGIN_MANAGER.load_command(name)
+
     provided_parsers = {}
     for p in PLUGIN_MANAGER.discovered_plugins:
         provided_parsers.update(p.provide_parsers())
@@ -53,6 +76,13 @@ def create_parser():
 
     # print('provided_parsers:', provided_parsers)
 
+    if argv is not None and manifest is not None:
+        for k, v in manifest.commands().items():
+            if k != name:
+                subp.add_parser(k, aliases=v['aliases'])
+        provided_parsers = { k: v for k, v in provided_parsers.items() \
+            if k == name or k not in manifest.commands() }
+
     materialize_parsers(provided_parsers, subp, FOCKER_CONFIG.command.overrides)
 
     return parser
@@ -19,3 +19,5 @@ from .process import *
 from .zfs import *
 from .config import FOCKER_CONFIG
 from .cache import *
+from .inventory import *
+from .zfsbackend import *
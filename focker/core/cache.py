@@ -1,9 +1,14 @@
 from contextvars import ContextVar
 from .process import focker_subprocess_check_output
-from .zfs import zfs_properties_cache
+from .zfs import zfs_properties_columns, \
+    zfs_get_property
 from typing import List
 import json
-from ..misc import load_jailconf
+from ..misc import load_jailconf, \
+    filehash
+from collections import OrderedDict
+import threading
+import tempfile
 import os
 
 
@@ -75,24 +80,94 @@ class JlsCache(CacheBase):
         return data
 
 
+class ZfsPropertyRow:
+    __slots__ = ( 'cache', 'name', 'id' )
+
+    def __init__(self, cache, name, id_):
+        self.cache = cache
+        self.name = name
+        self.id = id_
+
+    def get(self, propname, default=None):
+        col = self.cache.columns.get(propname)
+        if col is None:
+            if self.cache.properties is None:
+                return default
+            # outside of the projection
+            return zfs_get_property(self.name, propname)
+        res = col[self.id]
+        return default if res is None else res
+
+    def __getitem__(self, propname):
+        res = self.get(propname)
+        if res is None:
+            raise KeyError(propname)
+        return res
+
+    def __contains__(self, propname):
+        return ( self.get(propname) is not None )
+
+
 class ZfsPropertyCache(CacheBase):
+    # One list of values per property, indexed by dataset id,
+    # rather than one dict per dataset. With properties, only those
+    # are fetched, in parsable form, anything else is looked up
+    # individually when asked for.
     context_var = ContextVar('DATASET_CACHE', default=None)
 
-    def __init__(self, focker_type: List[str] = None):
+    BASE_PROPERTIES = [ 'mountpoint', 'focker:sha256' ]
+
+    def __init__(self, focker_type: List[str] = None, properties: List[str] = None):
         super().__init__()
         self.focker_type = focker_type
+        self.properties = None if properties is None else \
+            list(dict.fromkeys(self.BASE_PROPERTIES + list(properties)))
+        self.names = []
+        self.ids = {}
+        self.columns = {}
 
     def generate_cache(self):
-        if self.focker_type is not None:
-            data = {}
-            for ft in self.focker_type:
-                data.update(zfs_properties_cache(ft))
-        else:
-            data = zfs_properties_cache()
-        return data
+        self.names = []
+        self.ids = {}
+        self.columns = {}
+        for ft in ( self.focker_type if self.focker_type is not None else [ None ] ):
+            names, columns = zfs_properties_columns(ft, self.properties)
+            self._extend(names, columns)
+        return self.ids
+
+    def _extend(self, names, columns):
+        n = len(self.names)
+        for name in names:
+            self.ids[name] = len(self.names)
+            self.names.append(name)
+        for k in columns.keys() - self.columns.keys():
+            self.columns[k] = [ None ] * n
+        for k, col in self.columns.items():
+            col.extend(columns.get(k, [ None ] * len(names)))
+
+    def row(self, name):
+        return ZfsPropertyRow(self, name, self.ids[name])
+
+    def __getitem__(self, name):
+        return self.row(name)
+
+    def get(self, name, default=None):
+        if name not in self.ids:
+            return default
+        return self.row(name)
+
+    def items(self):
+        return ( ( name, ZfsPropertyRow(self, name, i) ) \
+            for i, name in enumerate(self.names) )
+
+    def find(self, propname, value):
+        col = self.columns.get(propname, [])
+        return [ self.names[i] for i, v in enumerate(col) if v == value ]
 
     def _get_property(self, name, propname):
-        return self.data.get(name, {}).get(propname, '-')
+        if name not in self.ids:
+            return '-'
+        return self.row(name).get(propname, '-')
 
 
 class JailConfCache(CacheBase):
@@ -104,3 +179,75 @@ class JailConfCache(CacheBase):
     @classmethod
     def conf(cls):
         return cls.instance().data
+
+
+class FileHashCache(CacheBase):
+    context_var = ContextVar('FILE_HASH_CACHE', default=None)
+
+    def __init__(self, fname: str = None, max_entries: int = 100000):
+        super().__init__()
+        if fname is None:
+            from .config import FOCKER_CONFIG
+            fname = os.path.join(FOCKER_CONFIG.zfs.root_mountpoint, '.filehash-cache.json')
+        self.fname = fname
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.modified = False
+        self.lock = threading.Lock()
+
+    def generate_cache(self):
+        try:
+            with open(self.fname) as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            data = []
+        return OrderedDict(data)
+
+    def __exit__(self, *excinfo):
+        try:
+            if self.modified:
+                self.save()
+        finally:
+            super().__exit__(*excinfo)
+
+    def save(self):
+        with self.lock:
+            # concurrent builds save at the same time, each
+            # through its own temporary file (created 0600)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.fname),
+                prefix=os.path.basename(self.fname) + '.', suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(list(self.data.items()), f)
+                os.replace(tmp, self.fname)
+            except:
+                os.unlink(tmp)
+                raise
+            self.modified = False
+
+    @staticmethod
+    def key(st: os.stat_result) -> str:
+        return f'{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}'
+
+    def filehash(self, fname: str) -> str:
+        key = self.key(os.stat(fname))
+        with self.lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return self.data[key]
+            self.misses += 1
+        res = filehash(fname)
+        with self.lock:
+            self.data[key] = res
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+            self.modified = True
+        return res
+
+
+def cached_filehash(fname: str) -> str:
+    if FileHashCache.is_available():
+        return FileHashCache.instance().filehash(fname)
+    return filehash(fname)
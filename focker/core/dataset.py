@@ -8,6 +8,15 @@
 
 from .zfs import *
 from .cache import ZfsPropertyCache
+from .inventory import ZfsInventory
+from ..misc import nicenum
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import contextvars
+
+
+# read in parsable form, presented the way zfs get prints them
+SIZE_PROPERTIES = [ 'used', 'referenced' ]
 
 
 Dataset = 'Dataset'
@@ -19,6 +28,7 @@ class Dataset:
     _meta_zfs_type = 'filesystem'
     _meta_cloneable_from = None
     _meta_can_finalize = True
+    _meta_by_focker_type = {}
     _init_key = object()
 
     def __init__(self, **kwargs):
@@ -40,14 +50,23 @@ class Dataset:
         return cls(init_key=cls._init_key, name=name, sha256=sha256,
             mountpoint=mountpoint)
 
+    @staticmethod
+    def from_inventory(inv, name):
+        # the class follows from where the dataset is, origins
+        # of jails are images and descendants of images can be jails
+        focker_type = name[len(inv.root_dataset()) + 1:].split('/')[0][:-1]
+        cls = Dataset._meta_by_focker_type[focker_type]
+        props = inv[name]
+        return cls(init_key=cls._init_key, name=name, sha256=props['focker:sha256'],
+            mountpoint=props['mountpoint'])
+
     @classmethod
     def from_mountpoint(cls, mountpoint):
         if ZfsPropertyCache.is_available():
-            res = [ (k, v) for k, v in ZfsPropertyCache.instance().items() \
-                if v.get('mountpoint') == mountpoint ]
+            res = ZfsPropertyCache.instance().find('mountpoint', mountpoint)
             if len(res) != 1:
                 raise ValueError('Expected to find one matching mountpoint')
-            return cls.from_name(res[0][0])
+            return cls.from_name(res[0])
         else:
             res = zfs_list(fields=['name', 'mountpoint'],
                 focker_type = cls._meta_focker_type, zfs_type=cls._meta_zfs_type)
@@ -66,8 +85,7 @@ class Dataset:
             raise RuntimeError(f'{base.__class__.__name__} must be finalized')
         if sha256 is None:
             sha256 = random_sha256_hexdigest()
-        if zfs_exists_props({ 'focker:sha256': sha256 }, focker_type=cls._meta_focker_type,
-            zfs_type=cls._meta_zfs_type):
+        if cls.exists_sha256(sha256):
             raise RuntimeError(f'{cls.__name__} with specified SHA256 already exists')
         name = zfs_shortest_unique_name(sha256, focker_type=cls._meta_focker_type)
         zfs_clone(base.snapshot_name, name, { 'focker:sha256': sha256 })
@@ -78,8 +96,9 @@ class Dataset:
     def finalize(self):
         if not self._meta_can_finalize:
             raise RuntimeError(f'{self.__class__.__name__} cannot be finalized')
-        zfs_set_props(self.name, { 'rdonly': 'on' })
-        zfs_snapshot(self.snapshot_name)
+        with zfs_transaction():
+            zfs_set_props(self.name, { 'rdonly': 'on' })
+            zfs_snapshot(self.snapshot_name)
 
     @property
     def is_finalized(self):
@@ -124,6 +143,30 @@ class Dataset:
                 return None
         return lst
 
+    @classmethod
+    def _index(cls):
+        return ZfsInventory.current().index(cls._meta_focker_type)
+
+    @classmethod
+    def from_index_lookup(cls, lookup, raise_exc=True):
+        index = cls._index()
+        lst = cls.from_predicate_handle_corner_cases(lookup(index), raise_exc=raise_exc)
+        if lst is None:
+            return None
+        props = index.data[lst[0]]
+        return cls._meta_class(init_key=cls._init_key, name=lst[0],
+            sha256=props['focker:sha256'], mountpoint=props['mountpoint'])
+
+    @classmethod
+    def exists_index_lookup(cls, lookup):
+        lst = lookup(cls._index())
+        if len(lst) == 0:
+            return False
+        elif len(lst) == 1:
+            return True
+        else:
+            raise RuntimeError('Ambiguous reference')
+
     @classmethod
     def exists_predicate(cls, pred):
         lst = zfs_list(cls._meta_list_columns,
@@ -138,11 +181,11 @@ class Dataset:
 
     @classmethod
     def exists_sha256(cls, sha256: str):
-        return cls.exists_predicate(lambda e: e[2] == sha256)
+        return cls.exists_index_lookup(lambda idx: idx.find_sha256(sha256))
 
     @classmethod
     def exists_tag(cls, tag: str):
-        return cls.exists_predicate(lambda e: tag in e[3].split(' '))
+        return cls.exists_index_lookup(lambda idx: idx.find_tag(tag))
 
     @classmethod
     def from_predicate(cls, pred, raise_exc=True):
@@ -159,35 +202,35 @@ class Dataset:
 
     @classmethod
     def from_sha256(cls, sha256: str, raise_exc=True):
-        return cls.from_predicate(lambda e: e[2] == sha256, raise_exc=raise_exc)
+        return cls.from_index_lookup(lambda idx: idx.find_sha256(sha256), raise_exc=raise_exc)
 
     @classmethod
     def from_tag(cls, tag: str, raise_exc=True):
-        return cls.from_predicate(lambda e: tag in e[3].split(' '), raise_exc=raise_exc)
+        return cls.from_index_lookup(lambda idx: idx.find_tag(tag), raise_exc=raise_exc)
 
     @classmethod
     def from_partial_sha256(cls, sha256: str):
-        return cls.from_predicate(lambda e: e[2].startswith(sha256))
+        return cls.from_index_lookup(lambda idx: idx.find_partial_sha256(sha256))
 
     @classmethod
     def from_partial_tag(cls, tag: str):
-        return cls.from_predicate(lambda e: any(t.startswith(tag) for t in e[3].split(' ')))
+        return cls.from_index_lookup(lambda idx: idx.find_partial_tag(tag))
 
     @classmethod
     def from_any_id(cls, id_: str, strict=True, raise_exc=True):
         if strict:
-            return cls.from_predicate(lambda e: \
-                id_ in e[3].split(' ') or e[2] == id_, raise_exc=raise_exc)
+            return cls.from_index_lookup(lambda idx: idx.find_any_id(id_),
+                raise_exc=raise_exc)
         else:
-            return cls.from_predicate(lambda e: \
-                any(t.startswith(id_) for t in e[3].split(' ')) or \
-                e[2].startswith(id_), raise_exc=raise_exc)
+            return cls.from_index_lookup(lambda idx: idx.find_partial_any_id(id_),
+                raise_exc=raise_exc)
 
     def add_tags(self, tags):
         if tags is None:
             return
-        zfs_untag(tags, focker_type=self._meta_focker_type)
-        zfs_tag(self.name, tags)
+        with zfs_transaction():
+            zfs_untag(tags, focker_type=self._meta_focker_type)
+            zfs_tag(self.name, tags)
 
     def remove_tags(self, tags):
         if tags is None:
@@ -222,19 +265,66 @@ class Dataset:
         return cls.from_sha256(sha256)
 
     def destroy(self, force=False):
-        if self.in_use() and not force:
+        if not force and self.in_use():
             raise RuntimeError(f'This {self.__class__.__name__.lower()} is in use')
         zfs_destroy(self.name)
 
     @classmethod
-    def prune(cls):
-        while True:
-            lst = cls.list_unused()
-            lst = [ ds for ds in lst if not ds.tags ]
-            if len(lst) == 0:
-                break
-            for ds in lst:
-                ds.destroy()
+    def prune_graph(cls):
+        # names of the datasets of the same type which each dataset relies on,
+        # and the names of the datasets kept in use by anything else
+        unused = set(ds.name for ds in cls.list_unused())
+        return {}, set(ds.name for ds in cls.list() if ds.name not in unused)
+
+    @classmethod
+    def prune_plan(cls):
+        uses, pinned = cls.prune_graph()
+        fields = [ 'name', 'focker:tags', 'focker:protect', 'used' ]
+        removable = {}
+        for name, tags, protect, used, *_ in zfs_list(fields,
+            focker_type=cls._meta_focker_type):
+            if tags == '-' and protect == '-' and name not in pinned:
+                removable[name] = int(used) if used.isdigit() else 0
+        n_users = {}
+        for deps in uses.values():
+            for name in deps:
+                n_users[name] = n_users.get(name, 0) + 1
+        # Kahn's algorithm from the leaves up; each level only holds
+        # datasets that do not depend on one another
+        level = [ name for name in removable.keys() if n_users.get(name, 0) == 0 ]
+        batches = []
+        while level:
+            batches.append(sorted(level))
+            next_level = []
+            for name in level:
+                for dep in uses.get(name, []):
+                    n_users[dep] -= 1
+                    if n_users[dep] == 0 and dep in removable:
+                        next_level.append(dep)
+            level = next_level
+        reclaimable = sum(removable[name] for bat in batches for name in bat)
+        return batches, reclaimable
+
+    @classmethod
+    def prune(cls, dry_run=False, max_workers=None):
+        if not ZfsInventory.is_available():
+            with ZfsInventory():
+                return cls.prune(dry_run=dry_run, max_workers=max_workers)
+        batches, reclaimable = cls.prune_plan()
+        if dry_run:
+            return batches, reclaimable
+        datasets = { ds.name: ds for ds in cls.list() }
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            for bat in batches:
+                futures = [ ex.submit(contextvars.copy_context().run,
+                    datasets[name]._prune_destroy) for name in bat ]
+                for f in futures:
+                    f.result()
+        return batches, reclaimable
+
+    def _prune_destroy(self):
+        # usage and protection were already checked in prune_plan()
+        zfs_destroy(self.name, check_protect=False)
 
     @property
     def is_protected(self):
@@ -253,6 +343,14 @@ class Dataset:
 
     @property
     def origin(self):
+        if ZfsInventory.is_available() and self.name in ZfsInventory.instance():
+            # O(1) from the origin graph rather than a lookup by name
+            inv = ZfsInventory.instance()
+            orig = inv.origin_graph().parent.get(self.name)
+            if orig is None:
+                return None
+            if orig in inv:
+                return self.from_inventory(inv, orig)
         orig = self.get_property('origin')
         orig = '@'.join(orig.split('@')[:-1])
         if not orig:
@@ -281,6 +379,13 @@ class Dataset:
             return None
         return orig.sha256
 
+    def lineage(self) -> List[Dataset]:
+        # the origin, the origin of the origin and so on
+        inv = ZfsInventory.current()
+        return [ self.from_inventory(inv, name) \
+            for name in inv.origin_graph().lineage(self.name) \
+            if name in inv ]
+
     @property
     def referred_size(self):
         return self.get_property('referenced')
@@ -293,8 +398,12 @@ class Dataset:
 
     def get_property(self, propname):
         if ZfsPropertyCache.is_available():
-            return ZfsPropertyCache.instance()[self.name].get(propname, '-')
-        return zfs_get_property(self.name, propname)
+            res = ZfsPropertyCache.instance()[self.name].get(propname, '-')
+        else:
+            res = zfs_get_property(self.name, propname)
+        if propname in SIZE_PROPERTIES:
+            res = nicenum(res)
+        return res
 
     def __enter__(self):
         return self
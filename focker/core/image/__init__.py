@@ -8,3 +8,4 @@
 
 from .image import Image
 from .build import ImageBuilder
+from .plan import BuildPlan
@@ -9,10 +9,12 @@
 import os
 from ... import yaml
 from functools import reduce
-from .steps import create_step
 from .image import Image
+from .plan import BuildPlan
 from contextlib import ExitStack
 from ..fenv import fenv_from_spec
+from ..cache import FileHashCache
+from ...misc.lock import focker_lock_resources
 
 
 def validate(spec):
@@ -24,11 +26,12 @@ def validate(spec):
 
 
 class ImageBuilder:
-    def __init__(self, focker_dir, squeeze=False, atomic=False, fenv={}):
+    def __init__(self, focker_dir, squeeze=False, atomic=False, fenv={}, hash_cache=True):
         self.focker_dir = focker_dir
         self.squeeze = squeeze
         self.atomic = atomic
         self.fenv = fenv
+        self.hash_cache = hash_cache
 
     def build(self) -> Image:
         if not os.path.exists(os.path.join(self.focker_dir, 'Fockerfile')):
@@ -41,10 +44,16 @@ class ImageBuilder:
 
         fenv = fenv_from_spec(spec, self.fenv)
 
-        if 'steps' in spec:
-            im = self.process_steps(spec, fenv)
-        else:
-            im = self.process_facets(spec, fenv)
+        with ExitStack() as stack:
+            # reuse the cache of an enclosing build, e.g. focker compose
+            hc = stack.enter_context(FileHashCache()) \
+                if self.hash_cache and not FileHashCache.is_available() else None
+            if 'steps' in spec:
+                im = self.process_steps(spec, fenv)
+            else:
+                im = self.process_facets(spec, fenv)
+            if hc is not None and hc.hits + hc.misses > 0:
+                print(f'File hash cache: {hc.hits} hit(s), {hc.misses} miss(es)')
 
         return im
 
@@ -64,20 +73,19 @@ class ImageBuilder:
 
         base_im = Image.from_any_id(spec['base'], strict=True)
 
-        sha256 = base_im.sha256
-        im = base_im
+        plan = BuildPlan.from_steps(base_im, steps, self.focker_dir, fenv)
+
+        im = plan.cached_image
         with ExitStack() as stack:
-            for group in steps:
-                for st in group:
-                    st = create_step(st, self.focker_dir, fenv)
-                    sha256 = st.hash(sha256)
+            for group, sha256 in plan.pending:
+                # a concurrent build of the same step finishes first
+                focker_lock_resources('sha256', [ f'image/{sha256}' ])
                 if Image.exists_sha256(sha256):
                     im = Image.from_sha256(sha256)
                     continue
                 im = Image.clone_from(im, sha256=sha256)
                 try:
                     for st in group:
-                        st = create_step(st, self.focker_dir, fenv)
                         st.execute(im)
                 except:
                     im.destroy()
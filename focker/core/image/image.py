@@ -7,9 +7,9 @@
 
 
 from ..dataset import Dataset
-from ..zfs import zfs_list, \
-    zfs_destroy
-from functools import reduce
+from ..zfs import zfs_list
+from ..inventory import ZfsInventory
+from typing import List
 
 
 Image='Image'
@@ -32,37 +32,24 @@ class Image(Dataset):
         lst = [ Image.from_name(item[0]) for item in lst if item[0] not in used ]
         return lst
 
+    def descendants(self) -> List[Dataset]:
+        # images and jails cloned from this image, directly
+        # or not, nearest first
+        inv = ZfsInventory.current()
+        return [ self.from_inventory(inv, name) \
+            for name in inv.origin_graph().descendants(self.name) \
+            if name in inv ]
+
     @staticmethod
-    def prune():
-        fields = [ 'name', 'origin', 'focker:tags' ]
-        tree = {}
-        for focker_type in [ 'image', 'jail' ]:
-            lst = zfs_list(fields, focker_type=focker_type)
-            for name, origin, tags, *_ in lst:
-                origin = origin.split('@')[0]
-                node = tree.get(origin, {})
-                children = node.get('children', [])
-                children.append(name)
-                node['children'] = children
-                tree[origin] = node
-                if focker_type == 'image' and tags == '-':
-                    node = tree.get(name, {})
-                    node.update({ 'parent': origin, 'tags': tags })
-                    tree[name] = node
-        batches = []
-        while True:
-            bat = set([ k for k, v in tree.items() if not v.get('children') ])
-            if not bat:
-                break
-            batches.append(bat)
-            tree = { k: v for k, v in tree.items() if k not in bat }
-            for name in bat:
-                for v in tree.values():
-                    if name in v.get('children', []):
-                        v['children'].remove(name)
-        batches = reduce(list.__add__, map(list, batches), [])
-        for name in batches:
-            zfs_destroy(name)
+    def prune_graph():
+        uses = {}
+        for name, origin, *_ in zfs_list([ 'name', 'origin' ], focker_type='image'):
+            uses[name] = [ origin.split('@')[0] ]
+        pinned = set()
+        for name, origin, *_ in zfs_list([ 'name', 'origin' ], focker_type='jail'):
+            pinned.add(origin.split('@')[0])
+        return uses, pinned
 
 Image._meta_class = Image
 Image._meta_cloneable_from = Image
+Dataset._meta_by_focker_type['image'] = Image
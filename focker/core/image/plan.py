@@ -0,0 +1,66 @@
+#
+# Copyright (C) Stanislaw Adaszewski, 2020-2021
+# License: GNU General Public License v3.0
+# URL: https://github.com/sadaszewski/focker
+# URL: https://adared.ch/focker
+#
+
+
+from .steps import create_step, \
+    CopyStep
+from .image import Image
+from ..inventory import ZfsInventory
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+
+
+class BuildPlan:
+    def __init__(self, base_im, groups, hashes, first_miss):
+        self.base_im = base_im
+        self.groups = groups
+        self.hashes = hashes
+        self.first_miss = first_miss
+
+    @property
+    def cached_image(self):
+        if self.first_miss == 0:
+            return self.base_im
+        return Image.from_sha256(self.hashes[self.first_miss - 1])
+
+    @property
+    def pending(self):
+        return list(zip(self.groups, self.hashes))[self.first_miss:]
+
+    @staticmethod
+    def prehash(groups, max_workers=None):
+        entries = [ e for group in groups for st in group \
+            if isinstance(st, CopyStep) for e in st.entries ]
+        if len(entries) < 2:
+            return
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            futures = [ ex.submit(contextvars.copy_context().run, e.hash) \
+                for e in entries ]
+            for f in futures:
+                f.result()
+
+    @classmethod
+    def from_steps(cls, base_im, steps, focker_dir, fenv, max_workers=None):
+        groups = [ [ create_step(st, focker_dir, fenv) for st in group ] \
+            for group in steps ]
+        cls.prehash(groups, max_workers=max_workers)
+
+        hashes = []
+        sha256 = base_im.sha256
+        for group in groups:
+            for st in group:
+                sha256 = st.hash(sha256)
+            hashes.append(sha256)
+
+        index = ZfsInventory.current().index('image')
+        first_miss = len(hashes)
+        for i, sha256 in enumerate(hashes):
+            if not index.find_sha256(sha256):
+                first_miss = i
+                break
+
+        return cls(base_im, groups, hashes, first_miss)
@@ -7,13 +7,16 @@
 
 import hashlib
 import json
-import shutil
 import os
 import shlex
-from ...misc import filehash
+from ...misc import filehash, \
+    dirhash, \
+    copyfile_fast, \
+    copytree_fast
 from ..jailspec import ImageBuildJailSpec
 from ..osjail import TemporaryOSJail
 from ..fenv import substitute_focker_env_vars
+from ..cache import cached_filehash
 import io
 
 
@@ -59,21 +62,33 @@ class CopyStepEntry:
         self.dst_file = spec[1]
         self.options = spec[2] if len(spec) > 2 else {}
         self.use_fenv = self.options.get('use_fenv', False)
+        self.is_dir = os.path.isdir(self.src_file)
+        self.content_hash = None
+
+        if self.is_dir and self.use_fenv:
+            raise ValueError('use_fenv is not supported when copying directories')
 
     def hash(self):
-        if self.use_fenv:
+        if self.content_hash is not None:
+            return self.content_hash
+        if self.is_dir:
+            self.content_hash = dirhash(self.src_file, hashfn=cached_filehash)
+        elif self.use_fenv:
             with open(self.src_file) as f:
                 s = f.read()
                 s = substitute_focker_env_vars(s, self.fenv)
                 s = s.encode('utf-8')
-                return filehash(io.BytesIO(s))
+                self.content_hash = filehash(io.BytesIO(s))
         else:
-            return filehash(self.src_file)
+            self.content_hash = cached_filehash(self.src_file)
+        return self.content_hash
 
     def execute(self, im):
         dst_fnam = os.path.join(im.path, self.dst_file.strip('/'))
         os.makedirs(os.path.split(dst_fnam)[0], exist_ok=True)
-        if self.use_fenv:
+        if self.is_dir:
+            copytree_fast(self.src_file, dst_fnam)
+        elif self.use_fenv:
             with open(self.src_file) as f_1, \
                 open(dst_fnam, 'wb') as f_2:
                 s = f_1.read()
@@ -81,7 +96,7 @@ class CopyStepEntry:
                 s = s.encode('utf-8')
                 f_2.write(s)
         else:
-            shutil.copyfile(self.src_file, dst_fnam)
+            copyfile_fast(self.src_file, dst_fnam)
 
         if 'chmod' in self.options:
             mode = self.options['chmod']
@@ -0,0 +1,266 @@
+#
+# Copyright (C) Stanislaw Adaszewski, 2020-2021
+# License: GNU General Public License v3.0
+# URL: https://github.com/sadaszewski/focker
+# URL: https://adared.ch/focker
+#
+
+
+from contextvars import ContextVar
+from .zfsbackend import zfs_backend
+from .cache import CacheBase
+from typing import List
+import threading
+import bisect
+
+
+class DatasetIndex:
+    def __init__(self, data, names):
+        self.data = data
+        self.by_tag = {}
+        self.by_sha256 = {}
+        for name in names:
+            props = data[name]
+            self.by_sha256.setdefault(props['focker:sha256'], []).append(name)
+            for t in self._tags(props):
+                self.by_tag.setdefault(t, []).append(name)
+        self.sorted_tags = sorted(self.by_tag.keys())
+        self.sorted_sha256 = sorted(self.by_sha256.keys())
+
+    @staticmethod
+    def _tags(props):
+        return [ t for t in props.get('focker:tags', '-').split(' ') if t != '-' ]
+
+    @staticmethod
+    def _insert(lookup, sorted_keys, key, name):
+        if key not in lookup:
+            lookup[key] = []
+            bisect.insort(sorted_keys, key)
+        lookup[key].append(name)
+
+    @staticmethod
+    def _remove(lookup, sorted_keys, key, name):
+        lst = lookup.get(key, [])
+        if name in lst:
+            lst.remove(name)
+        if key in lookup and not lst:
+            del lookup[key]
+            del sorted_keys[bisect.bisect_left(sorted_keys, key)]
+
+    # incremental updates, so that changing one dataset
+    # does not rebuild the index of the whole store
+    def add(self, name, props):
+        if props.get('focker:sha256', '-') == '-':
+            return
+        self._insert(self.by_sha256, self.sorted_sha256, props['focker:sha256'], name)
+        for t in self._tags(props):
+            self._insert(self.by_tag, self.sorted_tags, t, name)
+
+    def discard(self, name, props):
+        if props.get('focker:sha256', '-') == '-':
+            return
+        self._remove(self.by_sha256, self.sorted_sha256, props['focker:sha256'], name)
+        for t in self._tags(props):
+            self._remove(self.by_tag, self.sorted_tags, t, name)
+
+    @staticmethod
+    def _prefix_lookup(sorted_keys, lookup, prefix, res, limit):
+        i = bisect.bisect_left(sorted_keys, prefix)
+        while i < len(sorted_keys) and sorted_keys[i].startswith(prefix):
+            res.update(lookup[sorted_keys[i]])
+            if len(res) >= limit:
+                break
+            i += 1
+        return res
+
+    def find_tag(self, tag: str) -> List[str]:
+        return list(self.by_tag.get(tag, []))
+
+    def find_sha256(self, sha256: str) -> List[str]:
+        return list(self.by_sha256.get(sha256, []))
+
+    def find_any_id(self, id_: str) -> List[str]:
+        res = dict.fromkeys(self.by_tag.get(id_, []))
+        res.update(dict.fromkeys(self.by_sha256.get(id_, [])))
+        return list(res)
+
+    # limit=2 is enough to tell a unique match from an ambiguous one
+    def find_partial_tag(self, prefix: str, limit: int = 2) -> List[str]:
+        return list(self._prefix_lookup(self.sorted_tags, self.by_tag,
+            prefix, set(), limit))
+
+    def find_partial_sha256(self, prefix: str, limit: int = 2) -> List[str]:
+        return list(self._prefix_lookup(self.sorted_sha256, self.by_sha256,
+            prefix, set(), limit))
+
+    def find_partial_any_id(self, prefix: str, limit: int = 2) -> List[str]:
+        res = self._prefix_lookup(self.sorted_tags, self.by_tag,
+            prefix, set(), limit)
+        if len(res) < limit:
+            self._prefix_lookup(self.sorted_sha256, self.by_sha256,
+                prefix, res, limit)
+        return list(res)
+
+
+class OriginGraph:
+    # Parent and children of every dataset, by name, from
+    # the origin property of the whole inventory in one pass.
+    def __init__(self, data):
+        self.parent = {}
+        self.children = {}
+        for name, props in data.items():
+            orig = '@'.join(props.get('origin', '-').split('@')[:-1])
+            if not orig:
+                continue
+            self.parent[name] = orig
+            self.children.setdefault(orig, []).append(name)
+
+    def lineage(self, name: str) -> List[str]:
+        res = []
+        while name in self.parent:
+            name = self.parent[name]
+            if name in res:
+                break # pragma: no cover
+            res.append(name)
+        return res
+
+    def descendants(self, name: str) -> List[str]:
+        res = []
+        level = [ name ]
+        while level:
+            level = [ c for n in level for c in self.children.get(n, []) ]
+            res.extend(level)
+        return res
+
+
+class ZfsInventory(CacheBase):
+    context_var = ContextVar('ZFS_INVENTORY', default=None)
+
+    PROPERTIES = [ 'mountpoint', 'focker:sha256', 'focker:tags', 'rdonly',
+        'used', 'referenced', 'origin', 'focker:protect', 'focker:spec_digest' ]
+    FOCKER_TYPES = [ 'image', 'jail', 'volume' ]
+
+    def __init__(self):
+        super().__init__()
+        self.dirty = set()
+        self.indices = {}
+        self.graph = None
+        self.lock = threading.RLock()
+
+    def generate_cache(self):
+        return None # loaded lazily on first access
+
+    @classmethod
+    def current(cls):
+        if cls.is_available():
+            return cls.instance()
+        return cls()
+
+    @staticmethod
+    def root_dataset():
+        from .config import FOCKER_CONFIG
+        return FOCKER_CONFIG.zfs.root_dataset
+
+    def covers(self, name):
+        return name.startswith(self.root_dataset() + '/')
+
+    def _query(self, names, recursive):
+        return zfs_backend().get(names, self.PROPERTIES, recursive=recursive,
+            parsable=True)
+
+    def _ensure_loaded(self):
+        with self.lock:
+            if self.data is None:
+                root = self.root_dataset()
+                self.data = self._query([ f'{root}/{ft}s' for ft in self.FOCKER_TYPES ],
+                    recursive=True)
+                self.dirty.clear()
+                self.indices.clear()
+                self.graph = None
+            elif self.dirty:
+                names = sorted(self.dirty)
+                self.dirty.clear()
+                self.graph = None
+                fresh = self._query(names, recursive=False)
+                for name in names:
+                    old = self.data.pop(name, None)
+                    if name in fresh:
+                        self.data[name] = fresh[name]
+                    self._reindex(name, old, fresh.get(name))
+            return self.data
+
+    def _reindex(self, name, old, new):
+        for focker_type, idx in self.indices.items():
+            if not name.startswith(f'{self.root_dataset()}/{focker_type}s/'):
+                continue
+            if old is not None:
+                idx.discard(name, old)
+            if new is not None:
+                idx.add(name, new)
+
+    def invalidate(self, names: List[str], recursive: bool = False):
+        with self.lock:
+            if self.data is None:
+                return
+            for name in names:
+                if not self.covers(name):
+                    continue
+                self.dirty.add(name)
+                if recursive:
+                    self.dirty.update(k for k in self.data.keys() \
+                        if k.startswith(name + '/'))
+
+    def invalidate_all(self):
+        with self.lock:
+            self.data = None
+            self.dirty.clear()
+            self.indices.clear()
+            self.graph = None
+
+    def __getitem__(self, name):
+        return self._ensure_loaded()[name]
+
+    def __contains__(self, name):
+        return name in self._ensure_loaded()
+
+    def get(self, name, default=None):
+        return self._ensure_loaded().get(name, default)
+
+    def items(self):
+        return list(self._ensure_loaded().items())
+
+    def _get_property(self, name, propname):
+        return self._ensure_loaded().get(name, {}).get(propname, '-')
+
+    def names(self, focker_type: str) -> List[str]:
+        prefix = f'{self.root_dataset()}/{focker_type}s/'
+        with self.lock:
+            return [ k for k, v in self._ensure_loaded().items() \
+                if k.startswith(prefix) and v.get('focker:sha256', '-') != '-' ]
+
+    def index(self, focker_type: str) -> DatasetIndex:
+        with self.lock:
+            data = self._ensure_loaded()
+            if focker_type not in self.indices:
+                self.indices[focker_type] = DatasetIndex(data, self.names(focker_type))
+            return self.indices[focker_type]
+
+    def origin_graph(self) -> OriginGraph:
+        with self.lock:
+            data = self._ensure_loaded()
+            if self.graph is None:
+                self.graph = OriginGraph(data)
+            return self.graph
+
+    def rows(self, fields: List[str], focker_type: str) -> List[List[str]]:
+        fields = list(fields)
+        fields.append('focker:sha256')
+        with self.lock:
+            data = self._ensure_loaded()
+            return [ [ name if f == 'name' else data[name].get(f, '-') for f in fields ] \
+                for name in self.names(focker_type) ]
+
+
+def zfs_inventory_invalidate(names: List[str], recursive: bool = False):
+    if ZfsInventory.is_available():
+        ZfsInventory.instance().invalidate(names, recursive=recursive)
@@ -14,7 +14,7 @@ from .process import focker_subprocess_check_output
 from .misc import ensure_list
 from .osjail import OSJail
 import json
-from ..misc import load_jailconf
+from ..misc import jailconf_index
 
 
 JailFs = 'JailFs'
@@ -41,15 +41,38 @@ class JailFs(Dataset):
 
     @staticmethod
     def list_unused():
-        conf = load_jailconf()
+        idx = jailconf_index().index
         used = set()
-        for k, v in conf.items():
-            for jname in v.get('depend', []):
-                if jname not in conf:
+        for k, v in idx.items():
+            for jname in v['depend']:
+                if jname not in idx:
                     continue
-                used.add(conf[jname]['path'])
+                used.add(idx[jname]['path'])
         lst = zfs_list(['name', 'mountpoint'], focker_type='jail')
         lst = [ JailFs.from_name(item[0]) for item in lst if item[1] not in used ]
         return lst
 
+    @staticmethod
+    def prune_graph():
+        idx = jailconf_index().index
+        by_path = { mountpoint: name for name, mountpoint, *_ in \
+            zfs_list([ 'name', 'mountpoint' ], focker_type='jail') }
+        uses = {}
+        pinned = set()
+        for v in idx.values():
+            deps = [ by_path[idx[jname]['path']] for jname in v['depend'] \
+                if jname in idx and idx[jname]['path'] in by_path ]
+            if v['path'] in by_path:
+                uses.setdefault(by_path[v['path']], []).extend(deps)
+            else:
+                pinned.update(deps)
+        return uses, pinned
+
+    def _prune_destroy(self):
+        jail = OSJail.from_mountpoint(self.path, raise_exc=False)
+        if jail is not None:
+            jail.remove()
+        super()._prune_destroy()
+
 JailFs._meta_class = JailFs
+Dataset._meta_by_focker_type['jail'] = JailFs
@@ -7,6 +7,10 @@
 
 
 from ..process import focker_subprocess_check_output
+import subprocess
+import threading
+import json
+import os
 
 
 def get_jail_sysctl_params():
@@ -22,7 +26,62 @@ def get_jail_sysctl_params():
     return _params
 
 
-JAIL_SYSCTL_PARAMS = get_jail_sysctl_params()
+# used where sysctl is not available, e.g. on
+# Linux test hosts - FreeBSD 13 parameters
+JAIL_SYSCTL_PARAMS_FALLBACK = frozenset({ 'allow', 'allow.adjtime',
+    'allow.chflags', 'allow.extattr', 'allow.mlock', 'allow.mount',
+    'allow.mount.devfs', 'allow.mount.fdescfs', 'allow.mount.linprocfs',
+    'allow.mount.linsysfs', 'allow.mount.nullfs', 'allow.mount.procfs',
+    'allow.mount.tmpfs', 'allow.mount.zfs', 'allow.quotas',
+    'allow.raw_sockets', 'allow.read_msgbuf', 'allow.reserved_ports',
+    'allow.set_hostname', 'allow.settime', 'allow.socket_af',
+    'allow.suser', 'allow.sysvipc', 'allow.unprivileged_proc_debug',
+    'allow.vmm', 'children', 'children.cur', 'children.max', 'cpuset',
+    'cpuset.id', 'devfs_ruleset', 'dying', 'enforce_statfs', 'host',
+    'host.domainname', 'host.hostid', 'host.hostuuid', 'ip4', 'ip4.addr',
+    'ip4.saddrsel', 'ip6', 'ip6.addr', 'ip6.saddrsel', 'jid', 'linux',
+    'linux.osname', 'linux.osrelease', 'linux.oss_version', 'osreldate',
+    'osrelease', 'parent', 'persist', 'securelevel', 'sysvmsg', 'sysvsem',
+    'sysvshm', 'vnet', 'zfs', 'zfs.mount_snapshot' })
+
+
+JAIL_SYSCTL_PARAMS_CACHE_VERSION = 1
+
+
+def jail_sysctl_params_cache_path():
+    return os.environ.get('FOCKER_JAIL_PARAMS_CACHE',
+        '/var/cache/focker/jail-params.json')
+
+
+def kernel_version():
+    u = os.uname()
+    return f'{u.sysname} {u.release} {u.version}'
+
+
+def load_jail_sysctl_params():
+    # the parameters only change with the kernel,
+    # sysctl is run once per kernel version
+    path = jail_sysctl_params_cache_path()
+    key = dict(version=JAIL_SYSCTL_PARAMS_CACHE_VERSION, kernel=kernel_version())
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        if data['key'] == key:
+            return frozenset(data['params'])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    try:
+        params = get_jail_sysctl_params()
+    except (OSError, subprocess.CalledProcessError):
+        return JAIL_SYSCTL_PARAMS_FALLBACK
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(dict(key=key, params=sorted(params)), f)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        pass
+    return frozenset(params)
 
 
 JAIL_PSEUDO_PARAMS = {'exec.prestart', 'exec.start', 'command',
@@ -35,9 +94,6 @@ JAIL_PSEUDO_PARAMS = {'exec.prestart', 'exec.start', 'command',
     'allow.dying'}
 
 
-JAIL_PARAMS = JAIL_SYSCTL_PARAMS.union(JAIL_PSEUDO_PARAMS)
-
-
 JAIL_FOCKER_PARAMS = { 'image', 'mounts', 'env', 'jailfs', 'path',
     'name', 'host.hostname', 'depend', 'resolv_conf', 'meta' }
 
@@ -46,5 +102,39 @@ JAIL_EXEC_PARAMS = {'exec.prestart', 'exec.start', 'command',
     'exec.poststart', 'exec.prestop', 'exec.stop', 'exec.poststop'}
 
 
-if JAIL_FOCKER_PARAMS.intersection(JAIL_PARAMS):
-    print('WARNING !!! Legal jail params collide with Focker params. Jail params will take precedence.') # pragma: no cover
+_LAZY = {}
+_LAZY_LOCK = threading.Lock()
+
+
+def jail_sysctl_params() -> frozenset:
+    with _LAZY_LOCK:
+        if 'sysctl' not in _LAZY:
+            _LAZY['sysctl'] = load_jail_sysctl_params()
+        return _LAZY['sysctl']
+
+
+def jail_params() -> frozenset:
+    res = _LAZY.get('params')
+    if res is None:
+        res = jail_sysctl_params().union(JAIL_PSEUDO_PARAMS)
+        if JAIL_FOCKER_PARAMS.intersection(res):
+            print('WARNING !!! Legal jail params collide with Focker params. Jail params will take precedence.') # pragma: no cover
+        _LAZY['params'] = res
+    return res
+
+
+def jail_known_params() -> frozenset:
+    # everything a jail spec may contain, one lookup per key
+    res = _LAZY.get('known')
+    if res is None:
+        res = _LAZY['known'] = jail_params().union(JAIL_FOCKER_PARAMS)
+    return res
+
+
+def __getattr__(name):
+    # the former module-level constants, now computed on first use
+    if name == 'JAIL_SYSCTL_PARAMS':
+        return jail_sysctl_params()
+    if name == 'JAIL_PARAMS':
+        return jail_params()
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -8,7 +8,7 @@
 
 from .constant import JAIL_FOCKER_PARAMS, \
     JAIL_EXEC_PARAMS, \
-    JAIL_PARAMS
+    jail_known_params
 from ..mount import MountSpec
 from ..misc import ensure_list
 from ...misc import merge_dicts
@@ -36,8 +36,9 @@ class JailSpec:
 
     @staticmethod
     def validate_dict(jailspec: Dict):
+        known = jail_known_params()
         for k in jailspec.keys():
-            if k not in JAIL_PARAMS and k not in JAIL_FOCKER_PARAMS:
+            if k not in known:
                 raise KeyError('Unknown parameter in jail spec: ' + k)
 
         if 'exec.start' in jailspec and 'command' in jailspec:
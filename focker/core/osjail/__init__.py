@@ -8,3 +8,5 @@
 
 from .osjail import OSJail
 from .temp import TemporaryOSJail
+from .scheduler import JailScheduler, \
+    JailTaskResult
@@ -42,10 +42,9 @@ class OSJail:
 
     @classmethod
     def from_mountpoint(cls, path, raise_exc=True):
-        conf = load_jailconf()
-        for k, blk in conf.items():
-            if 'path' in blk and blk['path'] == path:
-                return OSJail(init_key=cls._init_key, name=k)
+        name = jailconf_find_jail(path=path)
+        if name is not None:
+            return OSJail(init_key=cls._init_key, name=name)
         if raise_exc:
             raise RuntimeError('OSJail with the given mountpoint not found')
         else:
@@ -77,7 +76,7 @@ class OSJail:
 
     def params_to_cmdline(self):
         cmd = []
-        conf = jailconf_load_jail(name=self.name)
+        conf = self.jail_params
         cmd.append('name=' + self.name)
         for k, v in conf.items():
             if isinstance(v, list):
@@ -93,7 +92,7 @@ class OSJail:
         return cmd
 
     def start(self, **kwargs):
-        blk = JailBlock.create(self.name, self.conf)
+        blk = JailBlock.create(self.name, self.jail_params)
         jc = JailConf()
         jc[self.name] = blk
         cmd = [ 'jail', '-f', '-', '-c', self.name ]
@@ -101,7 +100,7 @@ class OSJail:
         focker_subprocess_run(cmd, input=str(jc).encode('utf-8'), **kwargs)
 
     def stop(self, **kwargs):
-        blk = JailBlock.create(self.name, self.conf)
+        blk = JailBlock.create(self.name, self.jail_params)
         jc = JailConf()
         jc[self.name] = blk
         cmd = [ 'jail', '-f', '-', '-r', self.name ]
@@ -184,3 +183,7 @@ class OSJail:
     def conf(self):
         blk = jailconf_load_jail(name=self.name)
         return blk
+
+    @property
+    def jail_params(self):
+        return jailconf_jail_params(self.conf)
@@ -0,0 +1,124 @@
+#
+# Copyright (C) Stanislaw Adaszewski, 2020-2021
+# License: GNU General Public License v3.0
+# URL: https://github.com/sadaszewski/focker
+# URL: https://adared.ch/focker
+#
+
+
+from concurrent.futures import ThreadPoolExecutor, \
+    wait, \
+    FIRST_COMPLETED
+from typing import Dict, \
+    List, \
+    Callable
+import multiprocessing as mp
+import contextvars
+import time
+
+
+class JailTaskResult:
+    def __init__(self, name, ok, elapsed, error=None, skipped=False):
+        self.name = name
+        self.ok = ok
+        self.elapsed = elapsed
+        self.error = error
+        self.skipped = skipped
+
+
+class JailScheduler:
+    def __init__(self, conf: Dict[str, Dict], max_workers: int = None):
+        self.conf = conf
+        self.max_workers = max_workers or mp.cpu_count()
+
+    def dependencies(self) -> Dict[str, List[str]]:
+        res = {}
+        for name, entry in self.conf.items():
+            depend = entry.get('depend', [])
+            if not isinstance(depend, list):
+                depend = [ depend ]
+            res[name] = [ d for d in depend if d in self.conf and d != name ]
+        return res
+
+    def graph(self, reverse=False):
+        deps = self.dependencies()
+        waits_for = { name: set(d) for name, d in deps.items() }
+        if reverse:
+            waits_for = { name: set() for name in deps.keys() }
+            for name, d in deps.items():
+                for dep in d:
+                    waits_for[dep].add(name)
+        successors = { name: [] for name in waits_for.keys() }
+        for name, w in waits_for.items():
+            for dep in w:
+                successors[dep].append(name)
+        return waits_for, successors
+
+    def topological_order(self, reverse=False) -> List[str]:
+        waits_for, successors = self.graph(reverse=reverse)
+        pending = { name: len(w) for name, w in waits_for.items() }
+        ready = [ name for name, n in pending.items() if n == 0 ]
+        res = []
+        while ready:
+            name = ready.pop(0)
+            res.append(name)
+            for succ in successors[name]:
+                pending[succ] -= 1
+                if pending[succ] == 0:
+                    ready.append(succ)
+        if len(res) != len(pending):
+            cycle = sorted(name for name in pending.keys() if name not in res)
+            raise RuntimeError(f'Dependency cycle among jails: {", ".join(cycle)}')
+        return res
+
+    def run(self, action: Callable[[str], None], reverse=False,
+        skip: Callable[[str], bool] = lambda name: False,
+        callback: Callable[[JailTaskResult], None] = None) -> Dict[str, JailTaskResult]:
+
+        order = self.topological_order(reverse=reverse)
+        waits_for, successors = self.graph(reverse=reverse)
+        pending = { name: len(w) for name, w in waits_for.items() }
+        failed = set()
+        results = {}
+
+        def finish(res):
+            results[res.name] = res
+            if not res.ok:
+                failed.add(res.name)
+            if callback is not None:
+                callback(res)
+            ready = []
+            for succ in successors[res.name]:
+                pending[succ] -= 1
+                if pending[succ] == 0:
+                    ready.append(succ)
+            return ready
+
+        def task(name):
+            t_0 = time.perf_counter()
+            try:
+                action(name)
+            except Exception as e:
+                return JailTaskResult(name, False, time.perf_counter() - t_0, error=e)
+            return JailTaskResult(name, True, time.perf_counter() - t_0)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as ex:
+            running = set()
+            ready = [ name for name in order if pending[name] == 0 ]
+            while ready or running:
+                while ready:
+                    name = ready.pop(0)
+                    if not reverse and waits_for[name].intersection(failed):
+                        ready.extend(finish(JailTaskResult(name, False, 0.0,
+                            error=RuntimeError('Dependency failed'), skipped=True)))
+                    elif skip(name):
+                        ready.extend(finish(JailTaskResult(name, True, 0.0, skipped=True)))
+                    else:
+                        running.add(ex.submit(contextvars.copy_context().run, task, name))
+                if not running:
+                    continue
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for f in done:
+                    ready.extend(finish(f.result()))
+
+        return results
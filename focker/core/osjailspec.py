@@ -70,6 +70,7 @@ class OSJailSpec:
         else:
             raise ValueError('Unsupported resolv_conf specification')
 
+        mounts = []
         for m in jailspec.mounts:
             m = mount_from_spec(m, path)
 
@@ -81,6 +82,8 @@ class OSJailSpec:
 
             poststop.insert(0, f'umount -f {shlex.quote(mountpoint)}')
 
+            mounts.append({ 'source': source, 'mountpoint': mountpoint, 'fs_type': m.fs_type })
+
         exec_params = dict(jailspec.exec_params)
         exec_params['exec.prestart'] = prestart + exec_params.get('exec.prestart', [])
         exec_params['exec.start'] = start + exec_params.get('exec.start', []) + exec_params.get('command', [])
@@ -94,7 +97,7 @@ class OSJailSpec:
         params['path'] = path
         params['host.hostname'] = jailspec.hostname
         params['depend'] = [ OSJail.from_any_id(dep, strict=True).name for dep in jailspec.depend ]
-        # mounts
+        params['focker.mounts'] = mounts
         return OSJailSpec(init_key=OSJailSpec.__init_key, params=params, name=name)
 
     def to_dict(self):
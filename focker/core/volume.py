@@ -7,24 +7,43 @@
 
 
 from .dataset import Dataset
-from ..misc import load_jailconf
-from .zfs import zfs_list
+from ..misc import jailconf_index
+from .zfs import zfs_list, \
+    zfs_exists
+import os
 
 
 class Volume(Dataset):
     _meta_focker_type = 'volume'
     _meta_can_finalize = False
 
+    @staticmethod
+    def used_paths():
+        # mount sources and all their parents, so that mounting
+        # a subdirectory of a volume counts as using the volume
+        used = set()
+        for item in jailconf_index().index.values():
+            for source in item['mounts']:
+                while source not in used and source not in [ '', '/' ]:
+                    used.add(source)
+                    source = os.path.dirname(source)
+        return used
+
     @classmethod
     def list_unused(cls):
-        conf = load_jailconf()
-        used = set()
-        for k, blk in conf.items():
-            for v in Volume.list():
-                 if f'mount -t nullfs {v.path} ' in blk.get('exec.prestart', ''):
-                     used.add(v.path)
-        lst = Volume.list()
-        lst = [ v for v in lst if v.path not in used ]
-        return lst
+        used = cls.used_paths()
+        return [ v for v in Volume.list() if v.path not in used ]
+
+    def in_use(self):
+        if not zfs_exists(self.name):
+            return False
+        return ( self.path in self.used_paths() )
+
+    @classmethod
+    def prune_graph(cls):
+        # volumes do not depend on each other
+        used = cls.used_paths()
+        return {}, set(v.name for v in Volume.list() if v.path in used)
 
 Volume._meta_class = Volume
+Dataset._meta_by_focker_type['volume'] = Volume
@@ -8,14 +8,20 @@
 
 from .process import focker_subprocess_check_output, \
     focker_subprocess_run
+from .zfsbackend import zfs_backend
+from ..misc.lock import focker_lock_resources, \
+    focker_try_lock_resource
 from typing import Dict, \
+    List, \
     Tuple
+from contextvars import ContextVar
+from contextlib import contextmanager
 import subprocess
 import io
 import csv
 import os
-from functools import reduce
 import random
+import threading
 from collections import defaultdict
 
 
@@ -32,32 +38,43 @@ def zfs_parse_output(command):
 
 
 def zfs_poolname():
-    poolname = zfs_parse_output(['zfs', 'list', '-H', '/'])
+    poolname = zfs_backend().list([ '/' ], [ 'name' ])
     if len(poolname) == 0:
         raise RuntimeError('The root filesystem is not ZFS')
     poolname = poolname[0][0].split('/')[0]
     return poolname
 
 
+def zfs_invalidate(names, recursive=False):
+    from .inventory import zfs_inventory_invalidate
+    zfs_inventory_invalidate(names, recursive=recursive)
+
+
+def zfs_inventory():
+    from .inventory import ZfsInventory
+    if ZfsInventory.is_available():
+        return ZfsInventory.instance()
+    return None
+
+
 def zfs_exists(name):
-    try:
-        zfs_run(['zfs', 'list', name])
-    except subprocess.CalledProcessError as e:
-        return False
-    return True
+    inv = zfs_inventory()
+    if inv is not None and inv.covers(name):
+        return ( name in inv )
+    return zfs_backend().exists(name)
 
 
 def zfs_create(name, props={}, exist_ok=False):
-    if zfs_exists(name):
-        if exist_ok:
-            return
-        else:
-            raise RuntimeError('Specified ZFS dataset already exists')
-    props = [ [ '-o', f'{k}={v}' ] for k, v in props.items() ]
-    props = reduce(list.__add__, props, [])
-    cmd = [ 'zfs', 'create', *props, name ]
-    # print('cmd:', cmd)
-    focker_subprocess_run(cmd)
+    try:
+        if zfs_exists(name):
+            if exist_ok:
+                return
+            else:
+                raise RuntimeError('Specified ZFS dataset already exists')
+        zfs_backend().create(name, props)
+    finally:
+        zfs_release_name(name)
+    zfs_invalidate([ name ])
 
 
 def zfs_init():
@@ -74,79 +91,180 @@ def zfs_init():
 
 def zfs_list(fields=['name'], focker_type='image', zfs_type='filesystem'):
     from .config import FOCKER_CONFIG
+    from .inventory import ZfsInventory
+    if zfs_type == 'filesystem' and \
+        all(f == 'name' or f in ZfsInventory.PROPERTIES for f in fields):
+        return ZfsInventory.current().rows(fields, focker_type)
     fields = list(fields)
     fields.append('focker:sha256')
-    lst = zfs_parse_output(['zfs', 'list', '-o', ','.join(fields),
-        '-H', '-t', zfs_type, '-r', FOCKER_CONFIG.zfs.root_dataset + '/' + focker_type + 's'])
+    lst = zfs_backend().list([ FOCKER_CONFIG.zfs.root_dataset + '/' + focker_type + 's' ],
+        fields, recursive=True, zfs_type=zfs_type)
     lst = list(filter(lambda a: a[-1] != '-', lst))
     return lst
 
 
+class ZfsTransaction:
+    context_var = ContextVar('ZFS_TRANSACTION', default=None)
+
+    def __init__(self):
+        self.tok = None
+        self.changes = {}
+        self.recursive = set()
+        self.snapshots = []
+
+    def __enter__(self):
+        self.tok = self.context_var.set(self)
+        return self
+
+    def __exit__(self, exc_type, *_):
+        self.context_var.reset(self.tok)
+        self.tok = None
+        if exc_type is None:
+            self.commit()
+
+    @classmethod
+    def is_available(cls):
+        return ( cls.context_var.get() is not None )
+
+    @classmethod
+    def instance(cls):
+        return cls.context_var.get()
+
+    # reads see the state before the transaction
+    # except for the changes recorded in it
+    def get_property(self, name, prop_name):
+        changes = self.changes.get(name, {})
+        if prop_name in changes:
+            value = changes[prop_name]
+            return '-' if value is None else value
+        return zfs_get_property(name, prop_name)
+
+    def changed(self, prefix, prop_name):
+        return [ name for name, changes in self.changes.items() \
+            if name.startswith(prefix) and prop_name in changes ]
+
+    def set_props(self, name, props):
+        self.changes.setdefault(name, {}).update(props)
+
+    def inherit(self, name, prop_name, recursive=False):
+        self.changes.setdefault(name, {})[prop_name] = None
+        if recursive:
+            self.recursive.add(( name, prop_name ))
+
+    def snapshot(self, name):
+        self.snapshots.append(name)
+
+    # Applied as one batch of the backend, which for the channel program
+    # backend is atomic only for user properties and snapshots, native
+    # properties (e.g. rdonly) are set before and stay set if it fails.
+    def commit(self):
+        backend = zfs_backend()
+        touched = []
+        with backend.batch():
+            for name, changes in self.changes.items():
+                props = { k: v for k, v in changes.items() if v is not None }
+                if props:
+                    backend.set(name, props)
+                for k, v in changes.items():
+                    if v is None:
+                        backend.inherit(name, k, recursive=(( name, k ) in self.recursive))
+                touched.append(name)
+            if self.snapshots:
+                backend.snapshot(*self.snapshots)
+        self.changes = {}
+        self.snapshots = []
+        zfs_invalidate(touched, recursive=bool(self.recursive))
+        self.recursive = set()
+
+
+@contextmanager
+def zfs_transaction():
+    if ZfsTransaction.is_available():
+        yield ZfsTransaction.instance()
+    else:
+        with ZfsTransaction() as tx:
+            yield tx
+
+
 def zfs_tag(name, tags, replace=False):
     if any(' ' in a for a in tags):
         raise ValueError('Tags cannot contain spaces')
     if any(a == '-' for a in tags):
         raise ValueError('Tags cannot consist of just the minus sign')
-    lst = zfs_parse_output(['zfs', 'list', '-o', 'focker:tags', '-H', name])
-    if not replace:
-        tags = list(tags)
-        tags.extend(lst[0][0].split(' '))
-        tags = list(set(tags))
-        tags = list(filter(lambda a: a != '-', tags))
-    if len(tags) > 0:
-        zfs_run(['zfs', 'set', 'focker:tags=' + ' '.join(tags), name])
-    else:
-        zfs_run(['zfs', 'inherit', 'focker:tags', name])
+    with zfs_transaction() as tx:
+        if not replace:
+            tags = list(tags)
+            tags.extend(tx.get_property(name, 'focker:tags').split(' '))
+            tags = list(set(tags))
+            tags = list(filter(lambda a: a != '-', tags))
+        if len(tags) > 0:
+            tx.set_props(name, { 'focker:tags': ' '.join(tags) })
+        else:
+            tx.inherit(name, 'focker:tags')
 
 
 def zfs_untag(tags, focker_type='image'):
     from .config import FOCKER_CONFIG
+    from .inventory import ZfsInventory
     if any(map(lambda a: ' ' in a, tags)):
         raise ValueError('Tags cannot contain spaces')
     # print('zfs_untag(), tags:', tags)
-    lst = zfs_parse_output(['zfs', 'list', '-o', 'name,focker:tags', '-H', '-r',
-        FOCKER_CONFIG.zfs.root_dataset + '/' + focker_type + 's'])
-    lst = filter(lambda a: any([b in a[1].split(' ') for b in tags]), lst)
-    for row in lst:
-        cur_tags = row[1].split(' ')
-        for t in tags:
-            if t in cur_tags:
-                cur_tags.remove(t)
-        zfs_tag(row[0], cur_tags, replace=True)
-
-
-def zfs_destroy(name):
-    lst = zfs_parse_output(['zfs', 'get', '-H', 'focker:protect', name])
-    if lst[0][2] != '-':
+    focker_lock_resources('tag', [ f'{focker_type}/{t}' for t in tags ])
+    with zfs_transaction() as tx:
+        index = ZfsInventory.current().index(focker_type)
+        names = set(name for t in tags for name in index.find_tag(t))
+        names.update(tx.changed(f'{FOCKER_CONFIG.zfs.root_dataset}/{focker_type}s/',
+            'focker:tags'))
+        for name in sorted(names):
+            cur_tags = tx.get_property(name, 'focker:tags').split(' ')
+            if not any(t in cur_tags for t in tags):
+                continue
+            for t in tags:
+                if t in cur_tags:
+                    cur_tags.remove(t)
+            cur_tags = [ t for t in cur_tags if t != '-' ]
+            zfs_tag(name, cur_tags, replace=True)
+
+
+def zfs_destroy(name, check_protect=True):
+    if check_protect and zfs_get_property(name, 'focker:protect') != '-':
         raise RuntimeError('%s is protected against removal' % name)
-    zfs_run(['zfs', 'destroy', '-r', '-f', name])
+    zfs_backend().destroy(name, recursive=True)
+    zfs_invalidate([ name ], recursive=True)
 
 
 def zfs_protect(name):
-    zfs_run(['zfs', 'set', 'focker:protect=on', name])
+    with zfs_transaction() as tx:
+        tx.set_props(name, { 'focker:protect': 'on' })
 
 
 def zfs_unprotect(name):
-    zfs_run(['zfs', 'inherit', '-r', 'focker:protect', name])
+    with zfs_transaction() as tx:
+        tx.inherit(name, 'focker:protect', recursive=True)
 
 
 def zfs_get_property(name, prop_name):
-    lst = zfs_parse_output([ 'zfs', 'get', '-H', prop_name, name ])
+    inv = zfs_inventory()
+    if inv is not None and prop_name in inv.PROPERTIES and name in inv:
+        return inv.get_property(name, prop_name)
+    lst = zfs_backend().list([ name ], [ prop_name ], zfs_type='all')
     assert len(lst) == 1
-    return lst[0][2]
+    return lst[0][0]
 
 
 def zfs_clone(name, target_name, props={}):
-    cmd = [ 'zfs', 'clone' ]
-    for k, v in props.items():
-        cmd.append('-o')
-        cmd.append(f'{k}={v}')
-    cmd += [ name, target_name ]
-    zfs_run(cmd)
+    try:
+        zfs_backend().clone(name, target_name, props)
+    finally:
+        zfs_release_name(target_name)
+    zfs_invalidate([ target_name ])
 
 
 def zfs_mountpoint(name):
-    lst = zfs_parse_output(['zfs', 'list', '-o', 'mountpoint', '-H', name])
+    inv = zfs_inventory()
+    if inv is not None and name in inv:
+        return inv.get_property(name, 'mountpoint')
+    lst = zfs_backend().list([ name ], [ 'mountpoint' ])
     return lst[0][0]
 
 
@@ -165,15 +283,40 @@ def zfs_exists_props(props: Dict[str, str], focker_type: str, zfs_type: str) ->
     return ( len(lst) > 0 )
 
 
+_RESERVED_NAMES = set()
+_RESERVED_NAMES_LOCK = threading.Lock()
+
+
 def zfs_find_prefix(head, tail):
     assert len(tail) > 7
-    for pre in range(7, len(tail) + 1):
-        name = head + tail[:pre]
-        if not zfs_exists(name):
-            break
+    inv = zfs_inventory()
+    if inv is not None and inv.covers(head + tail):
+        taken = inv
+    else:
+        taken = set(name for name, *_ in \
+            zfs_backend().list([ head.rstrip('/') ], [ 'name' ], recursive=True))
+    # names handed out but not created yet are reserved so that
+    # parallel clones do not pick the same one
+    with _RESERVED_NAMES_LOCK:
+        for pre in range(7, len(tail) + 1):
+            name = head + tail[:pre]
+            if name in taken or name in _RESERVED_NAMES:
+                continue
+            # another process is creating it right now
+            if not focker_try_lock_resource('dataset', name):
+                continue
+            # the in-memory view misses datasets created by other processes
+            if not zfs_backend().exists(name):
+                break
+        _RESERVED_NAMES.add(name)
     return name
 
 
+def zfs_release_name(name):
+    with _RESERVED_NAMES_LOCK:
+        _RESERVED_NAMES.discard(name)
+
+
 def zfs_shortest_unique_name(name: str, focker_type: str) -> str:
     from .config import FOCKER_CONFIG
     head = f'{FOCKER_CONFIG.zfs.root_dataset}/{focker_type}s/'
@@ -189,21 +332,32 @@ def random_sha256_hexdigest():
 
 
 def zfs_set_props(name, props):
-    for (k, v) in props.items():
-        zfs_run(['zfs', 'set', k + '=' + v, name])
+    with zfs_transaction() as tx:
+        tx.set_props(name, props)
 
 
 def zfs_snapshot(name):
-    zfs_run(['zfs', 'snapshot', name])
+    with zfs_transaction() as tx:
+        tx.snapshot(name)
 
 
 def zfs_properties_cache(focker_type: str = None):
     from .config import FOCKER_CONFIG
-    cmd = [ 'zfs', 'get', '-r', '-H', 'all' ]
-    if focker_type is not None:
-        cmd.append(f'{FOCKER_CONFIG.zfs.root_dataset}/{focker_type}s')
-    lst = zfs_parse_output(cmd)
+    names = [ f'{FOCKER_CONFIG.zfs.root_dataset}/{focker_type}s' ] \
+        if focker_type is not None else [ FOCKER_CONFIG.zfs.root_dataset ]
     res = defaultdict(lambda: {})
-    for (name, propname, propvalue, *_) in lst:
-        res[name][propname] = propvalue
+    res.update(zfs_backend().get(names, [ 'all' ], recursive=True, zfs_type='all'))
     return res
+
+
+def zfs_properties_columns(focker_type: str = None, properties: List[str] = None):
+    # only the given properties, in parsable form, or
+    # everything as zfs_properties_cache() if None
+    from .config import FOCKER_CONFIG
+    names = [ f'{FOCKER_CONFIG.zfs.root_dataset}/{focker_type}s' ] \
+        if focker_type is not None else [ FOCKER_CONFIG.zfs.root_dataset ]
+    if properties is None:
+        return zfs_backend().get_columns(names, [ 'all' ], recursive=True,
+            zfs_type='all')
+    return zfs_backend().get_columns(names, properties, recursive=True,
+        zfs_type='all', parsable=True)
@@ -0,0 +1,39 @@
+#
+# Copyright (C) Stanislaw Adaszewski, 2020-2021
+# License: GNU General Public License v3.0
+# URL: https://github.com/sadaszewski/focker
+# URL: https://adared.ch/focker
+#
+
+
+from .base import ZfsBackend
+from .cli import SubprocessZfsBackend
+from .program import ChannelProgramZfsBackend
+from .memory import MemoryZfsBackend
+import threading
+
+
+ZFS_BACKENDS = {
+    'subprocess': SubprocessZfsBackend,
+    'program': ChannelProgramZfsBackend,
+    'memory': MemoryZfsBackend
+}
+
+
+_DEFAULT_BACKEND = None
+_DEFAULT_BACKEND_LOCK = threading.Lock()
+
+
+def zfs_backend() -> ZfsBackend:
+    if ZfsBackend.is_available():
+        return ZfsBackend.instance()
+    global _DEFAULT_BACKEND
+    with _DEFAULT_BACKEND_LOCK:
+        if _DEFAULT_BACKEND is None:
+            from ...misc import load_overrides
+            conf = load_overrides('focker.conf', env_prefix='FOCKER_CONF_')
+            name = conf.get('zfs_backend', 'subprocess')
+            if name not in ZFS_BACKENDS:
+                raise ValueError(f'Unknown ZFS backend: {name}')
+            _DEFAULT_BACKEND = ZFS_BACKENDS[name]()
+        return _DEFAULT_BACKEND
@@ -0,0 +1,85 @@
+#
+# Copyright (C) Stanislaw Adaszewski, 2020-2021
+# License: GNU General Public License v3.0
+# URL: https://github.com/sadaszewski/focker
+# URL: https://adared.ch/focker
+#
+
+
+from contextvars import ContextVar
+from contextlib import contextmanager
+from typing import Dict, \
+    List, \
+    Tuple
+
+
+class ZfsBackend:
+    context_var = ContextVar('ZFS_BACKEND', default=None)
+
+    def __init__(self):
+        self.tok = None
+
+    def __enter__(self):
+        self.tok = self.context_var.set(self)
+        return self
+
+    def __exit__(self, *excinfo):
+        self.context_var.reset(self.tok)
+        self.tok = None
+
+    @classmethod
+    def is_available(cls):
+        return ( cls.context_var.get() is not None )
+
+    @classmethod
+    def instance(cls):
+        return cls.context_var.get()
+
+    # names which do not exist are omitted from the result
+    def get(self, names: List[str], props: List[str], recursive: bool = False,
+        zfs_type: str = 'filesystem', parsable: bool = False) -> Dict[str, Dict[str, str]]:
+        raise NotImplementedError
+
+    # the result of get() in columns - the names and, per property, a list
+    # of values in the same order, None where a dataset lacks the property
+    def get_columns(self, names: List[str], props: List[str], recursive: bool = False,
+        zfs_type: str = 'filesystem', parsable: bool = False) -> Tuple[List[str], Dict[str, List[str]]]:
+
+        data = self.get(names, props, recursive=recursive, zfs_type=zfs_type,
+            parsable=parsable)
+        res_names = list(data.keys())
+        if props == [ 'all' ]:
+            props = list(dict.fromkeys(p for v in data.values() for p in v.keys()))
+        return res_names, { p: [ data[n].get(p) for n in res_names ] for p in props }
+
+    # raises CalledProcessError if any of the names does not exist
+    def list(self, names: List[str], fields: List[str], recursive: bool = False,
+        zfs_type: str = 'filesystem') -> List[List[str]]:
+        raise NotImplementedError
+
+    def exists(self, name: str) -> bool:
+        raise NotImplementedError
+
+    def create(self, name: str, props: Dict[str, str] = {}):
+        raise NotImplementedError
+
+    def clone(self, snapshot: str, name: str, props: Dict[str, str] = {}):
+        raise NotImplementedError
+
+    def snapshot(self, *names: str):
+        raise NotImplementedError
+
+    def set(self, name: str, props: Dict[str, str]):
+        raise NotImplementedError
+
+    def inherit(self, name: str, prop: str, recursive: bool = False):
+        raise NotImplementedError
+
+    def destroy(self, name: str, recursive: bool = True):
+        raise NotImplementedError
+
+    @contextmanager
+    def batch(self):
+        # backends which can group operations override this,
+        # the others simply run everything as it comes
+        yield self
@@ -0,0 +1,121 @@
+#
+# Copyright (C) Stanislaw Adaszewski, 2020-2021
+# License: GNU General Public License v3.0
+# URL: https://github.com/sadaszewski/focker
+# URL: https://adared.ch/focker
+#
+
+
+from .base import ZfsBackend
+from ..process import focker_subprocess_check_output, \
+    focker_subprocess_run
+from typing import Dict, \
+    List, \
+    Tuple
+import subprocess
+import io
+import csv
+
+
+def _parse_rows(out):
+    r = csv.reader(io.StringIO(out.decode('utf-8')), delimiter='\t')
+    return [ a for a in r ]
+
+
+def _props_args(props):
+    res = []
+    for k, v in props.items():
+        res.append('-o')
+        res.append(f'{k}={v}')
+    return res
+
+
+class SubprocessZfsBackend(ZfsBackend):
+    def run(self, command):
+        return focker_subprocess_check_output(command, stderr=subprocess.STDOUT)
+
+    def _get_rows(self, names, props, recursive, zfs_type, parsable):
+        cmd = [ 'zfs', 'get', '-H' ]
+        if parsable:
+            cmd.append('-p')
+        cmd.extend([ '-o', 'name,property,value', '-t', zfs_type ])
+        if recursive:
+            cmd.append('-r')
+        cmd.append(','.join(props))
+        cmd.extend(names)
+        # missing datasets are reported on stderr and simply omitted
+        res = focker_subprocess_run(cmd, check=False,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        return csv.reader(io.StringIO(res.stdout.decode('utf-8')), delimiter='\t')
+
+    def get(self, names: List[str], props: List[str], recursive: bool = False,
+        zfs_type: str = 'filesystem', parsable: bool = False) -> Dict[str, Dict[str, str]]:
+
+        data = {}
+        for name, propname, propvalue, *_ in self._get_rows(names, props,
+            recursive, zfs_type, parsable):
+
+            if name not in data:
+                data[name] = {}
+            data[name][propname] = propvalue
+        return data
+
+    def get_columns(self, names: List[str], props: List[str], recursive: bool = False,
+        zfs_type: str = 'filesystem', parsable: bool = False) -> Tuple[List[str], Dict[str, List[str]]]:
+
+        # rows of the same dataset come one after another
+        res_names = []
+        columns = {}
+        for name, propname, propvalue, *_ in self._get_rows(names, props,
+            recursive, zfs_type, parsable):
+
+            if not res_names or res_names[-1] != name:
+                res_names.append(name)
+            col = columns.get(propname)
+            if col is None:
+                col = columns[propname] = []
+            col.extend([ None ] * (len(res_names) - 1 - len(col)))
+            col.append(propvalue)
+        for col in columns.values():
+            col.extend([ None ] * (len(res_names) - len(col)))
+        return res_names, columns
+
+    def list(self, names: List[str], fields: List[str], recursive: bool = False,
+        zfs_type: str = 'filesystem') -> List[List[str]]:
+
+        cmd = [ 'zfs', 'list', '-o', ','.join(fields), '-H', '-t', zfs_type ]
+        if recursive:
+            cmd.append('-r')
+        cmd.extend(names)
+        return _parse_rows(self.run(cmd))
+
+    def exists(self, name: str) -> bool:
+        try:
+            self.run([ 'zfs', 'list', name ])
+        except subprocess.CalledProcessError:
+            return False
+        return True
+
+    def create(self, name: str, props: Dict[str, str] = {}):
+        focker_subprocess_run([ 'zfs', 'create', *_props_args(props), name ])
+
+    def clone(self, snapshot: str, name: str, props: Dict[str, str] = {}):
+        self.run([ 'zfs', 'clone', *_props_args(props), snapshot, name ])
+
+    def snapshot(self, *names: str):
+        self.run([ 'zfs', 'snapshot', *names ])
+
+    def set(self, name: str, props: Dict[str, str]):
+        self.run([ 'zfs', 'set', *[ f'{k}={v}' for k, v in props.items() ], name ])
+
+    def inherit(self, name: str, prop: str, recursive: bool = False):
+        cmd = [ 'zfs', 'inherit' ]
+        if recursive:
+            cmd.append('-r')
+        self.run([ *cmd, prop, name ])
+
+    def destroy(self, name: str, recursive: bool = True):
+        cmd = [ 'zfs', 'destroy' ]
+        if recursive:
+            cmd.append('-r')
+        self.run([ *cmd, '-f', name ])
@@ -0,0 +1,165 @@
+#
+# Copyright (C) Stanislaw Adaszewski, 2020-2021
+# License: GNU General Public License v3.0
+# URL: https://github.com/sadaszewski/focker
+# URL: https://adared.ch/focker
+#
+
+
+from .base import ZfsBackend
+from subprocess import CalledProcessError
+from typing import Dict, \
+    List
+import threading
+import os
+
+
+class MemoryZfsBackend(ZfsBackend):
+    NATIVE_PROPERTIES = [ 'name', 'type', 'mountpoint', 'origin', 'rdonly',
+        'used', 'referenced', 'canmount' ]
+
+    def __init__(self, pool: str = 'zroot', mountpoint: str = '/', makedirs: bool = False):
+        super().__init__()
+        self.datasets = { pool: { 'mountpoint': mountpoint } }
+        self.snapshots = {}
+        self.makedirs = makedirs
+        self.log = []
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def _fail(command, message):
+        raise CalledProcessError(1, [ 'zfs', *command ], output=message.encode('utf-8'))
+
+    def _get_property(self, name, prop):
+        if prop == 'name':
+            return name
+        if prop == 'type':
+            return 'snapshot' if name in self.snapshots else 'filesystem'
+        props = self.snapshots[name] if name in self.snapshots else self.datasets[name]
+        if prop in props:
+            return props[prop]
+        parent, _, leaf = name.rpartition('/')
+        if name in self.snapshots or not parent:
+            return '-'
+        # user properties and the mountpoint are inherited
+        if prop == 'mountpoint':
+            return os.path.join(self._get_property(parent, prop), leaf)
+        if ':' in prop:
+            return self._get_property(parent, prop)
+        if prop == 'rdonly':
+            return 'off'
+        if prop in [ 'used', 'referenced' ]:
+            return '0'
+        return '-'
+
+    def _expand(self, command, names, recursive, zfs_type, missing_ok=False):
+        res = []
+        for name in names:
+            if name == '/':
+                name = next(iter(self.datasets.keys()))
+            if name not in self.datasets and name not in self.snapshots:
+                if missing_ok:
+                    continue
+                self._fail(command, f'cannot open \'{name}\': dataset does not exist')
+            res.append(name)
+            if recursive:
+                res.extend(k for k in sorted(self.datasets.keys()) \
+                    if k.startswith(name + '/'))
+                res.extend(k for k in sorted(self.snapshots.keys()) \
+                    if k.split('@')[0] == name or k.startswith(name + '/'))
+        if zfs_type == 'filesystem':
+            res = [ k for k in res if k in self.datasets ]
+        elif zfs_type == 'snapshot':
+            res = [ k for k in res if k in self.snapshots ]
+        return res
+
+    def _mkdir(self, name):
+        if self.makedirs:
+            os.makedirs(self._get_property(name, 'mountpoint'), exist_ok=True)
+
+    def get(self, names: List[str], props: List[str], recursive: bool = False,
+        zfs_type: str = 'filesystem', parsable: bool = False) -> Dict[str, Dict[str, str]]:
+
+        with self.lock:
+            self.log.append([ 'get', ','.join(props), *names ])
+            data = {}
+            for name in self._expand([ 'get' ], names, recursive, zfs_type, missing_ok=True):
+                pl = props
+                if pl == [ 'all' ]:
+                    own = self.snapshots[name] if name in self.snapshots \
+                        else self.datasets[name]
+                    pl = self.NATIVE_PROPERTIES + sorted(k for k in own.keys() if ':' in k)
+                data[name] = { p: self._get_property(name, p) for p in pl }
+            return data
+
+    def list(self, names: List[str], fields: List[str], recursive: bool = False,
+        zfs_type: str = 'filesystem') -> List[List[str]]:
+
+        with self.lock:
+            self.log.append([ 'list', ','.join(fields), *names ])
+            return [ [ self._get_property(name, f) for f in fields ] \
+                for name in self._expand([ 'list', *names ], names, recursive, zfs_type) ]
+
+    def exists(self, name: str) -> bool:
+        with self.lock:
+            self.log.append([ 'list', name ])
+            return ( name in self.datasets or name in self.snapshots )
+
+    def create(self, name: str, props: Dict[str, str] = {}):
+        with self.lock:
+            self.log.append([ 'create', name ])
+            if name in self.datasets:
+                self._fail([ 'create', name ], 'dataset already exists')
+            if name.rpartition('/')[0] not in self.datasets:
+                self._fail([ 'create', name ], 'parent does not exist')
+            self.datasets[name] = dict(props)
+            self._mkdir(name)
+
+    def clone(self, snapshot: str, name: str, props: Dict[str, str] = {}):
+        with self.lock:
+            self.log.append([ 'clone', snapshot, name ])
+            if snapshot not in self.snapshots:
+                self._fail([ 'clone', snapshot, name ], 'no such snapshot')
+            if name in self.datasets:
+                self._fail([ 'clone', snapshot, name ], 'dataset already exists')
+            self.datasets[name] = { 'origin': snapshot, **props }
+            self._mkdir(name)
+
+    def snapshot(self, *names: str):
+        with self.lock:
+            self.log.append([ 'snapshot', *names ])
+            for name in names:
+                if name.split('@')[0] not in self.datasets:
+                    self._fail([ 'snapshot', *names ], 'no such dataset')
+                if name in self.snapshots:
+                    self._fail([ 'snapshot', *names ], 'dataset already exists')
+            for name in names:
+                self.snapshots[name] = {}
+
+    def set(self, name: str, props: Dict[str, str]):
+        with self.lock:
+            self.log.append([ 'set', *[ f'{k}={v}' for k, v in props.items() ], name ])
+            if name not in self.datasets:
+                self._fail([ 'set', name ], 'no such dataset')
+            self.datasets[name].update(props)
+
+    def inherit(self, name: str, prop: str, recursive: bool = False):
+        with self.lock:
+            self.log.append([ 'inherit', prop, name ])
+            for k in self._expand([ 'inherit', prop, name ], [ name ], recursive, 'filesystem'):
+                self.datasets[k].pop(prop, None)
+
+    def destroy(self, name: str, recursive: bool = True):
+        with self.lock:
+            self.log.append([ 'destroy', name ])
+            victims = self._expand([ 'destroy', name ], [ name ], recursive, 'all')
+            if not recursive and name not in self.snapshots and \
+                ( any(k.startswith(name + '/') for k in self.datasets.keys()) or \
+                any(k.split('@')[0] == name for k in self.snapshots.keys()) ):
+                self._fail([ 'destroy', name ], 'filesystem has children')
+            for k, v in self.datasets.items():
+                if k not in victims and v.get('origin', '-') in victims:
+                    self._fail([ 'destroy', name ], f'cannot destroy {name}: filesystem has dependent clones')
+            for k in victims:
+                self.datasets.pop(k, None)
+                self.snapshots.pop(k, None)
@@ -0,0 +1,235 @@
+#
+# Copyright (C) Stanislaw Adaszewski, 2020-2021
+# License: GNU General Public License v3.0
+# URL: https://github.com/sadaszewski/focker
+# URL: https://adared.ch/focker
+#
+
+
+from .cli import SubprocessZfsBackend
+from contextvars import ContextVar
+from contextlib import contextmanager
+from typing import Dict, \
+    List
+from tempfile import NamedTemporaryFile
+import subprocess
+
+
+_LUA_SAFE = set(b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 /@:._-+=,')
+
+
+def lua_str(s: str) -> str:
+    return '"' + ''.join(chr(c) if c in _LUA_SAFE else f'\\{c:03d}' \
+        for c in s.encode('utf-8')) + '"'
+
+
+_PROLOGUE = '''
+local function check(err, what)
+    if err ~= 0 then
+        error(what .. ': error ' .. err)
+    end
+end
+
+local function check_exists(ds)
+    if not zfs.exists(ds) then
+        error(ds .. ': dataset does not exist')
+    end
+end
+
+-- a dataset with children or snapshots only becomes destroyable
+-- once they are gone, so zfs.check.destroy is asked about those
+-- and about the leaves, busy or held ones fail here
+local function check_destroy_recursive(ds)
+    local n = 0
+    for child in zfs.list.children(ds) do
+        check_destroy_recursive(child)
+        n = n + 1
+    end
+    for snap in zfs.list.snapshots(ds) do
+        check(zfs.check.destroy(snap), 'destroy ' .. snap)
+        n = n + 1
+    end
+    if n == 0 then
+        check(zfs.check.destroy(ds), 'destroy ' .. ds)
+    else
+        check_exists(ds)
+    end
+end
+
+local function destroy_recursive(ds)
+    local children = {}
+    for child in zfs.list.children(ds) do
+        children[#children + 1] = child
+    end
+    for _, child in ipairs(children) do
+        destroy_recursive(child)
+    end
+    local snaps = {}
+    for snap in zfs.list.snapshots(ds) do
+        snaps[#snaps + 1] = snap
+    end
+    for _, snap in ipairs(snaps) do
+        check(zfs.sync.destroy(snap), 'destroy ' .. snap)
+    end
+    check(zfs.sync.destroy(ds), 'destroy ' .. ds)
+end
+'''
+
+
+class ChannelProgramZfsBackend(SubprocessZfsBackend):
+    pending = ContextVar('ZFS_PROGRAM_PENDING', default=None)
+
+    def __init__(self, instruction_limit: int = None, memory_limit: int = None):
+        super().__init__()
+        self.instruction_limit = instruction_limit
+        self.memory_limit = memory_limit
+
+    @contextmanager
+    def batch(self):
+        if self.pending.get() is not None:
+            yield self
+            return
+        tok = self.pending.set([])
+        try:
+            yield self
+            self.flush()
+        finally:
+            self.pending.reset(tok)
+
+    @staticmethod
+    def script(ops: List[tuple]) -> str:
+        # zfs.check.* runs first so that a batch which cannot
+        # succeed fails before anything is changed
+        checks = []
+        syncs = []
+        for op, name, *args in ops:
+            if op == 'snapshot':
+                checks.append(f'check(zfs.check.snapshot({lua_str(name)}), {lua_str("snapshot " + name)})')
+                syncs.append(f'check(zfs.sync.snapshot({lua_str(name)}), {lua_str("snapshot " + name)})')
+            elif op == 'set':
+                k, v = args
+                checks.append(f'check(zfs.check.set_prop({lua_str(name)}, {lua_str(k)}, {lua_str(v)}), ' \
+                    f'{lua_str("set " + k + " " + name)})')
+                syncs.append(f'check(zfs.sync.set_prop({lua_str(name)}, {lua_str(k)}, {lua_str(v)}), ' \
+                    f'{lua_str("set " + k + " " + name)})')
+            elif op == 'destroy':
+                checks.append(f'check_destroy_recursive({lua_str(name)})')
+                syncs.append(f'destroy_recursive({lua_str(name)})')
+            else:
+                raise ValueError(f'Unsupported channel program operation: {op}')
+        return '\n'.join([ _PROLOGUE, *checks, *syncs, '' ])
+
+    def run_program(self, pool: str, script: str):
+        cmd = [ 'zfs', 'program' ]
+        if self.instruction_limit is not None:
+            cmd.extend([ '-t', str(self.instruction_limit) ])
+        if self.memory_limit is not None:
+            cmd.extend([ '-m', str(self.memory_limit) ])
+        with NamedTemporaryFile('w', suffix='.lua') as f:
+            f.write(script)
+            f.flush()
+            return self.run([ *cmd, pool, f.name ])
+
+    def flush(self):
+        ops = self.pending.get()
+        if not ops:
+            return
+        by_pool = {}
+        for op in ops:
+            by_pool.setdefault(op[1].split('/')[0].split('@')[0], []).append(op)
+        ops.clear()
+        for pool, pool_ops in by_pool.items():
+            # zfs.sync.destroy does not unmount, unlike zfs destroy -f
+            unmounted = self.unmount([ op[1] for op in pool_ops if op[0] == 'destroy' ])
+            try:
+                self.run_program(pool, self.script(pool_ops))
+            except:
+                self.remount(unmounted)
+                raise
+
+    def unmount(self, names: List[str]) -> List[str]:
+        if not names:
+            return []
+        mounted = [ name for name, _, value, *_ in self._get_rows(names, [ 'mounted' ],
+            recursive=True, zfs_type='filesystem', parsable=False) if value == 'yes' ]
+        # children before their parents
+        mounted.sort(key=lambda name: name.count('/'), reverse=True)
+        res = []
+        try:
+            for name in mounted:
+                self.run([ 'zfs', 'unmount', '-f', name ])
+                res.append(name)
+        except:
+            self.remount(res)
+            raise
+        return res
+
+    def remount(self, names: List[str]):
+        for name in reversed(names):
+            try:
+                self.run([ 'zfs', 'mount', name ])
+            except subprocess.CalledProcessError:
+                pass
+
+    def _enqueue(self, *op):
+        ops = self.pending.get()
+        if ops is None:
+            return False
+        ops.append(op)
+        return True
+
+    # anything that reads or cannot be expressed
+    # as a channel program sees the batch applied first
+
+    def get(self, *args, **kwargs):
+        self.flush()
+        return super().get(*args, **kwargs)
+
+    def get_columns(self, *args, **kwargs):
+        self.flush()
+        return super().get_columns(*args, **kwargs)
+
+    def list(self, *args, **kwargs):
+        self.flush()
+        return super().list(*args, **kwargs)
+
+    def exists(self, name: str) -> bool:
+        self.flush()
+        return super().exists(name)
+
+    def create(self, name: str, props: Dict[str, str] = {}):
+        self.flush()
+        super().create(name, props)
+
+    def clone(self, snapshot: str, name: str, props: Dict[str, str] = {}):
+        self.flush()
+        super().clone(snapshot, name, props)
+
+    def inherit(self, name: str, prop: str, recursive: bool = False):
+        self.flush()
+        super().inherit(name, prop, recursive=recursive)
+
+    def snapshot(self, *names: str):
+        if self.pending.get() is None:
+            super().snapshot(*names)
+            return
+        for name in names:
+            self._enqueue('snapshot', name)
+
+    def set(self, name: str, props: Dict[str, str]):
+        # Channel programs can only set user properties. Native ones
+        # are set right away by the zfs command, after flushing what
+        # is pending, so a batch mixing both is not all-or-nothing:
+        # when the program fails, the native properties stay set.
+        native = { k: v for k, v in props.items() if ':' not in k }
+        if native:
+            self.flush()
+            super().set(name, native)
+        for k, v in props.items():
+            if ':' in k and not self._enqueue('set', name, k, v):
+                super().set(name, { k: v })
+
+    def destroy(self, name: str, recursive: bool = True):
+        if not recursive or not self._enqueue('destroy', name):
+            self.flush()
+            super().destroy(name, recursive=recursive)
@@ -0,0 +1,122 @@
+#
+# Copyright (C) Stanislaw Adaszewski, 2020-2021
+# License: GNU General Public License v3.0
+# URL: https://github.com/sadaszewski/focker
+# URL: https://adared.ch/focker
+#
+
+
+from .misc import focker_lock, \
+    focker_lock_stamp
+from .core import ZfsInventory
+from contextlib import redirect_stdout, \
+    redirect_stderr
+import socketserver
+import socket
+import traceback
+import json
+import time
+import io
+import os
+
+
+FOCKER_DAEMON_SOCKET = '/var/run/focker.sock'
+
+
+def daemon_socket_path():
+    return os.environ.get('FOCKER_DAEMON_SOCKET', FOCKER_DAEMON_SOCKET)
+
+
+class FockerDaemonHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return # e.g. checking whether the daemon is running
+        req = json.loads(line.decode('utf-8'))
+        res = self.server.execute(req['argv'], req.get('cwd', '/'))
+        self.wfile.write(json.dumps(res).encode('utf-8') + b'\n')
+
+
+class FockerDaemon(socketserver.UnixStreamServer):
+    # Requests are served one at a time, in the thread calling
+    # serve_forever(), so that the inventory, the parser and the
+    # caches stay hot between them. Only commands declared with
+    # daemon=True are served, for anything else the client is
+    # told to fall back to running the command itself.
+
+    def __init__(self, socket_path=None, parser=None, max_age=60):
+        self.socket_path = socket_path or daemon_socket_path()
+        self.parser = parser
+        self.max_age = max_age
+        self.inventory = None
+        self.stamp = None
+        self.loaded_at = None
+        if os.path.exists(self.socket_path):
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+                try:
+                    s.connect(self.socket_path)
+                except OSError:
+                    os.unlink(self.socket_path) # stale
+                else:
+                    raise RuntimeError(f'A focker daemon is already listening on {self.socket_path}')
+        # the socket must never be reachable by other users,
+        # not even between bind() and chmod()
+        umask = os.umask(0o077)
+        try:
+            super().__init__(self.socket_path, FockerDaemonHandler)
+        finally:
+            os.umask(umask)
+        os.chmod(self.socket_path, 0o600)
+
+    def serve_forever(self, *args, **kwargs):
+        if self.parser is None:
+            from .command import create_parser
+            self.parser = create_parser()
+        with ZfsInventory() as inv:
+            self.inventory = inv
+            super().serve_forever(*args, **kwargs)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.socket_path)
+        except FileNotFoundError:
+            pass
+
+    def refresh(self):
+        # changes made by focker touch the lock file,
+        # anything else is picked up after max_age seconds
+        stamp = focker_lock_stamp()
+        now = time.monotonic()
+        if stamp != self.stamp or self.loaded_at is None or \
+            now - self.loaded_at > self.max_age:
+
+            self.inventory.invalidate_all()
+            self.stamp = stamp
+            self.loaded_at = now
+
+    def execute(self, argv, cwd):
+        from .__main__ import execute
+        out = io.StringIO()
+        err = io.StringIO()
+        with redirect_stdout(out), redirect_stderr(err):
+            try:
+                args = self.parser.parse_args(argv)
+                if not getattr(args, 'daemon', False):
+                    return dict(status='fallback')
+                os.chdir(cwd)
+                with focker_lock(shared=True):
+                    self.refresh()
+                    execute(args)
+                code = 0
+            except SystemExit as e:
+                if isinstance(e.code, str):
+                    print(e.code, file=err)
+                    code = 1
+                else:
+                    code = e.code or 0
+            except Exception:
+                traceback.print_exc()
+                code = 1
+        return dict(status='done', exit=code, stdout=out.getvalue(),
+            stderr=err.getvalue())
@@ -6,11 +6,16 @@
 #
 
 
-from .grammar import top
+from .parser import parse
 from .classes import JailConf, \
     JailBlock
 
 
+# 'streaming' - hand-written single-pass parser (parser.py),
+# 'pyparsing' - the original grammar (grammar.py)
+DEFAULT_PARSER = 'streaming'
+
+
 class WrapFileOrFilename:
     def __init__(self, file_or_filename, mode='r'):
         self.file_or_filename = file_or_filename
@@ -30,15 +35,22 @@ class WrapFileOrFilename:
         self.f = None
 
 
-def loads(s):
-    res = top.parseString(s, parseAll=True)
-    return res[0]
+def loads(s, parser=None):
+    parser = parser or DEFAULT_PARSER
+    if parser == 'streaming':
+        return parse(s)
+    elif parser == 'pyparsing':
+        from .grammar import top
+        res = top.parseString(s, parseAll=True)
+        return res[0]
+    else:
+        raise ValueError(f'Unknown jail.conf parser: {parser}')
 
 
-def load(file_or_filename='/etc/jail.conf'):
+def load(file_or_filename='/etc/jail.conf', parser=None):
     with WrapFileOrFilename(file_or_filename) as f:
-        res = top.parseFile(f, parseAll=True)
-    return res[0]
+        s = f.read()
+    return loads(s, parser=parser)
 
 
 def dumps(conf):
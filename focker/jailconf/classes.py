@@ -166,7 +166,26 @@ class JailName(Value):
 
 class Statements:
     def __init__(self, toks=[]):
-        self.toks = flatten(toks)
+        self._toks = flatten(toks)
+        self._removed = set()
+        self._by_key = None
+        self._by_name = None
+
+    # removed statements are only marked and dropped from the list
+    # on next access, so that repeated replacement of keys is O(1)
+    @property
+    def toks(self):
+        if self._removed:
+            self._toks = [ t for t in self._toks if id(t) not in self._removed ]
+            self._removed.clear()
+        return self._toks
+
+    @toks.setter
+    def toks(self, toks):
+        self._toks = toks
+        self._removed.clear()
+        self._by_key = None
+        self._by_name = None
 
     def __repr__(self):
         return f'Statements({self.toks})'
@@ -179,8 +198,44 @@ class Statements:
             raise IndexError
         return self.toks[index]
 
+    def _index(self, stmt):
+        if stmt.__class__ in [ KeyValuePair, KeyValueAppendPair, KeyValueToggle ]:
+            self._by_key.setdefault(stmt.key, []).append(stmt)
+        elif isinstance(stmt, JailBlock):
+            self._by_name.setdefault(stmt.name, stmt)
+
+    def _ensure_index(self):
+        if self._by_key is None:
+            self._by_key = {}
+            self._by_name = {}
+            for stmt in self.toks:
+                self._index(stmt)
+
+    def by_key(self, key):
+        self._ensure_index()
+        return self._by_key.get(key, [])
+
+    def by_name(self, name):
+        self._ensure_index()
+        return self._by_name.get(name)
+
     def append(self, stmt):
-        self.toks.append(stmt)
+        if id(stmt) in self._removed:
+            _ = self.toks # re-appending a removed statement
+        self._toks.append(stmt)
+        if self._by_key is not None:
+            self._index(stmt)
+
+    def remove_key(self, key):
+        self._ensure_index()
+        self._removed.update(map(id, self._by_key.pop(key, [])))
+
+    def remove_jail_block(self, name):
+        self._ensure_index()
+        if self._by_name.pop(name, None) is None:
+            return
+        self._removed.update(id(t) for t in self._toks \
+            if isinstance(t, JailBlock) and t.name == name)
 
     def __str__(self):
         return ''.join(str(t) for t in self.toks)
@@ -235,7 +290,7 @@ class Block:
 
     def get(self, name):
         res = []
-        for s in self.statements:
+        for s in self.statements.by_key(name):
             if isinstance(s, KeyValuePair) and s.key == name:
                 res = s.value if isinstance(s.value, list) else [ s.value ]
             elif isinstance(s, KeyValueAppendPair) and s.key == name:
@@ -275,9 +330,7 @@ class Block:
     def remove_key(self, name):
         if not self.has_key(name):
             raise KeyError
-        self.set_statements([ s for s in self.statements \
-            if s.__class__ not in [ KeyValuePair, KeyValueAppendPair, KeyValueToggle ] \
-            or s.key != name ])
+        self.statements.remove_key(name)
 
     def update(self, blk):
         for k, v in blk.items():
@@ -289,8 +342,8 @@ class Block:
         return self.get(name)
 
     def __setitem__(self, name, value):
-        if self.has_key(name):
-            self.remove_key(name)
+        if self.statements.by_key(name):
+            self.statements.remove_key(name)
         self.append_set(name, value)
 
     def __delitem__(self, name):
@@ -326,23 +379,18 @@ class JailConf(Block):
         super().__init__([ Statements(flatten(toks)) ], indent=0)
 
     def get_jail_block(self, x):
-        for s in self.statements:
-            if isinstance(s, JailBlock):
-                if s.name == x:
-                    return s
-        raise KeyError
+        res = self.statements.by_name(x)
+        if res is None:
+            raise KeyError
+        return res
 
     def has_jail_block(self, x):
-        try:
-            _ = self.get_jail_block(x)
-            return True
-        except KeyError:
-            return False
+        return ( self.statements.by_name(x) is not None )
 
     def remove_jail_block(self, x):
         if not self.has_jail_block(x):
             raise KeyError
-        self.set_statements([ t for t in self.statements if not isinstance(t, JailBlock) or t.name != x ])
+        self.statements.remove_jail_block(x)
 
     def append_jail_block(self, x):
         self.statements.append(x)
@@ -7,18 +7,35 @@
 
 
 import re
-from functools import reduce
 
 
-def flatten(x):
+def _flatten_into(x, res):
+    if x.__class__ is str:
+        res.append(x)
+        return
+    if x.__class__ is list:
+        for y in x:
+            if y.__class__ is str:
+                res.append(y)
+            else:
+                _flatten_into(y, res)
+        return
     try:
         it = iter(x)
     except TypeError:
-        return [ x ]
+        res.append(x)
+        return
     if isinstance(it, iter([]).__class__):
-        return reduce(list.__add__, [ flatten(y) for y in x ], [])
+        for y in it:
+            _flatten_into(y, res)
     else:
-        return [ x ]
+        res.append(x)
+
+
+def flatten(x):
+    res = []
+    _flatten_into(x, res)
+    return res
 
 
 def quote_value(s):
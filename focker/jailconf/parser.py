@@ -0,0 +1,129 @@
+#
+# Copyright (C) Stanislaw Adaszewski, 2020-2021
+# License: GNU General Public License v3.0
+# URL: https://github.com/sadaszewski/focker
+# URL: https://adared.ch/focker
+#
+
+
+from .classes import *
+import re
+
+
+#
+# Tokens - the same as in grammar.py
+#
+
+LINE_CONTINUATION = re.compile(r'(^|[^\\])\\[ \t\r]*\n')
+UNQUOTED_STRING = re.compile(r'(\\[ \t\r]*\n|[^\"\'{}=,+; \t\r\n\\])+')
+DOUBLE_QUOTED_STRING = re.compile(r'"(\\"|[^"])*"')
+SINGLE_QUOTED_STRING = re.compile(r"'(\\'|[^'])*'")
+COMMENT_OR_SPACE = re.compile(r'(/\*((?!\*/).|\n)*\*/|//.*|\#.*|[ \t\n\r]*)*')
+
+
+class Parser:
+    def __init__(self, s):
+        self.s = s
+        self.pos = 0
+
+    def error(self, pos):
+        line = self.s.count('\n', 0, pos) + 1
+        col = pos - (self.s.rfind('\n', 0, pos) + 1) + 1
+        return ValueError(f'Syntax error in jail.conf at line {line}, column {col}')
+
+    def sp(self):
+        m = COMMENT_OR_SPACE.match(self.s, self.pos)
+        self.pos = m.end()
+        return m.group(0)
+
+    def string(self):
+        m = UNQUOTED_STRING.match(self.s, self.pos)
+        if m is not None:
+            res = m.group(0)
+        else:
+            m = DOUBLE_QUOTED_STRING.match(self.s, self.pos) or \
+                SINGLE_QUOTED_STRING.match(self.s, self.pos)
+            if m is None:
+                return None
+            res = m.group(0)[1:-1]
+        self.pos = m.end()
+        if '\\' not in res and res.isascii():
+            return res
+        res = LINE_CONTINUATION.sub('\\1', res)
+        return res.encode('utf-8').decode('unicode_escape')
+
+    def literal(self, lit):
+        if self.s.startswith(lit, self.pos):
+            self.pos += len(lit)
+            return lit
+        return None
+
+    def value(self):
+        first = self.string()
+        if first is None:
+            return None
+        toks = [ Value(first) ]
+        while True:
+            start = self.pos
+            sp_1 = self.sp()
+            if self.literal(',') is None:
+                self.pos = start
+                break
+            sp_2 = self.sp()
+            v = self.string()
+            if v is None:
+                self.pos = start
+                break
+            toks.extend([ sp_1, ',', sp_2, Value(v) ])
+        if len(toks) == 1:
+            return toks[0]
+        return ListOfValues(toks)
+
+    def statement(self, allow_jail_block):
+        start = self.pos
+        sp_1 = self.sp()
+        key = self.string()
+        if key is None:
+            self.pos = start
+            return None
+        sp_2 = self.sp()
+        if self.literal(';') is not None:
+            return KeyValueToggle([ sp_1, Key(key), sp_2, ';' ])
+        if allow_jail_block and self.literal('{') is not None:
+            statements = self.statements(allow_jail_block=False)
+            sp_3 = self.sp()
+            if self.literal('}') is None:
+                raise self.error(self.pos)
+            return JailBlock([ sp_1, JailName(key), sp_2, '{', statements, sp_3, '}' ])
+        op = self.literal('=') or self.literal('+=')
+        if op is None:
+            raise self.error(self.pos)
+        sp_3 = self.sp()
+        value = self.value()
+        if value is None:
+            raise self.error(self.pos)
+        sp_4 = self.sp()
+        if self.literal(';') is None:
+            raise self.error(self.pos)
+        cls = KeyValuePair if op == '=' else KeyValueAppendPair
+        return cls([ sp_1, Key(key), sp_2, op, sp_3, value, sp_4, ';' ])
+
+    def statements(self, allow_jail_block):
+        res = []
+        while True:
+            stmt = self.statement(allow_jail_block)
+            if stmt is None:
+                break
+            res.append(stmt)
+        return Statements(res)
+
+    def parse(self):
+        statements = self.statements(allow_jail_block=True)
+        trailing = self.sp()
+        if self.pos != len(self.s):
+            raise self.error(self.pos)
+        return JailConf(list(statements) + [ trailing ])
+
+
+def parse(s):
+    return Parser(s).parse()
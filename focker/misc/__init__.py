@@ -7,9 +7,16 @@
 
 
 from .merge_dicts import merge_dicts
+from .nicenum import nicenum
 from .backup_file import backup_file
-from .filehash import filehash
+from .filehash import filehash, \
+    dirhash
+from .fastcopy import copyfile_fast, \
+    copytree_fast
 from .load_jailconf import *
 from .overrides import *
 from .lock import focker_lock, \
-    focker_unlock
+    focker_unlock, \
+    focker_lock_resources, \
+    focker_try_lock_resource, \
+    focker_lock_stamp
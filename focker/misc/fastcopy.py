@@ -0,0 +1,93 @@
+#
+# Copyright (C) Stanislaw Adaszewski, 2020-2021
+# License: GNU General Public License v3.0
+# URL: https://github.com/sadaszewski/focker
+# URL: https://adared.ch/focker
+#
+
+
+import os
+import shutil
+import stat
+from concurrent.futures import ThreadPoolExecutor
+
+
+def _copy_file_range(fd_in, fd_out, size):
+    copied = 0
+    while copied < size:
+        n = os.copy_file_range(fd_in, fd_out, size - copied)
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def _sendfile(fd_in, fd_out, size):
+    copied = 0
+    while copied < size:
+        n = os.sendfile(fd_out, fd_in, copied, size - copied)
+        if n == 0:
+            break
+        copied += n
+    return copied
+
+
+def copyfile_fast(src, dst, copy_mode=False):
+    with open(src, 'rb') as f_in, \
+        open(dst, 'wb') as f_out:
+        size = os.fstat(f_in.fileno()).st_size
+        copied = None
+        for fn in [ getattr(os, 'copy_file_range', None) and _copy_file_range,
+            getattr(os, 'sendfile', None) and _sendfile ]:
+            if fn is None:
+                continue
+            try:
+                copied = fn(f_in.fileno(), f_out.fileno(), size)
+                break
+            except OSError:
+                # e.g. EXDEV, ENOSYS or a sendfile() that requires a socket;
+                # nothing has been written yet so just try the next method
+                f_in.seek(0)
+                f_out.seek(0)
+                f_out.truncate()
+        if copied is None or copied < size:
+            os.lseek(f_in.fileno(), copied or 0, os.SEEK_SET)
+            os.lseek(f_out.fileno(), copied or 0, os.SEEK_SET)
+            shutil.copyfileobj(f_in, f_out, 1024*1024*4)
+    if copy_mode:
+        shutil.copymode(src, dst)
+
+
+def copytree_fast(src, dst, max_workers=None):
+    files = []
+    dirs = []
+    os.makedirs(dst, exist_ok=True)
+    dirs.append((src, dst))
+    for root, dnames, fnames in os.walk(src):
+        rel = os.path.relpath(root, src)
+        dst_root = os.path.normpath(os.path.join(dst, rel))
+        for dnam in dnames:
+            s, d = os.path.join(root, dnam), os.path.join(dst_root, dnam)
+            if os.path.islink(s):
+                if os.path.lexists(d):
+                    os.unlink(d)
+                os.symlink(os.readlink(s), d)
+            else:
+                os.makedirs(d, exist_ok=True)
+                dirs.append((s, d))
+        for fnam in fnames:
+            s, d = os.path.join(root, fnam), os.path.join(dst_root, fnam)
+            if os.path.islink(s):
+                if os.path.lexists(d):
+                    os.unlink(d)
+                os.symlink(os.readlink(s), d)
+            elif stat.S_ISREG(os.lstat(s).st_mode):
+                files.append((s, d))
+            else:
+                raise RuntimeError(f'Unsupported file type: {s}')
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        for f in [ ex.submit(copyfile_fast, s, d, copy_mode=True) for s, d in files ]:
+            f.result()
+    # directories last so that read-only ones don't block copying into them
+    for s, d in reversed(dirs):
+        shutil.copymode(s, d)
@@ -7,7 +7,12 @@
 
 
 import hashlib
+import json
+import os
+import stat
+import contextvars
 from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
 
 
 def filehash(fname_or_fp):
@@ -25,3 +30,39 @@ def filehash(fname_or_fp):
             h.update(data)
     res = h.hexdigest()
     return res
+
+
+def _scan_tree(path, files):
+    res = []
+    with os.scandir(path) as it:
+        entries = sorted(it, key=lambda e: e.name)
+    for e in entries:
+        mode = stat.S_IMODE(e.stat(follow_symlinks=False).st_mode)
+        if e.is_symlink():
+            res.append([ 'l', e.name, mode, os.readlink(e.path) ])
+        elif e.is_dir(follow_symlinks=False):
+            res.append([ 'd', e.name, mode, _scan_tree(e.path, files) ])
+        elif e.is_file(follow_symlinks=False):
+            item = [ 'f', e.name, mode, None ]
+            files.append((item, e.path))
+            res.append(item)
+        else:
+            raise RuntimeError(f'Unsupported file type: {e.path}')
+    return res
+
+
+def _merkle_digest(tree):
+    tree = [ [ t, name, mode, _merkle_digest(x) if t == 'd' else x ] \
+        for t, name, mode, x in tree ]
+    return hashlib.sha256(json.dumps(tree).encode('utf-8')).hexdigest()
+
+
+def dirhash(path, hashfn=filehash, max_workers=None):
+    files = []
+    tree = _scan_tree(path, files)
+    with ThreadPoolExecutor(max_workers=max_workers) as ex:
+        futures = [ ex.submit(contextvars.copy_context().run, hashfn, fnam) \
+            for _, fnam in files ]
+        for (item, _), f in zip(files, futures):
+            item[3] = f.result()
+    return _merkle_digest(tree)
@@ -8,6 +8,11 @@
 
 import os
 import json
+import re
+import shlex
+import threading
+import tempfile
+import copy
 
 
 def jailconf_dir():
@@ -41,23 +46,162 @@ def _json_dump(entry, f):
     json.dump(_parse_str_values(entry), f)
 
 
-def load_jailconf():
-    conf = {}
-    dnam = jailconf_dir()
-    for fnam in os.listdir(dnam):
-        if not fnam.endswith('.json'):
-            continue
-        with open(os.path.join(dnam, fnam)) as f:
+# entries which are not jail(8) parameters
+FOCKER_JAILCONF_KEYS = { 'focker.mounts' }
+
+
+def jailconf_jail_params(entry):
+    return { k: v for k, v in entry.items() if k not in FOCKER_JAILCONF_KEYS }
+
+
+_NULLFS_MOUNT = re.compile(r"mount -t nullfs ('[^']*'|\S+) ")
+
+
+def _entry_mounts(entry):
+    if 'focker.mounts' in entry:
+        return [ m['source'] for m in entry['focker.mounts'] ]
+    # jails created before mounts were recorded
+    prestart = entry.get('exec.prestart', '')
+    if isinstance(prestart, list):
+        prestart = ' '.join(map(str, prestart))
+    return [ shlex.split(m)[0] for m in _NULLFS_MOUNT.findall(str(prestart)) ]
+
+
+class JailConfIndex:
+    INDEX_FNAME = '.focker-index'
+
+    def __init__(self, dnam):
+        self.dnam = dnam
+        self.dir_mtime = None
+        self.stats = {}
+        self.index = {}
+        self.entries = {}
+        self.by_path = {}
+        self.lock = threading.RLock()
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.dnam, self.INDEX_FNAME)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        for name, item in data.items():
+            self.stats[name] = tuple(item.pop('stat'))
+            self.index[name] = item
+
+    def _save_index(self):
+        data = { name: { 'stat': list(self.stats[name]), **item } \
+            for name, item in self.index.items() }
+        # commands under the shared lock save it concurrently
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.dnam,
+                prefix=self.INDEX_FNAME + '.', suffix='.tmp')
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp, os.path.join(self.dnam, self.INDEX_FNAME))
+        except OSError:
+            os.unlink(tmp)
+
+    def _fnam(self, name):
+        return os.path.join(self.dnam, f'{name}.json')
+
+    def _load_entry(self, name):
+        with open(self._fnam(name)) as f:
             entry = _json_load(f)
-        name, _ = os.path.splitext(fnam)
-        conf[name] = entry
-    return conf
+        self.entries[name] = entry
+        return entry
+
+    def refresh(self):
+        with self.lock:
+            dir_mtime = os.stat(self.dnam).st_mtime_ns
+            if dir_mtime != self.dir_mtime:
+                names = [ fnam[:-5] for fnam in os.listdir(self.dnam) \
+                    if fnam.endswith('.json') ]
+            else:
+                names = list(self.stats.keys())
+            stats = {}
+            for name in names:
+                try:
+                    st = os.stat(self._fnam(name))
+                except FileNotFoundError:
+                    continue
+                stats[name] = ( st.st_mtime_ns, st.st_size )
+            changed = [ name for name in stats.keys() \
+                if self.stats.get(name) != stats[name] or name not in self.index ]
+            removed = [ name for name in self.index.keys() if name not in stats ]
+            for name in removed:
+                self.index.pop(name)
+                self.entries.pop(name, None)
+            for name in changed:
+                entry = self._load_entry(name)
+                self.index[name] = {
+                    'path': entry.get('path'),
+                    'depend': _ensure_list(entry.get('depend', [])),
+                    'mounts': _entry_mounts(entry)
+                }
+            self.stats = stats
+            if changed or removed or self.dir_mtime is None:
+                self.by_path = { item['path']: name for name, item in self.index.items() \
+                    if item['path'] is not None }
+            if changed or removed:
+                self._save_index()
+                dir_mtime = os.stat(self.dnam).st_mtime_ns
+            self.dir_mtime = dir_mtime
+            return self
+
+    def invalidate(self, name):
+        with self.lock:
+            self.stats.pop(name, None)
+            self.entries.pop(name, None)
+            self.dir_mtime = None
+
+    def names(self):
+        return list(self.index.keys())
+
+    def find_path(self, path):
+        return self.by_path.get(path)
+
+    def load(self, name):
+        with self.lock:
+            if name not in self.entries:
+                self._load_entry(name)
+            # callers are free to modify what they get
+            return copy.deepcopy(self.entries[name])
+
+    def load_all(self):
+        return { name: self.load(name) for name in self.names() }
+
+
+def _ensure_list(x):
+    return x if isinstance(x, list) else [ x ]
+
+
+_INDICES = {}
+_INDICES_LOCK = threading.Lock()
+
+
+def jailconf_index() -> JailConfIndex:
+    dnam = jailconf_dir()
+    with _INDICES_LOCK:
+        if dnam not in _INDICES:
+            _INDICES[dnam] = JailConfIndex(dnam)
+        idx = _INDICES[dnam]
+    return idx.refresh()
+
+
+def load_jailconf():
+    return jailconf_index().load_all()
 
 
 def jailconf_load_jail(*, name):
-    fnam = os.path.join(jailconf_dir(), f'{name}.json')
-    with open(fnam) as f:
-        return _json_load(f)
+    idx = jailconf_index()
+    if name not in idx.index:
+        raise FileNotFoundError(f'Jail configuration not found: {name}')
+    return idx.load(name)
 
 
 def jailconf_jail_exists(*, name):
@@ -65,13 +209,26 @@ def jailconf_jail_exists(*, name):
     return os.path.exists(fnam)
 
 
+def jailconf_find_jail(*, path):
+    return jailconf_index().find_path(path)
+
+
 def jailconf_add_jail(*, name, entry):
     fnam = os.path.join(jailconf_dir(), f'{name}.json')
     with open(fnam + '.tmp', 'w') as f:
         _json_dump(entry, f)
     os.rename(fnam + '.tmp', fnam)
+    _invalidate(name)
 
 
 def jailconf_remove_jail(*, name):
     fnam = os.path.join(jailconf_dir(), f'{name}.json')
     os.unlink(fnam)
+    _invalidate(name)
+
+
+def _invalidate(name):
+    with _INDICES_LOCK:
+        idx = _INDICES.get(jailconf_dir())
+    if idx is not None:
+        idx.invalidate(name)
@@ -8,38 +8,182 @@
 
 import os
 import fcntl
+import threading
+import time
 from contextlib import ContextDecorator
+from urllib.parse import quote
+
+
+FOCKER_LOCK_FILE = '/var/lock/focker.lock'
+FOCKER_LOCK_DIR = '/var/lock/focker'
+
+
+def _flock(fd, path, shared=False, blocking=True):
+    mode = ( 'shared' if shared else 'exclusive' )
+    op = ( fcntl.LOCK_SH if shared else fcntl.LOCK_EX )
+    try:
+        fcntl.flock(fd, op | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        if not blocking:
+            return False
+    print(f'Waiting for {path} ({mode}) ...')
+    t_0 = time.perf_counter()
+    fcntl.flock(fd, op)
+    waited = time.perf_counter() - t_0
+    focker_lock.waits.append(( path, mode, waited ))
+    print(f'Lock acquired after {waited:.2f}s.')
+    return True
 
 
 class focker_lock(ContextDecorator):
+    # shared=True lets other shared holders (read-only commands
+    # and builds) run concurrently, these lock what they create
+    # with focker_lock_resource()
     fd = None
+    shared = False
+    held = {}
+    held_lock = threading.Lock()
+    path_locks = {}
+    waits = []
+
+    def __init__(self, shared=False):
+        self.shared_mode = shared
 
     def __enter__(self):
-        os.makedirs('/var/lock', exist_ok=True)
+        os.makedirs(os.path.dirname(FOCKER_LOCK_FILE), exist_ok=True)
         if focker_lock.fd is not None:
             raise RuntimeError('focker_lock.fd expected to be None here')
-        focker_lock.fd = open('/var/lock/focker.lock', 'a+')
-        print('Waiting for /var/lock/focker.lock ...')
-        fcntl.flock(focker_lock.fd, fcntl.LOCK_EX)
-        print('Lock acquired.')
+        focker_lock.fd = open(FOCKER_LOCK_FILE, 'a+')
+        focker_lock.shared = self.shared_mode
+        focker_lock.waits = []
+        _flock(focker_lock.fd, FOCKER_LOCK_FILE, shared=self.shared_mode)
 
     def __exit__(self, *_):
+        with focker_lock.held_lock:
+            # anything but a plain shared lock may have changed the store,
+            # the mtime tells the daemon its view is stale
+            if not focker_lock.shared or focker_lock.held:
+                os.utime(FOCKER_LOCK_FILE)
+            for fd in focker_lock.held.values():
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                fd.close()
+            focker_lock.held = {}
+            focker_lock.path_locks = {}
         fcntl.flock(focker_lock.fd, fcntl.LOCK_UN)
-        print('Lock released')
         focker_lock.fd.close()
         focker_lock.fd = None
+        focker_lock.shared = False
+
+
+def focker_lock_stamp():
+    try:
+        return os.stat(FOCKER_LOCK_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def focker_lock_path(kind, name):
+    return os.path.join(FOCKER_LOCK_DIR, kind, quote(name, safe='') + '.lock')
+
+
+def _lock_resource(kind, name, shared, blocking):
+    # None - busy, False - nothing to do, True - newly acquired
+    if focker_lock.fd is None or not focker_lock.shared:
+        return False
+    path = focker_lock_path(kind, name)
+    with focker_lock.held_lock:
+        if path in focker_lock.held:
+            return False
+        path_lock = focker_lock.path_locks.setdefault(path, threading.Lock())
+    # held_lock is not held while waiting for another process, so that
+    # other threads can meanwhile lock unrelated resources; threads
+    # after the same resource wait for one another on path_lock instead
+    if not path_lock.acquire(blocking=blocking):
+        return None
+    try:
+        with focker_lock.held_lock:
+            if path in focker_lock.held:
+                return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = open(path, 'a+')
+        if not _flock(fd, path, shared=shared, blocking=blocking):
+            fd.close()
+            return None
+        with focker_lock.held_lock:
+            focker_lock.held[path] = fd
+    finally:
+        path_lock.release()
+    return True
+
+
+def focker_try_lock_resource(kind, name):
+    # for names nobody else should be waiting for,
+    # e.g. datasets about to be created
+    return ( _lock_resource(kind, name, False, False) is not None )
+
+
+def focker_lock_resources(kind, names, shared=False):
+    # Locks are held until the enclosing focker_lock() exits and taken
+    # in sorted order so that processes locking overlapping sets cannot
+    # deadlock. Under an exclusive focker_lock() this is a no-op.
+    acquired = [ name for name in sorted(set(names)) \
+        if _lock_resource(kind, name, shared, True) ]
+    if acquired:
+        _invalidate_covered(kind, acquired)
+
+
+def _invalidate_covered(kind, names):
+    # Other processes may have changed what we now hold, only that is
+    # refreshed. 'tag' and 'sha256' names are '<focker type>/<value>',
+    # a dataset with the sha256 may also have been created meanwhile
+    # under any of the names zfs_find_prefix() could have picked.
+    from ..core.inventory import ZfsInventory
+    inv = ZfsInventory.instance()
+    if inv is None or inv.data is None:
+        return
+    datasets = []
+    for name in names:
+        if kind == 'dataset':
+            datasets.append(name)
+            continue
+        focker_type, _, value = name.partition('/')
+        idx = inv.index(focker_type)
+        if kind == 'tag':
+            datasets.extend(idx.find_tag(value))
+        elif kind == 'sha256':
+            datasets.extend(idx.find_sha256(value))
+            head = f'{inv.root_dataset()}/{focker_type}s/'
+            datasets.extend(head + value[:n] for n in range(7, len(value) + 1))
+    inv.invalidate(datasets)
 
 
 class focker_unlock(ContextDecorator):
+    # parallel builds (e.g. compose --jobs) may be inside
+    # several unlocked sections at once, the lock is reclaimed
+    # when the last of them exits
+    depth = 0
+    depth_lock = threading.Lock()
+
     def __enter__(self):
-        if focker_lock.fd is None:
-            return
-        fcntl.flock(focker_lock.fd, fcntl.LOCK_UN)
-        print('Lock released temporarily')
+        with focker_unlock.depth_lock:
+            if focker_lock.fd is None:
+                return
+            focker_unlock.depth += 1
+            if focker_unlock.depth > 1:
+                return
+            fcntl.flock(focker_lock.fd, fcntl.LOCK_UN)
+            print('Lock released temporarily')
 
     def __exit__(self, *_):
-        if focker_lock.fd is None:
-            return
-        print('Waiting for /var/lock/focker.lock ...')
-        fcntl.flock(focker_lock.fd, fcntl.LOCK_EX)
-        print('Lock reclaimed.')
+        with focker_unlock.depth_lock:
+            if focker_lock.fd is None:
+                return
+            focker_unlock.depth -= 1
+            if focker_unlock.depth > 0:
+                return
+            _flock(focker_lock.fd, FOCKER_LOCK_FILE, shared=focker_lock.shared)
+            print('Lock reclaimed.')
+        from ..core.inventory import ZfsInventory
+        if ZfsInventory.is_available():
+            ZfsInventory.instance().invalidate_all()
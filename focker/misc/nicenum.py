@@ -0,0 +1,27 @@
+#
+# Copyright (C) Stanislaw Adaszewski, 2020-2021
+# License: GNU General Public License v3.0
+# URL: https://github.com/sadaszewski/focker
+# URL: https://adared.ch/focker
+#
+
+
+def nicenum(value):
+    # sizes the way zfs prints them without -p, e.g. 96K or 1.21G
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        return value
+    units = 'BKMGTPE'
+    i = 0
+    while n >= 1024 ** (i + 1) and i < len(units) - 1:
+        i += 1
+    if i == 0:
+        return f'{n}B'
+    if n % (1024 ** i) == 0:
+        return f'{n // 1024 ** i}{units[i]}'
+    for precision in [ 2, 1, 0 ]:
+        res = f'{n / 1024 ** i:.{precision}f}{units[i]}'
+        if len(res) <= 5:
+            return res
+    return res # pragma: no cover
@@ -7,7 +7,11 @@
 
 
 import importlib
+import importlib.metadata
 import pkgutil
+import json
+import sys
+import os
 from .core import FOCKER_CONFIG
 from .misc import merge_dicts
 
@@ -34,22 +38,175 @@ class Plugin:
         return {}
 
 
+def _command_tree(spec):
+    return { k: dict(aliases=v.get('aliases', []),
+        subcommands=_command_tree(v.get('subparsers', {}))) \
+        for k, v in spec.items() }
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _dist_info(names):
+    # metadata directories of the installed distributions
+    # which provide the given top-level modules
+    res = []
+    for dist in importlib.metadata.distributions():
+        top = (dist.read_text('top_level.txt') or '').split()
+        files = dist.files or []
+        if not top:
+            top = [ f.parts[0].split('.')[0] for f in files ]
+        if not any(name in top for name in names):
+            continue
+        for f in files:
+            if f.name == 'METADATA':
+                res.append(str(dist.locate_file(f).parent))
+                break
+    return sorted(set(res))
+
+
+class PluginManifest:
+    # What every plugin provides, recorded so that a command only
+    # imports the plugins it needs. Valid for as long as sys.path,
+    # the directories on it, the plugin package directories and the
+    # metadata of the distributions installing them are unchanged.
+    # Only directories are checked, not every source file - editing
+    # a plugin in place calls for removing the manifest.
+
+    def __init__(self, key, plugins):
+        self.key = key
+        self.plugins = plugins
+
+    @staticmethod
+    def default_path():
+        return os.environ.get('FOCKER_PLUGIN_MANIFEST',
+            '/var/cache/focker/plugins.json')
+
+    @staticmethod
+    def path_key():
+        res = []
+        for p in sys.path:
+            try:
+                res.append([ p, os.stat(p or '.').st_mtime_ns ])
+            except OSError:
+                res.append([ p, None ])
+        return res
+
+    @classmethod
+    def compute_key(cls, modules, dists):
+        res = dict(path=cls.path_key(), modules={}, dists={})
+        for name, origin in sorted(modules.items()):
+            res['modules'][name] = [ origin, _mtime(origin) ]
+        for path in sorted(dists):
+            res['dists'][path] = _mtime(path)
+        return res
+
+    @classmethod
+    def load(cls, path=None):
+        path = path or cls.default_path()
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        res = cls(data['key'], data['plugins'])
+        modules = { name: origin for name, ( origin, _ ) in res.key['modules'].items() }
+        dists = list(res.key.get('dists', {}).keys())
+        if res.key['path'] != cls.path_key() or \
+            res.key != cls.compute_key(modules, dists):
+            return None
+        return res
+
+    def save(self, path=None):
+        path = path or self.default_path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(dict(key=self.key, plugins=self.plugins), f)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            pass # running without the manifest is only slower
+
+    @classmethod
+    def build(cls):
+        modules = {}
+        classes = []
+        for finder, name, ispkg in pkgutil.iter_modules():
+            if name != 'focker' and not name.startswith('focker_'):
+                continue
+            m = importlib.import_module(name)
+            modules[name] = os.path.dirname(m.__file__) if ispkg else m.__file__
+            for k in dir(m):
+                v = getattr(m, k)
+                if k.endswith('Plugin') and isinstance(v, type) and \
+                    issubclass(v, Plugin) and v not in classes:
+                    classes.append(v)
+        plugins = [ dict(
+            module=p.__module__,
+            name=p.__qualname__,
+            provides=_command_tree(p.provide_parsers()),
+            extends=_command_tree(p.extend_parsers()),
+            change_defaults=bool(p.change_defaults()),
+            pre_hooks=sorted(p.install_pre_hooks().keys()),
+            post_hooks=sorted(p.install_post_hooks().keys())
+        ) for p in classes ]
+        return cls(cls.compute_key(modules, _dist_info(modules.keys())),
+            plugins), classes
+
+    def commands(self):
+        res = {}
+        for entry in self.plugins:
+            for k, v in entry['provides'].items():
+                res.setdefault(k, v)
+        return res
+
+    def resolve(self, token):
+        for k, v in self.commands().items():
+            if token == k or token in v['aliases']:
+                return k
+        return None
+
+
 class PluginManager:
     def __init__(self):
         self.discovered_modules = {}
         self.discovered_plugins = []
-
-    def load(self):
-        self.discovered_modules = {
-            name: importlib.import_module(name)
-            for finder, name, ispkg
-            in pkgutil.iter_modules()
-            if name == 'focker' or name.startswith('focker_')
-        }
-        for m in self.discovered_modules.values():
-            for k, v in m.__dict__.items():
-                if k.endswith('Plugin') and issubclass(v, Plugin):
-                    self.discovered_plugins.append(v)
+        self.manifest = None
+
+    def load(self, manifest_path=None):
+        # plugins changing the defaults are always imported,
+        # the others when their command or hook is used
+        self.manifest = PluginManifest.load(manifest_path)
+        if self.manifest is None:
+            self.manifest, classes = PluginManifest.build()
+            self.manifest.save(manifest_path)
+            for p in classes:
+                self.register(p)
+        self.import_plugins(lambda e: e['change_defaults'])
+
+    def register(self, plugin):
+        if plugin not in self.discovered_plugins:
+            self.discovered_plugins.append(plugin)
+
+    def import_plugins(self, pred):
+        if self.manifest is None:
+            return
+        for entry in self.manifest.plugins:
+            if not pred(entry):
+                continue
+            m = importlib.import_module(entry['module'])
+            self.discovered_modules[entry['module']] = m
+            self.register(getattr(m, entry['name']))
+
+    def load_command(self, name):
+        self.import_plugins(lambda e: name in e['provides'] or name in e['extends'])
+
+    def load_all(self):
+        self.import_plugins(lambda e: True)
 
     def change_defaults(self):
         for p in self.discovered_plugins:
@@ -64,6 +221,7 @@ class PluginManager:
                 setattr(subsys, entrynam, merge_dicts(old_v, v))
 
     def execute_pre_hooks(self, hook_name, args):
+        self.import_plugins(lambda e: hook_name in e['pre_hooks'])
         for p in self.discovered_plugins:
             for hn, hf in p.install_pre_hooks().items():
                 if hn != hook_name:
@@ -71,6 +229,7 @@ class PluginManager:
                 hf(args)
 
     def execute_post_hooks(self, hook_name, args):
+        self.import_plugins(lambda e: hook_name in e['post_hooks'])
         for p in self.discovered_plugins:
             for hn, hf in p.install_post_hooks().items():
                 if hn != hook_name:
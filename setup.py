@@ -9,6 +9,7 @@ setup(
     packages=['focker', 'focker.cmdmodule', 'focker.cmdmodule.bootstrap',
         'focker.cmdmodule.compose', 'focker.core', 'focker.core.config',
         'focker.core.image', 'focker.core.jailspec', 'focker.core.osjail',
+        'focker.core.zfsbackend',
         'focker.jailconf', 'focker.misc'],
     license='The GNU General Public License v3.0',
     description='Focker is a FreeBSD image orchestration tool in the vein of Docker.',
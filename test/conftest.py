@@ -0,0 +1,18 @@
+from focker.core import MemoryZfsBackend, \
+    FOCKER_CONFIG
+import pytest
+
+
+_ROOT = 'zroot/focker'
+
+
+@pytest.fixture
+def memory_zfs(tmp_path, monkeypatch):
+    monkeypatch.setattr(FOCKER_CONFIG.zfs, 'root_dataset', _ROOT)
+    monkeypatch.setattr(FOCKER_CONFIG.zfs, 'root_mountpoint', str(tmp_path / 'focker'))
+    with MemoryZfsBackend(mountpoint=str(tmp_path), makedirs=True) as backend:
+        backend.create(_ROOT)
+        for ft in [ 'images', 'jails', 'volumes' ]:
+            backend.create(f'{_ROOT}/{ft}')
+        backend.log.clear()
+        yield backend
@@ -34,6 +34,11 @@ class DatasetCmdTestBase:
         cmd = [ self._meta_class._meta_focker_type, 'list', '-o', 'is_protected', 'origin_mountpoint' ]
         main(cmd)
 
+    def test17_list_format(self):
+        for fmt in [ 'json', 'jsonl', 'tsv' ]:
+            cmd = [ self._meta_class._meta_focker_type, 'list', '-f', fmt, '-o', 'tags', 'size' ]
+            main(cmd)
+
     @pytest.mark.skip
     def test04_list_before_after_create(self):
         pass
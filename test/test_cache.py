@@ -2,12 +2,23 @@ from focker.core import CacheBase, \
     JlsCache, \
     ZfsPropertyCache, \
     JailConfCache, \
+    FileHashCache, \
+    cached_filehash, \
     TemporaryOSJail, \
     clone_image_jailspec, \
     Volume, \
     Image
+from focker.misc import filehash
+from focker.cmdmodule.common import cmd_taggable_list
+from types import SimpleNamespace
+from contextlib import redirect_stdout
+from io import StringIO
 import pytest
 from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor
+import json
+import stat
+import os
 
 
 class TestCacheBase:
@@ -114,6 +125,59 @@ class TestZfsPropertyCache:
             assert im.name in zc
             assert zc.get_property(im.name, 'mountpoint') == im.mountpoint
 
+    def test03_projection(self, memory_zfs):
+        v_1 = Volume.create()
+        v_1.add_tags([ 'a', 'b' ])
+        v_2 = Volume.create()
+        memory_zfs.log.clear()
+        with ZfsPropertyCache(focker_type=[ 'volume' ],
+            properties=[ 'focker:tags', 'used' ]) as zc:
+
+            assert memory_zfs.log == [ [ 'get', 'mountpoint,focker:sha256,focker:tags,used',
+                'zroot/focker/volumes' ] ]
+            assert set(zc.columns.keys()) == { 'mountpoint', 'focker:sha256', 'focker:tags', 'used' }
+            assert all(len(col) == len(zc.names) for col in zc.columns.values())
+            assert zc[v_1.name]['focker:tags'] in [ 'a b', 'b a' ]
+            assert v_2.tags == set()
+            assert v_1.size == '0B'
+            assert Volume.from_mountpoint(v_2.mountpoint).name == v_2.name
+            assert len(memory_zfs.log) == 1
+            # outside of the projection
+            assert v_1.get_property('rdonly') == 'off'
+            assert zc.get_property('zroot/focker/volumes/nothere', 'used') == '-'
+
+    def test04_list_join(self, memory_zfs):
+        im = Image.create()
+        im.finalize()
+        im.add_tags([ 'base' ])
+        children = [ Image.clone_from(im) for _ in range(3) ]
+        for c in children:
+            c.finalize()
+        memory_zfs.log.clear()
+        buf = StringIO()
+        args = SimpleNamespace(output=[ 'name', 'tags', 'origin_tags', 'origin_sha256' ],
+            sort='origin_mountpoint', tagged=False, format='jsonl')
+        with redirect_stdout(buf):
+            cmd_taggable_list(args, Image)
+        # the projection and the inventory, nothing per row
+        assert [ e[0] for e in memory_zfs.log ] == [ 'get', 'get' ]
+        rows = [ json.loads(l) for l in buf.getvalue().splitlines() ]
+        assert [ r['name'] for r in rows ][0] == im.name
+        assert rows[0]['tags'] == [ 'base' ]
+        assert rows[0]['origin_tags'] is None
+        assert all(r['origin_tags'] == [ 'base' ] for r in rows[1:])
+        assert all(r['origin_sha256'] == im.sha256 for r in rows[1:])
+        buf = StringIO()
+        with redirect_stdout(buf):
+            cmd_taggable_list(SimpleNamespace(**{ **args.__dict__, 'format': 'json' }), Image)
+        assert json.loads(buf.getvalue()) == rows
+        buf = StringIO()
+        with redirect_stdout(buf):
+            cmd_taggable_list(SimpleNamespace(**{ **args.__dict__, 'format': 'tsv' }), Image)
+        lines = buf.getvalue().splitlines()
+        assert lines[0] == 'name\ttags\torigin_tags\torigin_sha256'
+        assert lines[1] == f'{im.name}\tbase\t-\t-'
+
 
 class TestJailConfCache:
     def test00_cache_after(self):
@@ -140,3 +204,71 @@ class TestJailConfCache:
                 assert JailConfCache.instance() == jc
                 # print(oj.name, jc.data.keys())
                 assert oj.name not in jc.conf()
+
+
+class TestFileHashCache:
+    def _files(self, tmp_path, n):
+        res = []
+        for i in range(n):
+            fnam = str(tmp_path / f'{i}.file')
+            with open(fnam, 'w') as f:
+                f.write(f'focker-unit-test-file-hash-cache-{i}\n')
+            res.append(fnam)
+        return res
+
+    def test00_hit_miss(self, tmp_path):
+        fnam, = self._files(tmp_path, 1)
+        cache_fnam = str(tmp_path / 'cache.json')
+        with FileHashCache(cache_fnam) as hc:
+            assert cached_filehash(fnam) == filehash(fnam)
+            assert cached_filehash(fnam) == filehash(fnam)
+            assert (hc.hits, hc.misses) == (1, 1)
+        assert os.path.exists(cache_fnam)
+        with FileHashCache(cache_fnam) as hc:
+            assert cached_filehash(fnam) == filehash(fnam)
+            assert (hc.hits, hc.misses) == (1, 0)
+
+    def test01_changed_file(self, tmp_path):
+        fnam, = self._files(tmp_path, 1)
+        with FileHashCache(str(tmp_path / 'cache.json')) as hc:
+            h = hc.filehash(fnam)
+            with open(fnam, 'a') as f:
+                f.write('more data\n')
+            assert hc.filehash(fnam) != h
+            assert hc.filehash(fnam) == filehash(fnam)
+            assert (hc.hits, hc.misses) == (1, 2)
+
+    def test02_lru_eviction(self, tmp_path):
+        fnames = self._files(tmp_path, 3)
+        with FileHashCache(str(tmp_path / 'cache.json'), max_entries=2) as hc:
+            hc.filehash(fnames[0])
+            hc.filehash(fnames[1])
+            hc.filehash(fnames[0])
+            hc.filehash(fnames[2])
+            assert len(hc.data) == 2
+            hc.filehash(fnames[0])
+            assert (hc.hits, hc.misses) == (2, 3)
+            hc.filehash(fnames[1])
+            assert (hc.hits, hc.misses) == (2, 4)
+
+    def test03_no_cache(self, tmp_path):
+        fnam, = self._files(tmp_path, 1)
+        assert not FileHashCache.is_available()
+        assert cached_filehash(fnam) == filehash(fnam)
+
+    def test04_concurrent_save(self, tmp_path):
+        fnames = self._files(tmp_path, 50)
+        cache_fnam = str(tmp_path / 'cache.json')
+        caches = []
+        for fnam in fnames:
+            hc = FileHashCache(cache_fnam)
+            hc.data = hc.generate_cache()
+            hc.filehash(fnam)
+            caches.append(hc)
+        with ThreadPoolExecutor(max_workers=8) as ex:
+            for f in [ ex.submit(hc.save) for hc in caches ]:
+                f.result()
+        with open(cache_fnam) as f:
+            assert len(json.load(f)) == 1
+        assert not [ fnam for fnam in os.listdir(tmp_path) if fnam.endswith('.tmp') ]
+        assert stat.S_IMODE(os.stat(cache_fnam).st_mode) == 0o600
@@ -11,6 +11,8 @@ import stat
 import pytest
 from subprocess import CalledProcessError
 from contextlib import ExitStack
+from focker.cmdmodule.compose.plan import ComposePlan
+from focker.cmdmodule.compose.volume import build_volume
 
 
 class TestCompose:
@@ -175,7 +177,7 @@ class TestCompose:
             stack.callback(im.destroy)
             jfs_1 = JailFs.from_tag('focker-unit-test-compose-jail')
             stack.callback(lambda: jfs_1.destroy() if zfs_exists(jfs_1.name) else None)
-            main(cmd)
+            main(cmd[:2] + [ '--force' ] + cmd[2:])
             jfs_2 = JailFs.from_tag('focker-unit-test-compose-jail')
             stack.callback(jfs_2.destroy)
             assert jfs_1.path != jfs_2.path
@@ -227,3 +229,143 @@ class TestCompose:
                 }, f)
             main(cmd)
             assert not vol.is_protected
+
+    def test14_plan(self):
+        with tempfile.TemporaryDirectory() as d:
+            for name, base in [ ('base', 'freebsd-latest'), ('app', 'focker-unit-test-base') ]:
+                os.mkdir(os.path.join(d, name))
+                with open(os.path.join(d, name, 'Fockerfile'), 'w') as f:
+                    yaml.safe_dump({ 'base': base, 'steps': [] }, f)
+            spec = {
+                'images': {
+                    'focker-unit-test-app': 'app',
+                    'focker-unit-test-base': 'base'
+                },
+                'volumes': { 'focker-unit-test-data': {} },
+                'jails': {
+                    'focker-unit-test-web': {
+                        'image': 'focker-unit-test-app',
+                        'depend': 'focker-unit-test-db'
+                    },
+                    'focker-unit-test-db': {
+                        'image': 'focker-unit-test-base',
+                        'mounts': { 'focker-unit-test-data/db': '/var/db', '/tmp': '/tmp' }
+                    }
+                }
+            }
+            plan = ComposePlan(spec, d, fenv={})
+            assert plan.depends['volumes/focker-unit-test-data'] == []
+            assert plan.depends['images/focker-unit-test-base'] == []
+            assert plan.depends['images/focker-unit-test-app'] == [ 'images/focker-unit-test-base' ]
+            assert plan.depends['jails/focker-unit-test-db'] == [ 'images/focker-unit-test-base',
+                'volumes/focker-unit-test-data' ]
+            assert plan.depends['jails/focker-unit-test-web'] == [ 'images/focker-unit-test-app',
+                'jails/focker-unit-test-db' ]
+            order = plan.topological_order()
+            assert order.index('images/focker-unit-test-app') < order.index('jails/focker-unit-test-web')
+            assert order.index('jails/focker-unit-test-db') < order.index('jails/focker-unit-test-web')
+
+    def test15_build_parallel(self):
+        with tempfile.TemporaryDirectory() as d, \
+            ExitStack() as stack:
+            with open(os.path.join(d, 'focker-compose.yml'), 'w') as f:
+                yaml.safe_dump({
+                    'images': {
+                        'focker-unit-test-compose-jail': '.'
+                    },
+                    'volumes': {
+                        'focker-unit-test-compose-volume': {}
+                    },
+                    'jails': {
+                        'focker-unit-test-compose-jail': {
+                            'image': 'focker-unit-test-compose-jail',
+                            'mounts': { 'focker-unit-test-compose-volume': '/mnt' }
+                        }
+                    }
+                }, f)
+            with open(os.path.join(d, 'Fockerfile'), 'w') as f:
+                yaml.safe_dump({
+                    'base': 'freebsd-latest',
+                    'steps': [ { 'run': 'touch /.focker-unit-test-compose-jail' } ]
+                }, f)
+            cmd = [ 'compose', 'build', '--jobs', '3', os.path.join(d, 'focker-compose.yml') ]
+            main(cmd)
+            im = Image.from_tag('focker-unit-test-compose-jail')
+            stack.callback(im.destroy)
+            vol = Volume.from_tag('focker-unit-test-compose-volume')
+            stack.callback(vol.destroy)
+            jfs = JailFs.from_tag('focker-unit-test-compose-jail')
+            stack.callback(jfs.destroy)
+            assert os.path.exists(os.path.join(jfs.path, '.focker-unit-test-compose-jail'))
+
+    def test16_build_jail_unchanged(self):
+        with tempfile.TemporaryDirectory() as d, \
+            ExitStack() as stack:
+            def write_spec(hostname):
+                with open(os.path.join(d, 'focker-compose.yml'), 'w') as f:
+                    yaml.safe_dump({
+                        'jails': {
+                            'focker-unit-test-compose-jail': {
+                                'image': 'freebsd-latest',
+                                'host.hostname': hostname
+                            }
+                        }
+                    }, f)
+            write_spec('focker-unit-test-1')
+            cmd = [ 'compose', 'build', os.path.join(d, 'focker-compose.yml') ]
+            main(cmd)
+            jfs_1 = JailFs.from_tag('focker-unit-test-compose-jail')
+            stack.callback(lambda: jfs_1.destroy() if zfs_exists(jfs_1.name) else None)
+            assert jfs_1.get_property('focker:spec_digest') != '-'
+            main(cmd)
+            assert JailFs.from_tag('focker-unit-test-compose-jail').name == jfs_1.name
+            write_spec('focker-unit-test-2')
+            main(cmd)
+            jfs_2 = JailFs.from_tag('focker-unit-test-compose-jail')
+            stack.callback(jfs_2.destroy)
+            assert jfs_2.name != jfs_1.name
+            assert not zfs_exists(jfs_1.name)
+            assert OSJail.from_tag('focker-unit-test-compose-jail').conf['host.hostname'] == \
+                'focker-unit-test-2'
+
+    def test17_build_jail_dependency_rebuilt(self):
+        with tempfile.TemporaryDirectory() as d, \
+            ExitStack() as stack:
+            def write_spec(hostname):
+                with open(os.path.join(d, 'focker-compose.yml'), 'w') as f:
+                    yaml.safe_dump({
+                        'jails': {
+                            'focker-unit-test-compose-db': {
+                                'image': 'freebsd-latest',
+                                'host.hostname': hostname
+                            },
+                            'focker-unit-test-compose-web': {
+                                'image': 'freebsd-latest',
+                                'depend': 'focker-unit-test-compose-db'
+                            }
+                        }
+                    }, f)
+            write_spec('focker-unit-test-1')
+            cmd = [ 'compose', 'build', os.path.join(d, 'focker-compose.yml') ]
+            main(cmd)
+            stack.callback(lambda: [ JailFs.from_tag(t).destroy() for t in \
+                [ 'focker-unit-test-compose-web', 'focker-unit-test-compose-db' ] \
+                if JailFs.exists_tag(t) ])
+            db_1 = OSJail.from_tag('focker-unit-test-compose-db')
+            assert OSJail.from_tag('focker-unit-test-compose-web').conf['depend'] == [ db_1.name ]
+            write_spec('focker-unit-test-2')
+            main(cmd)
+            db_2 = OSJail.from_tag('focker-unit-test-compose-db')
+            assert db_2.name != db_1.name
+            assert OSJail.from_tag('focker-unit-test-compose-web').conf['depend'] == [ db_2.name ]
+
+    def test18_build_volume_tagged_on_error(self, memory_zfs):
+        with pytest.raises(ValueError):
+            build_volume('focker-unit-test-compose-volume',
+                { 'chown': 'nobody:nobody', 'protect': True }, {})
+        v = Volume.from_tag('focker-unit-test-compose-volume')
+        assert not v.is_protected
+        v_2 = build_volume('focker-unit-test-compose-volume', { 'protect': True }, {})
+        assert v_2.name == v.name
+        assert v_2.is_protected
+        assert len(Volume.list()) == 1
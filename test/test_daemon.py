@@ -0,0 +1,126 @@
+from focker.daemon import FockerDaemon
+from focker.command import materialize_parsers
+from focker.core import Volume
+from focker.misc import focker_lock
+from importlib.machinery import SourceFileLoader
+import importlib.util
+from argparse import ArgumentParser
+import focker.misc.lock
+import contextvars
+import threading
+import socketserver
+import stat
+import pytest
+import time
+import os
+
+
+def _client():
+    path = os.path.join(os.path.dirname(__file__), '..', 'scripts', 'focker')
+    loader = SourceFileLoader('focker_client', path)
+    mod = importlib.util.module_from_spec(importlib.util.spec_from_loader(loader.name, loader))
+    loader.exec_module(mod)
+    return mod
+
+
+def _parser():
+    def cmd_ls(args):
+        for v in Volume.list():
+            print(v.name)
+    def cmd_fail(args):
+        raise RuntimeError('failed')
+    spec = dict(
+        ls=dict(
+            func=cmd_ls,
+            daemon=True
+        ),
+        fail=dict(
+            func=cmd_fail,
+            daemon=True
+        ),
+        rm=dict(
+            func=lambda args: 0
+        )
+    )
+    parser = ArgumentParser('focker')
+    materialize_parsers(spec, parser.add_subparsers(), {})
+    return parser
+
+
+@pytest.fixture
+def daemon(memory_zfs, tmp_path, monkeypatch):
+    monkeypatch.setattr(focker.misc.lock, 'FOCKER_LOCK_FILE', str(tmp_path / 'focker.lock'))
+    monkeypatch.setenv('FOCKER_DAEMON_SOCKET', str(tmp_path / 'focker.sock'))
+    monkeypatch.delenv('FOCKER_NO_DAEMON', raising=False)
+    server = FockerDaemon(parser=_parser())
+    t = threading.Thread(target=contextvars.copy_context().run,
+        args=(server.serve_forever,))
+    t.start()
+    try:
+        yield server, memory_zfs
+    finally:
+        server.shutdown()
+        t.join()
+        server.server_close()
+
+class TestDaemon:
+    def test00_forward(self, daemon, capsys):
+        server, backend = daemon
+        v = Volume.create()
+        client = _client()
+        assert client.forward([ 'ls' ]) == 0
+        assert capsys.readouterr().out == f'{v.name}\n'
+        assert client.forward([ 'rm' ]) is None
+        assert client.forward([ 'fail' ]) == 1
+        assert 'RuntimeError: failed' in capsys.readouterr().err
+        assert client.forward([ 'nosuchcommand' ]) == 2
+
+    def test01_hot_inventory(self, daemon, capsys):
+        server, backend = daemon
+        client = _client()
+        assert client.forward([ 'ls' ]) == 0
+        backend.log.clear()
+        t_0 = time.perf_counter()
+        assert client.forward([ 'ls' ]) == 0
+        print(f'Served from the daemon in {(time.perf_counter() - t_0) * 1000:.1f}ms')
+        assert backend.log == []
+        # another focker process changes the store
+        with focker_lock():
+            v = Volume.create()
+        backend.log.clear()
+        assert client.forward([ 'ls' ]) == 0
+        assert v.name in capsys.readouterr().out.split('\n')
+        assert [ e[0] for e in backend.log ].count('get') == 1
+
+    def test02_no_daemon(self, tmp_path, monkeypatch):
+        client = _client()
+        monkeypatch.setenv('FOCKER_DAEMON_SOCKET', str(tmp_path / 'nothing.sock'))
+        assert client.forward([ 'image', 'list' ]) is None
+        monkeypatch.setenv('FOCKER_NO_DAEMON', '1')
+        assert client.forward([ 'image', 'list' ]) is None
+
+    def test03_single_instance(self, daemon):
+        server, _ = daemon
+        with pytest.raises(RuntimeError, match='already listening'):
+            FockerDaemon(server.socket_path)
+
+    def test04_socket_permissions(self, tmp_path, monkeypatch):
+        umasks = []
+        server_bind = socketserver.UnixStreamServer.server_bind
+        def record_umask(self):
+            umask = os.umask(0o022)
+            os.umask(umask)
+            umasks.append(umask)
+            server_bind(self)
+        monkeypatch.setattr(socketserver.UnixStreamServer, 'server_bind', record_umask)
+        umask = os.umask(0o022)
+        try:
+            server = FockerDaemon(str(tmp_path / 'focker.sock'), parser=_parser())
+            try:
+                assert umasks == [ 0o077 ]
+                assert stat.S_IMODE(os.stat(server.socket_path).st_mode) == 0o600
+                assert os.umask(0o022) == 0o022
+            finally:
+                server.server_close()
+        finally:
+            os.umask(umask)
@@ -1,10 +1,12 @@
 from dataset_test_base import DatasetTestBase
 from dataset_cmd_test_base import DatasetCmdTestBase
 from focker.core import Image, \
-    CalledProcessError
+    CalledProcessError, \
+    zfs_exists
 from focker.core.image.steps import RunStep, \
     CopyStep, \
     create_step
+from focker.core.image.plan import BuildPlan
 import focker.yaml as yaml
 from focker.__main__ import main
 from tempfile import TemporaryDirectory
@@ -17,6 +19,41 @@ from contextlib import ExitStack
 class TestImage(DatasetTestBase):
     _meta_class = Image
 
+    def test11_prune_plan(self):
+        base = Image.from_tag('freebsd-latest')
+        created = []
+        def cleanup():
+            for ds in reversed(created):
+                if zfs_exists(ds.name):
+                    ds.unprotect()
+                    ds.destroy(force=True)
+        with ExitStack() as stack:
+            stack.callback(cleanup)
+            def clone(parent):
+                ds = Image.clone_from(parent)
+                created.append(ds)
+                ds.finalize()
+                return ds
+            a = clone(base)
+            b = clone(a)
+            c = clone(a)
+            d = clone(base)
+            d.protect()
+
+            batches, _ = Image.prune_plan()
+            names = [ n for bat in batches for n in bat ]
+            assert d.name not in names
+            assert names.index(a.name) > names.index(b.name)
+            assert names.index(a.name) > names.index(c.name)
+            assert not any(b.name in bat and a.name in bat for bat in batches)
+
+            assert Image.prune(dry_run=True)[0] == batches
+            assert all(zfs_exists(ds.name) for ds in [ a, b, c, d ])
+
+            Image.prune()
+            assert not any(zfs_exists(ds.name) for ds in [ a, b, c ])
+            assert zfs_exists(d.name)
+
 
 class TestImageCmd(DatasetCmdTestBase):
     _meta_class = Image
@@ -345,3 +382,63 @@ class TestBuildSteps:
     def test06_unrecognized_step(self):
         with pytest.raises(ValueError, match='Unrecognized'):
             _ = create_step({ 'xxx': {} }, '', {})
+
+    def test07_build_plan(self):
+        with TemporaryDirectory() as d:
+            for i in range(4):
+                with open(os.path.join(d, f'{i}.file'), 'w') as f:
+                    f.write(f'focker-unit-test-build-plan-{i}\n')
+            base = Image.from_tag('freebsd-latest')
+            steps = [ [ { 'copy': [ f'{i}.file', f'/{i}.file' ] } ] for i in range(4) ]
+            plan = BuildPlan.from_steps(base, steps, d, {})
+            sha256 = base.sha256
+            for i in range(4):
+                sha256 = CopyStep([ f'{i}.file', f'/{i}.file' ], d, {}).hash(sha256)
+                assert plan.hashes[i] == sha256
+            assert plan.first_miss == 0
+            assert plan.cached_image.sha256 == base.sha256
+            assert len(plan.pending) == 4
+
+    def _make_tree(self, d):
+        os.makedirs(os.path.join(d, 'tree', 'sub', 'subsub'))
+        with open(os.path.join(d, 'tree', 'a.file'), 'w') as f:
+            f.write('focker-unit-test-copy-dir-a\n')
+        with open(os.path.join(d, 'tree', 'sub', 'b.file'), 'w') as f:
+            f.write('focker-unit-test-copy-dir-b\n')
+        with open(os.path.join(d, 'tree', 'sub', 'subsub', 'c.sh'), 'w') as f:
+            f.write('#!/bin/sh\n')
+        os.chmod(os.path.join(d, 'tree', 'sub', 'subsub', 'c.sh'), 0o755)
+        os.symlink('sub/b.file', os.path.join(d, 'tree', 'b.link'))
+
+    def test08_copy_dir_hash(self):
+        with TemporaryDirectory() as d:
+            self._make_tree(d)
+            h_1 = CopyStep([ 'tree', '/tree' ], d, {}).hash('1234567xxx')
+            assert CopyStep([ 'tree', '/tree' ], d, {}).hash('1234567xxx') == h_1
+            with open(os.path.join(d, 'tree', 'sub', 'b.file'), 'a') as f:
+                f.write('changed\n')
+            h_2 = CopyStep([ 'tree', '/tree' ], d, {}).hash('1234567xxx')
+            assert h_2 != h_1
+            os.chmod(os.path.join(d, 'tree', 'a.file'), 0o600)
+            assert CopyStep([ 'tree', '/tree' ], d, {}).hash('1234567xxx') != h_2
+
+    def test09_copy_dir_execute(self):
+        class FakeImage:
+            pass
+        with TemporaryDirectory() as d, \
+            TemporaryDirectory() as im_path:
+            self._make_tree(d)
+            im = FakeImage()
+            im.path = im_path
+            create_step({ 'copy': [ 'tree', '/usr/local/tree' ] }, d, {}).execute(im)
+            dst = os.path.join(im_path, 'usr/local/tree')
+            with open(os.path.join(dst, 'sub', 'b.file')) as f:
+                assert f.read() == 'focker-unit-test-copy-dir-b\n'
+            assert os.readlink(os.path.join(dst, 'b.link')) == 'sub/b.file'
+            assert stat.S_IMODE(os.stat(os.path.join(dst, 'sub', 'subsub', 'c.sh')).st_mode) == 0o755
+
+    def test10_copy_dir_use_fenv(self):
+        with TemporaryDirectory() as d:
+            self._make_tree(d)
+            with pytest.raises(ValueError, match='use_fenv'):
+                _ = CopyStep([ 'tree', '/tree', { 'use_fenv': True } ], d, {})
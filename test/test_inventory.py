@@ -0,0 +1,222 @@
+from focker.core import ZfsInventory, \
+    DatasetIndex, \
+    OriginGraph, \
+    Image, \
+    Volume, \
+    JailFs, \
+    FOCKER_CONFIG, \
+    zfs_set_props, \
+    zfs_destroy
+import pytest
+import json
+import sys
+import os
+
+
+_ROOT = 'focker-unit-test-pool/focker'
+
+
+_FAKE_ZFS = f'''#!{sys.executable}
+import sys, json, os
+state_fnam = os.environ['FOCKER_UNIT_TEST_ZFS_STATE']
+with open(state_fnam) as f:
+    state = json.load(f)
+with open(state_fnam + '.log', 'a') as f:
+    f.write(' '.join(sys.argv[1:]) + '\\n')
+args = sys.argv[1:]
+if args[0] == 'get':
+    names = [ a for a in args[1:] if a.startswith('{_ROOT}') ]
+    props = args[args.index(names[0]) - 1].split(',')
+    for name, ds in state.items():
+        if not any(name == n or ('-r' in args and name.startswith(n + '/')) for n in names):
+            continue
+        for p in props:
+            print(f'{{name}}\\t{{p}}\\t{{ds.get(p, "-")}}')
+elif args[0] == 'set':
+    for kv in args[1:-1]:
+        k, v = kv.split('=', 1)
+        state[args[-1]][k] = v
+elif args[0] == 'destroy':
+    state = {{ k: v for k, v in state.items() if k != args[-1] and not k.startswith(args[-1] + '/') }}
+with open(state_fnam, 'w') as f:
+    json.dump(state, f)
+'''
+
+
+def _dataset(focker_type, sha256, tags='-', origin='-'):
+    return f'{_ROOT}/{focker_type}s/{sha256[:7]}', {
+        'mountpoint': f'/focker-unit-test/{focker_type}s/{sha256[:7]}',
+        'focker:sha256': sha256,
+        'focker:tags': tags,
+        'rdonly': 'on',
+        'origin': origin
+    }
+
+
+@pytest.fixture
+def fake_zfs(tmp_path, monkeypatch):
+    state = dict([
+        ( f'{_ROOT}/images', {} ),
+        ( f'{_ROOT}/jails', {} ),
+        ( f'{_ROOT}/volumes', {} ),
+        _dataset('image', 'aaaaaaa1', 'base-image latest'),
+        _dataset('image', 'bbbbbbb2', 'other-image'),
+        _dataset('volume', 'ccccccc3', 'some-volume')
+    ])
+    state_fnam = str(tmp_path / 'state.json')
+    with open(state_fnam, 'w') as f:
+        json.dump(state, f)
+    zfs_fnam = tmp_path / 'zfs'
+    zfs_fnam.write_text(_FAKE_ZFS)
+    zfs_fnam.chmod(0o755)
+    monkeypatch.setenv('PATH', str(tmp_path) + os.pathsep + os.environ['PATH'])
+    monkeypatch.setenv('FOCKER_UNIT_TEST_ZFS_STATE', state_fnam)
+    monkeypatch.setattr(FOCKER_CONFIG.zfs, 'root_dataset', _ROOT)
+    def log():
+        with open(state_fnam + '.log') as f:
+            return f.read().strip('\n').split('\n')
+    return log
+
+
+class TestZfsInventory:
+    def test00_lazy(self, fake_zfs):
+        with ZfsInventory() as inv:
+            assert inv.data is None
+        with pytest.raises(FileNotFoundError):
+            _ = fake_zfs()
+
+    def test01_single_listing(self, fake_zfs):
+        with ZfsInventory():
+            im = Image.from_tag('base-image')
+            assert im.sha256 == 'aaaaaaa1'
+            assert Image.exists_tag('other-image')
+            assert Image.from_sha256('bbbbbbb2').mountpoint == '/focker-unit-test/images/bbbbbbb'
+            assert Image.from_any_id('aaaaaaa', strict=False).name == im.name
+            assert len(Image.list()) == 2
+            assert len(Volume.list()) == 1
+            assert im.tags == { 'base-image', 'latest' }
+            assert im.is_finalized
+        log = fake_zfs()
+        assert len(log) == 1
+        assert log[0].startswith('get -H -p')
+
+    def test02_invalidate_touched_only(self, fake_zfs):
+        with ZfsInventory():
+            im = Image.from_tag('base-image')
+            zfs_set_props(im.name, { 'focker:foo': 'bar' })
+            assert im.tags == { 'base-image', 'latest' }
+            assert Image.from_tag('other-image').sha256 == 'bbbbbbb2'
+        log = fake_zfs()
+        assert len(log) == 3
+        assert log[1].startswith('set focker:foo=bar')
+        assert '-r' not in log[2].split(' ')
+        assert log[2].endswith(' ' + im.name)
+
+    def test03_destroy(self, fake_zfs):
+        with ZfsInventory() as inv:
+            v = Volume.from_tag('some-volume')
+            assert v.name in inv
+            zfs_destroy(v.name)
+            assert v.name not in inv
+            assert not Volume.exists_tag('some-volume')
+
+    def test04_no_context(self, fake_zfs):
+        assert not ZfsInventory.is_available()
+        assert Image.from_tag('other-image').sha256 == 'bbbbbbb2'
+        assert Image.exists_sha256('aaaaaaa1')
+        assert len(fake_zfs()) == 2
+
+    def test05_prune_single_listing(self, fake_zfs, tmp_path, monkeypatch):
+        state_fnam = os.environ['FOCKER_UNIT_TEST_ZFS_STATE']
+        with open(state_fnam) as f:
+            state = json.load(f)
+        base, _ = _dataset('image', 'aaaaaaa1')
+        for i in range(20):
+            name, props = _dataset('jail', f'{i:07d}', origin=base + '@1')
+            state[name] = props
+        with open(state_fnam, 'w') as f:
+            json.dump(state, f)
+        monkeypatch.setattr(FOCKER_CONFIG.zfs, 'root_mountpoint', str(tmp_path))
+        (tmp_path / 'jailconf').mkdir()
+        batches, _ = JailFs.prune(max_workers=1) # the fake zfs is not thread-safe
+        assert len(batches) == 1
+        assert len(batches[0]) == 20
+        log = fake_zfs()
+        assert len(log) == 21
+        assert log[0].startswith('get -H -p')
+        assert all(a.startswith('destroy ') for a in log[1:])
+
+
+class TestDatasetIndex:
+    def _index(self):
+        data = dict([
+            _dataset('image', 'aaaaaaa1', 'base-image latest'),
+            _dataset('image', 'aaaaaab2', 'base-image-2'),
+            _dataset('image', 'ccccccc3')
+        ])
+        return DatasetIndex(data, list(data.keys()))
+
+    def test00_exact(self):
+        idx = self._index()
+        assert idx.find_tag('latest') == [ f'{_ROOT}/images/aaaaaaa' ]
+        assert idx.find_tag('base') == []
+        assert idx.find_sha256('ccccccc3') == [ f'{_ROOT}/images/ccccccc' ]
+        assert idx.find_any_id('base-image-2') == [ f'{_ROOT}/images/aaaaaab' ]
+
+    def test01_partial(self):
+        idx = self._index()
+        assert len(idx.find_partial_tag('base-image')) == 2
+        assert idx.find_partial_tag('lat') == [ f'{_ROOT}/images/aaaaaaa' ]
+        assert len(idx.find_partial_sha256('aaaaaa')) == 2
+        assert idx.find_partial_sha256('aaaaaab') == [ f'{_ROOT}/images/aaaaaab' ]
+        assert idx.find_partial_sha256('d') == []
+        assert idx.find_partial_any_id('c') == [ f'{_ROOT}/images/ccccccc' ]
+
+    def test02_ambiguous(self, fake_zfs):
+        with ZfsInventory():
+            with pytest.raises(RuntimeError, match='Ambiguous'):
+                _ = Image.from_any_id('', strict=False)
+            assert Image.from_any_id('o', strict=False).sha256 == 'bbbbbbb2'
+            assert Image.from_partial_tag('base').sha256 == 'aaaaaaa1'
+            with pytest.raises(RuntimeError, match='not found'):
+                _ = Image.from_partial_sha256('c')
+
+    def test03_incremental(self):
+        idx = self._index()
+        name, props = _dataset('image', 'ddddddd4', 'base-image-3')
+        idx.add(name, props)
+        assert idx.find_tag('base-image-3') == [ name ]
+        assert len(idx.find_partial_tag('base-image', limit=10)) == 3
+        idx.discard(name, props)
+        props = dict(props, **{ 'focker:tags': 'latest' })
+        idx.add(name, props)
+        assert idx.find_tag('base-image-3') == []
+        assert 'base-image-3' not in idx.sorted_tags
+        assert sorted(idx.find_tag('latest')) == sorted([ name, f'{_ROOT}/images/aaaaaaa' ])
+        idx.discard(name, props)
+        assert idx.find_sha256('ddddddd4') == []
+        assert 'ddddddd4' not in idx.sorted_sha256
+
+    def test04_reindex_on_change(self, fake_zfs):
+        with ZfsInventory() as inv:
+            im = Image.from_tag('base-image')
+            idx = inv.index('image')
+            Image.from_tag('other-image').add_tags([ 'latest' ])
+            assert inv.index('image') is idx
+            assert im.tags == { 'base-image' }
+            assert Image.from_tag('latest').sha256 == 'bbbbbbb2'
+
+
+class TestOriginGraph:
+    def test00_graph(self):
+        base, base_props = _dataset('image', 'aaaaaaa1')
+        child, child_props = _dataset('image', 'bbbbbbb2', origin=base + '@1')
+        jail, jail_props = _dataset('jail', 'ccccccc3', origin=child + '@1')
+        other, other_props = _dataset('jail', 'ddddddd4', origin=base + '@1')
+        graph = OriginGraph({ base: base_props, child: child_props,
+            jail: jail_props, other: other_props })
+        assert graph.lineage(jail) == [ child, base ]
+        assert graph.lineage(base) == []
+        assert graph.descendants(base) == [ child, other, jail ]
+        assert graph.descendants(jail) == []
+        assert graph.parent[other] == base
@@ -1,6 +1,7 @@
 import focker.jailconf as jc
 from focker.jailconf.classes import *
 import pytest
+import time
 
 
 _TXT = """
@@ -30,6 +31,38 @@ sameinjail {
 """
 
 
+_SAMPLES = [
+    _TXT,
+    '',
+    'a.nob;',
+    '# c\n/* x\n */ a = 1 ; // y\nb += \'x\', "y" ,z;\n',
+    "a='foo \\\n  bar baf';",
+    'j1 { }\nj2{x=1;y;z+=a,b;}\n',
+    '"quoted name" { path = "/a b"; }  '
+]
+
+
+def _tree(x):
+    if isinstance(x, str):
+        return x
+    if hasattr(x, 'toks'):
+        return ( x.__class__.__name__, [ _tree(t) for t in x.toks ] )
+    return ( x.__class__.__name__, x.value )
+
+
+def _big_jail_conf(n):
+    return ''.join(f"""# jail {i}
+focker-jail-{i} {{
+    path = /focker/jails/{i:07x};
+    host.hostname = "jail-{i}.example.com";
+    ip4.addr = 127.0.{i // 256}.{i % 256};
+    mount.devfs;
+    depend = focker-jail-{max(i - 1, 0)}, other;
+    exec.prestart += "echo 'prestart'";
+}}
+""" for i in range(n))
+
+
 _NATIVE = {
     'a.b': 1,
     'a.c': 'abc',
@@ -226,3 +259,66 @@ class TestJailconf:
         assert jc.loads("a='foo \\\n  bar baf';")['a'] == 'foo   bar baf';
         assert jc.loads("a='foo \\\\\n  bar baf';")['a'] == 'foo \\\n  bar baf';
         assert jc.loads("a='foo \\\\   \n  bar baf';")['a'] == 'foo \\   \n  bar baf';
+
+    def test30_streaming_same_as_pyparsing(self):
+        for txt in _SAMPLES:
+            conf_1 = jc.loads(txt, parser='streaming')
+            conf_2 = jc.loads(txt, parser='pyparsing')
+            assert _tree(conf_1) == _tree(conf_2)
+            assert str(conf_1) == str(conf_2)
+
+    def test31_streaming_syntax_error(self):
+        for txt in [ 'a', 'a = ;', 'j { k { } }', 'a = b c;', 'j { a = 1; ' ]:
+            with pytest.raises(ValueError, match='Syntax error'):
+                _ = jc.loads(txt)
+
+    def test32_unknown_parser(self):
+        with pytest.raises(ValueError, match='Unknown'):
+            _ = jc.loads(_TXT, parser='foo')
+
+    def test33_benchmark(self):
+        txt = _big_jail_conf(2000)
+        t_0 = time.perf_counter()
+        conf_1 = jc.loads(txt, parser='streaming')
+        t_1 = time.perf_counter()
+        conf_2 = jc.loads(txt, parser='pyparsing')
+        t_2 = time.perf_counter()
+        print(f'2000 jails - streaming: {t_1 - t_0:.3f}s, pyparsing: {t_2 - t_1:.3f}s, ' \
+            f'speedup: {(t_2 - t_1) / (t_1 - t_0):.1f}x')
+        assert len(conf_1.jail_blocks) == 2000
+        assert str(conf_1) == str(conf_2)
+        assert t_1 - t_0 < t_2 - t_1
+
+    def test34_index_consistency(self):
+        conf = jc.loads(_TXT)
+        blk = conf['sameinjail']
+        assert blk['a.f'] == [ 1, 2, 3 ]
+        blk['a.f'] = 4
+        blk.append_append('a.f', 5)
+        assert blk['a.f'] == [ 4, 5 ]
+        del blk['a.f']
+        assert 'a.f' not in blk
+        assert 'a.f' not in str(blk)
+        conf['other'] = JailBlock.create('other', { 'a.b': 1 })
+        assert conf.has_jail_block('other')
+        assert conf['other']['a.b'] == 1
+        conf.remove_jail_block('sameinjail')
+        assert not conf.has_jail_block('sameinjail')
+        assert 'sameinjail' not in str(conf)
+        conf = jc.loads(str(conf))
+        assert conf.jail_blocks.keys() == { 'other' }
+        assert conf['a.b'] == 1
+
+    def test35_large_block(self):
+        t_0 = time.perf_counter()
+        conf = JailConf()
+        for i in range(5000):
+            conf[f'key.{i}'] = i
+            conf[f'key.{i // 2}'] = i
+            conf[f'jail-{i}'] = JailBlock.create(f'jail-{i}', { 'a.b': i })
+        for i in range(5000):
+            assert conf.get_jail_block(f'jail-{i}')['a.b'] == i
+        print(f'5000 keys and jail blocks: {time.perf_counter() - t_0:.3f}s')
+        assert conf['key.0'] == 1
+        assert conf['key.4999'] == 4999
+        assert len(conf.jail_blocks) == 5000
@@ -1,22 +1,50 @@
 from dataset_test_base import DatasetTestBase
 from dataset_cmd_test_base import DatasetCmdTestBase
 from focker.core import JailFs, \
+    Image, \
     clone_image_jailspec, \
     OSJailSpec, \
     OSJail, \
     Volume, \
     TemporaryOSJail
+from focker.misc import jailconf_add_jail, \
+    jailconf_remove_jail
 from focker.__main__ import main
+from focker.cmdmodule.jail import cmd_jail_start, \
+    cmd_jail_stop
+from types import SimpleNamespace
 from contextlib import redirect_stdout, \
     ExitStack
 import io
 from tempfile import TemporaryDirectory
 import os
+import sys
+import pytest
 
 
 class TestJailFs(DatasetTestBase):
     _meta_class = JailFs
 
+    def test11_prune_plan(self):
+        im = Image.from_tag('freebsd-latest')
+        with ExitStack() as stack:
+            a, b, c = [ JailFs.clone_from(im) for _ in range(3) ]
+            for jfs in [ a, b, c ]:
+                stack.callback(jfs.destroy)
+            # b depends on a, a jail not managed by focker depends on c
+            for jname, path, depend in [
+                ( 'focker-unit-test-prune-a', a.path, [] ),
+                ( 'focker-unit-test-prune-b', b.path, [ 'focker-unit-test-prune-a' ] ),
+                ( 'focker-unit-test-prune-ext', '/nonexistent', [ 'focker-unit-test-prune-c' ] ),
+                ( 'focker-unit-test-prune-c', c.path, [] ) ]:
+                jailconf_add_jail(name=jname, entry={ 'path': path, 'depend': depend })
+                stack.callback(jailconf_remove_jail, name=jname)
+            batches, _ = JailFs.prune(dry_run=True)
+            names = [ n for bat in batches for n in bat ]
+            assert names.index(b.name) < names.index(a.name)
+            assert not any(b.name in bat and a.name in bat for bat in batches)
+            assert c.name not in names
+
 
 class TestJailFsCmd(DatasetCmdTestBase):
     _meta_class = JailFs
@@ -143,3 +171,74 @@ class TestJailCmd:
             assert os.path.exists(os.path.join(v.path, 'focker-unit-test-subdir', '.focker-unit-test-jail'))
             with open(os.path.join(v.path, 'focker-unit-test-subdir', '.focker-unit-test-jail')) as f:
                 assert f.read().strip() == 'foo'
+
+    def test09_start_reference_or_all(self):
+        with pytest.raises(ValueError, match='jail reference or --all'):
+            main([ 'jail', 'start' ])
+        with pytest.raises(ValueError, match='mutually exclusive'):
+            main([ 'jail', 'stop', '--all', 'focker-unit-test-jail' ])
+
+    def test10_start_stop_all(self, tmp_path, monkeypatch):
+        from focker.core import FOCKER_CONFIG
+        monkeypatch.setattr(FOCKER_CONFIG.zfs, 'root_mountpoint', str(tmp_path))
+        os.mkdir(tmp_path / 'jailconf')
+        # b and d depend on a, c depends on b
+        for name, depend in [ ( 'a', [] ), ( 'b', [ 'a' ] ), ( 'c', [ 'b' ] ),
+            ( 'd', [ 'a' ] ), ( 'e', [] ) ]:
+            jailconf_add_jail(name=name, entry={ 'path': f'/focker-unit-test/{name}',
+                'depend': depend })
+        bin_dir = tmp_path / 'bin'
+        bin_dir.mkdir()
+        log_fnam = str(tmp_path / 'jail.log')
+        (bin_dir / 'jail').write_text(f'''#!{sys.executable}
+import sys, os, time
+action, name = sys.argv[3:5]
+with open({log_fnam!r}, 'a') as f:
+    f.write(f'begin {{action}} {{name}}\\n')
+time.sleep(0.3)
+with open({log_fnam!r}, 'a') as f:
+    f.write(f'end {{action}} {{name}}\\n')
+sys.exit(1 if name == os.environ.get('FOCKER_UNIT_TEST_FAIL') else 0)
+''')
+        (bin_dir / 'jls').write_text(f'''#!{sys.executable}
+import json, os
+names = os.environ.get('FOCKER_UNIT_TEST_RUNNING', '').split()
+print(json.dumps({{ 'jail-information': {{ 'jail': [ {{ 'name': n, 'jid': i + 1 }}
+    for i, n in enumerate(names) ] }} }}))
+''')
+        for fnam in [ 'jail', 'jls' ]:
+            (bin_dir / fnam).chmod(0o755)
+        monkeypatch.setenv('PATH', str(bin_dir) + os.pathsep + os.environ['PATH'])
+        args = SimpleNamespace(all=True, jail_reference=None, jobs=4)
+        def log():
+            with open(log_fnam) as f:
+                res = f.read().split('\n')[:-1]
+            os.unlink(log_fnam)
+            return res
+        def before(log, x, y):
+            # x was finished before y was begun
+            return log.index(f'end {x}') < log.index(f'begin {y}')
+
+        cmd_jail_start(args)
+        res = log()
+        assert len(res) == 10
+        assert all(before(res, f'-c {x}', f'-c {y}') for x, y in \
+            [ ( 'a', 'b' ), ( 'b', 'c' ), ( 'a', 'd' ) ])
+        # independent jails run concurrently
+        assert res.index('begin -c e') < res.index('end -c a')
+
+        monkeypatch.setenv('FOCKER_UNIT_TEST_RUNNING', 'a b c d e')
+        cmd_jail_stop(args)
+        res = log()
+        assert len(res) == 10
+        assert all(before(res, f'-r {x}', f'-r {y}') for x, y in \
+            [ ( 'b', 'a' ), ( 'c', 'b' ), ( 'd', 'a' ) ])
+
+        # dependents of a failed jail are skipped, others carry on
+        monkeypatch.setenv('FOCKER_UNIT_TEST_RUNNING', '')
+        monkeypatch.setenv('FOCKER_UNIT_TEST_FAIL', 'b')
+        with pytest.raises(RuntimeError, match='2 jail\\(s\\) failed'):
+            cmd_jail_start(args)
+        res = log()
+        assert sorted(l.split(' ')[-1] for l in res if l.startswith('begin')) == \
+            [ 'a', 'b', 'd', 'e' ]
@@ -1,6 +1,8 @@
 from focker.core.jailspec import JailSpec
 from focker.core.jailspec.variants import *
+from focker.core.jailspec import constant
 import pytest
+import os
 
 
 class TestJailSpec:
@@ -46,3 +48,32 @@ class TestJailSpec:
             _ = one_exec_jailspec(None, { 'image': 'abc' })
         with pytest.raises(KeyError, match='separately'):
             ImageBuildJailSpec.from_image_and_dict(None, { 'image': 'abc' })
+
+    def test08_jail_params_cache(self, monkeypatch, tmp_path):
+        path = tmp_path / 'jail-params.json'
+        monkeypatch.setenv('FOCKER_JAIL_PARAMS_CACHE', str(path))
+        calls = []
+        monkeypatch.setattr(constant, 'get_jail_sysctl_params',
+            lambda: calls.append(1) or { 'allow.mount', 'persist' })
+        assert constant.load_jail_sysctl_params() == frozenset({ 'allow.mount', 'persist' })
+        assert os.path.exists(path)
+        assert constant.load_jail_sysctl_params() == frozenset({ 'allow.mount', 'persist' })
+        assert len(calls) == 1
+        monkeypatch.setattr(constant, 'kernel_version', lambda: 'FreeBSD 99.0-RELEASE')
+        constant.load_jail_sysctl_params()
+        assert len(calls) == 2
+
+    def test09_jail_params_fallback(self, monkeypatch, tmp_path):
+        monkeypatch.setenv('FOCKER_JAIL_PARAMS_CACHE', str(tmp_path / 'jail-params.json'))
+        def no_sysctl():
+            raise FileNotFoundError('sysctl')
+        monkeypatch.setattr(constant, 'get_jail_sysctl_params', no_sysctl)
+        assert constant.load_jail_sysctl_params() is constant.JAIL_SYSCTL_PARAMS_FALLBACK
+        assert not os.path.exists(tmp_path / 'jail-params.json')
+
+    def test10_jail_known_params(self):
+        known = constant.jail_known_params()
+        assert isinstance(known, frozenset)
+        assert known is constant.jail_known_params()
+        assert { 'image', 'mounts', 'exec.start', 'persist' } <= known
+        assert constant.JAIL_PARAMS <= known
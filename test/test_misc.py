@@ -1,15 +1,30 @@
 from focker.misc.lock import focker_lock, \
-    focker_unlock
+    focker_unlock, \
+    focker_lock_path, \
+    focker_lock_resources, \
+    focker_try_lock_resource
 from focker.misc import load_jailconf, \
-    backup_file
+    nicenum, \
+    backup_file, \
+    jailconf_add_jail, \
+    jailconf_remove_jail, \
+    jailconf_load_jail, \
+    jailconf_find_jail, \
+    jailconf_index, \
+    JailConfIndex
 from focker.jailconf import JailConf
 from focker.jailconf.classes import Value
 from focker.jailconf.misc import quote_value
 from focker.command import materialize_parsers
+from focker.core import ZfsInventory, \
+    Image
 import pytest
 from argparse import ArgumentParser
 import tempfile
 import os
+import fcntl
+import threading
+import time
 import pytest
 
 
@@ -84,3 +99,179 @@ class TestMisc:
             with pytest.raises(RuntimeError, match='expected to be None'):
                 with focker_lock():
                     pass
+
+    def test09_jailconf_index(self, monkeypatch, tmp_path):
+        from focker.core import FOCKER_CONFIG
+        monkeypatch.setattr(FOCKER_CONFIG.zfs, 'root_mountpoint', str(tmp_path))
+        os.mkdir(tmp_path / 'jailconf')
+        jailconf_add_jail(name='foo', entry={ 'path': '/foo', 'depend': 'bar',
+            'exec.prestart': "mount -t nullfs /vol/a /foo/mnt && mount -t nullfs '/vol/b c' /foo/x " })
+        jailconf_add_jail(name='bar', entry={ 'path': '/bar', 'exec.fib': '1' })
+        assert jailconf_find_jail(path='/foo') == 'foo'
+        assert jailconf_find_jail(path='/baz') is None
+        idx = jailconf_index()
+        assert idx.index['foo']['depend'] == [ 'bar' ]
+        assert idx.index['foo']['mounts'] == [ '/vol/a', '/vol/b c' ]
+        assert jailconf_load_jail(name='bar')['exec.fib'] == 1
+        assert os.path.exists(tmp_path / 'jailconf' / JailConfIndex.INDEX_FNAME)
+        assert set(load_jailconf().keys()) == { 'foo', 'bar' }
+        jailconf_add_jail(name='qux', entry={ 'path': '/qux', 'depend': [ 'bar' ] })
+        jailconf_load_jail(name='qux')['depend'].append('baz')
+        assert load_jailconf()['qux']['depend'] == [ 'bar' ]
+
+        # another process starts from the on-disk index and parses nothing
+        parsed = []
+        monkeypatch.setattr(JailConfIndex, '_load_entry',
+            lambda self, name: parsed.append(name))
+        idx = JailConfIndex(str(tmp_path / 'jailconf')).refresh()
+        assert idx.find_path('/bar') == 'bar'
+        assert parsed == []
+        monkeypatch.undo()
+
+        monkeypatch.setattr(FOCKER_CONFIG.zfs, 'root_mountpoint', str(tmp_path))
+        jailconf_remove_jail(name='foo')
+        assert jailconf_find_jail(path='/foo') is None
+        with open(tmp_path / 'jailconf' / 'bar.json', 'w') as f:
+            f.write('{ "path": "/bar2" }')
+        assert jailconf_find_jail(path='/bar2') == 'bar'
+        with pytest.raises(FileNotFoundError):
+            _ = jailconf_load_jail(name='foo')
+
+    def test10_shared_and_resource_locks(self, monkeypatch, tmp_path):
+        import focker.misc.lock
+        monkeypatch.setattr(focker.misc.lock, 'FOCKER_LOCK_FILE', str(tmp_path / 'focker.lock'))
+        monkeypatch.setattr(focker.misc.lock, 'FOCKER_LOCK_DIR', str(tmp_path / 'focker'))
+        with focker_lock(shared=True), \
+            open(tmp_path / 'focker.lock', 'a+') as other:
+            # a second shared holder gets in, an exclusive one does not
+            fcntl.flock(other, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            fcntl.flock(other, fcntl.LOCK_UN)
+            with pytest.raises(BlockingIOError):
+                fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            focker_lock_resources('tag', [ 'image/b', 'image/a' ])
+            with open(focker_lock_path('tag', 'image/a'), 'a+') as f:
+                with pytest.raises(BlockingIOError):
+                    fcntl.flock(f, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            os.makedirs(tmp_path / 'focker' / 'dataset')
+            with open(focker_lock_path('dataset', 'zroot/focker/images/abc'), 'a+') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                assert not focker_try_lock_resource('dataset', 'zroot/focker/images/abc')
+            assert focker_try_lock_resource('dataset', 'zroot/focker/images/abc')
+        assert focker_lock.held == {}
+        with open(focker_lock_path('tag', 'image/a'), 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # the global lock already covers everything
+        with focker_lock():
+            focker_lock_resources('tag', [ 'image/c' ])
+            assert not os.path.exists(focker_lock_path('tag', 'image/c'))
+
+    def test11_lock_wait_timing(self, monkeypatch, tmp_path, capsys):
+        import focker.misc.lock
+        monkeypatch.setattr(focker.misc.lock, 'FOCKER_LOCK_FILE', str(tmp_path / 'focker.lock'))
+        with open(tmp_path / 'focker.lock', 'a+') as other:
+            fcntl.flock(other, fcntl.LOCK_EX)
+            t = threading.Timer(0.2, lambda: fcntl.flock(other, fcntl.LOCK_UN))
+            t.start()
+            with focker_lock(shared=True):
+                pass
+            t.join()
+        assert len(focker_lock.waits) == 1
+        path, mode, waited = focker_lock.waits[0]
+        assert path == str(tmp_path / 'focker.lock')
+        assert mode == 'shared'
+        assert waited >= 0.1
+        out = capsys.readouterr().out
+        assert 'Waiting for' in out
+        assert 'Lock acquired after' in out
+
+    def test12_subp_lock_mode(self):
+        spec = dict(
+            foo=dict(
+                func=lambda: 0
+            ),
+            bar=dict(
+                func=lambda: 0,
+                lock='shared'
+            )
+        )
+        parser = ArgumentParser()
+        subp = parser.add_subparsers()
+        materialize_parsers(spec, subp, {})
+        assert parser.parse_args([ 'foo' ]).lock == 'exclusive'
+        assert parser.parse_args([ 'bar' ]).lock == 'shared'
+
+    def test13_nicenum(self):
+        assert nicenum('0') == '0B'
+        assert nicenum('512') == '512B'
+        assert nicenum('98304') == '96K'
+        assert nicenum('1048576') == '1M'
+        assert nicenum('1300000000') == '1.21G'
+        assert nicenum('5000000000000') == '4.55T'
+        assert nicenum('-') == '-'
+
+    def test14_resource_wait_not_global(self, monkeypatch, tmp_path):
+        import focker.misc.lock
+        monkeypatch.setattr(focker.misc.lock, 'FOCKER_LOCK_FILE', str(tmp_path / 'focker.lock'))
+        monkeypatch.setattr(focker.misc.lock, 'FOCKER_LOCK_DIR', str(tmp_path / 'focker'))
+        os.makedirs(tmp_path / 'focker' / 'tag')
+        with focker_lock(shared=True), \
+            open(focker_lock_path('tag', 'image/a'), 'a+') as other:
+            # another process holds image/a, two threads wait for it
+            fcntl.flock(other, fcntl.LOCK_EX)
+            threads = [ threading.Thread(target=focker_lock_resources,
+                args=('tag', [ 'image/a' ]), daemon=True) for _ in range(2) ]
+            for t in threads:
+                t.start()
+            time.sleep(0.1)
+            t = threading.Thread(target=focker_lock_resources,
+                args=('tag', [ 'image/b' ]), daemon=True)
+            t.start()
+            t.join(1.0)
+            assert not t.is_alive()
+            assert focker_lock_path('tag', 'image/b') in focker_lock.held
+            assert focker_lock_path('tag', 'image/a') not in focker_lock.held
+            fcntl.flock(other, fcntl.LOCK_UN)
+            for t in threads:
+                t.join()
+            assert set(focker_lock.held.keys()) == { focker_lock_path('tag', 'image/a'),
+                focker_lock_path('tag', 'image/b') }
+        assert focker_lock.held == {}
+
+    def test15_lock_refreshes_covered(self, memory_zfs, monkeypatch, tmp_path):
+        import focker.misc.lock
+        monkeypatch.setattr(focker.misc.lock, 'FOCKER_LOCK_FILE', str(tmp_path / 'focker.lock'))
+        monkeypatch.setattr(focker.misc.lock, 'FOCKER_LOCK_DIR', str(tmp_path / 'lock'))
+        sha256 = 'abcdef0' + '1' * 57
+        memory_zfs.create('zroot/focker/images/bbbbbbb', { 'focker:sha256': 'b' * 64,
+            'focker:tags': 'a' })
+        with focker_lock(shared=True), ZfsInventory():
+            im = Image.from_tag('a')
+            assert not Image.exists_sha256(sha256)
+            # another process builds the same layer and moves the tag
+            memory_zfs.create(f'zroot/focker/images/{sha256[:7]}', { 'focker:sha256': sha256 })
+            memory_zfs.set(im.name, { 'focker:tags': '-' })
+            memory_zfs.log.clear()
+            focker_lock_resources('sha256', [ f'image/{sha256}' ])
+            focker_lock_resources('tag', [ 'image/a' ])
+            assert Image.exists_sha256(sha256)
+            assert im.tags == set()
+            gets = [ e for e in memory_zfs.log if e[0] == 'get' ]
+            assert len(gets) == 2
+            assert all('zroot/focker/images' not in e for e in gets)
+
+    def test16_jailconf_index_concurrent_save(self, tmp_path):
+        dnam = tmp_path / 'jailconf'
+        os.mkdir(dnam)
+        for i in range(20):
+            with open(dnam / f'jail{i}.json', 'w') as f:
+                f.write(f'{{ "path": "/jail{i}" }}')
+        indices = [ JailConfIndex(str(dnam)).refresh() for _ in range(8) ]
+        threads = [ threading.Thread(target=idx._save_index) for idx in indices * 10 ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert not [ fnam for fnam in os.listdir(dnam) if fnam.endswith('.tmp') ]
+        idx = JailConfIndex(str(dnam))
+        idx._load_index()
+        assert len(idx.index) == 20
@@ -3,13 +3,16 @@ from focker.core import OSJail, \
     JailFs, \
     clone_image_jailspec, \
     Volume, \
-    TemporaryOSJail
+    TemporaryOSJail, \
+    JailScheduler
 from focker.core.jailspec import JailSpec
 import pytest
 import os
 import focker.core.osjail as osjail
 import json
 from contextlib import ExitStack
+import threading
+import time
 
 
 class TestOSJail:
@@ -184,3 +187,65 @@ class TestOSJail:
             TemporaryOSJail(spec, create_started=False) as j:
             with pytest.raises(RuntimeError, match='Not running'):
                 _ = j.jls()
+
+
+class TestJailScheduler:
+    def _conf(self):
+        return {
+            'focker-unit-test-db': {},
+            'focker-unit-test-app': { 'depend': [ 'focker-unit-test-db' ] },
+            'focker-unit-test-web': { 'depend': [ 'focker-unit-test-app', 'not-a-focker-jail' ] },
+            'focker-unit-test-other': {}
+        }
+
+    def test00_topological_order(self):
+        sched = JailScheduler(self._conf())
+        order = sched.topological_order()
+        assert order.index('focker-unit-test-db') < order.index('focker-unit-test-app') < \
+            order.index('focker-unit-test-web')
+        order = sched.topological_order(reverse=True)
+        assert order.index('focker-unit-test-db') > order.index('focker-unit-test-app') > \
+            order.index('focker-unit-test-web')
+
+    def test01_cycle(self):
+        conf = self._conf()
+        conf['focker-unit-test-db']['depend'] = 'focker-unit-test-web'
+        with pytest.raises(RuntimeError, match='cycle'):
+            _ = JailScheduler(conf).topological_order()
+
+    def test02_run_parallel(self):
+        lock = threading.Lock()
+        done = []
+        def action(name):
+            time.sleep(0.05)
+            with lock:
+                done.append(name)
+        sched = JailScheduler(self._conf(), max_workers=4)
+        res = sched.run(action)
+        assert all(r.ok for r in res.values())
+        assert done.index('focker-unit-test-db') < done.index('focker-unit-test-app') < \
+            done.index('focker-unit-test-web')
+        done.clear()
+        res = sched.run(action, reverse=True)
+        assert done.index('focker-unit-test-db') > done.index('focker-unit-test-app') > \
+            done.index('focker-unit-test-web')
+
+    def test03_failed_dependency(self):
+        done = []
+        def action(name):
+            if name == 'focker-unit-test-app':
+                raise RuntimeError('Failed to start')
+            done.append(name)
+        res = JailScheduler(self._conf()).run(action)
+        assert not res['focker-unit-test-app'].ok
+        assert not res['focker-unit-test-web'].ok
+        assert res['focker-unit-test-web'].skipped
+        assert sorted(done) == [ 'focker-unit-test-db', 'focker-unit-test-other' ]
+
+    def test04_skip(self):
+        done = []
+        res = JailScheduler(self._conf()).run(done.append,
+            skip=lambda name: name == 'focker-unit-test-db')
+        assert res['focker-unit-test-db'].skipped
+        assert 'focker-unit-test-db' not in done
+        assert 'focker-unit-test-web' in done
@@ -56,3 +56,11 @@ class TestOSJailSpec:
         assert 'command' not in ospec.params
         assert 'exec.start' in ospec.params
         assert ospec.params['exec.start'] == 'ls -al'
+
+    def test10_structured_mounts(self):
+        spec = JailSpec.from_dict({ 'name': 'focker_unit_test_osjailspec',
+            'path': '/tmp', 'mounts': { '/some/dir': '/mnt/dir' } })
+        ospec = OSJailSpec.from_jailspec(spec)
+        assert ospec.params['focker.mounts'] == [ { 'source': '/some/dir',
+            'mountpoint': '/tmp/mnt/dir', 'fs_type': 'nullfs' } ]
+        assert 'focker.mounts' not in jailconf_jail_params(ospec.params)
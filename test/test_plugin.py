@@ -1,11 +1,18 @@
 from focker.plugin import Plugin, \
+    PluginManager, \
+    PluginManifest, \
     PLUGIN_MANAGER
+from focker.command import create_parser
 from focker.__main__ import main
 from contextlib import redirect_stdout, \
     ExitStack
 import io
 from focker.core import FOCKER_CONFIG
 import pytest
+import subprocess
+import json
+import sys
+import os
 
 
 class HelloPlugin(Plugin):
@@ -126,3 +133,77 @@ class TestPlugin:
             cmd = [ 'jail', 'list' ]
             with pytest.raises(KeyError, match='Unrecognized entry'):
                 main(cmd)
+
+    def test07_manifest(self, tmp_path, monkeypatch):
+        path = str(tmp_path / 'plugins.json')
+        pm = PluginManager()
+        pm.load(path)
+        assert os.path.exists(path)
+        assert pm.manifest.resolve('vol') == 'volume'
+        assert 'jail' in pm.manifest.commands()
+        assert 'list' in pm.manifest.commands()['jail']['subcommands']
+        def build():
+            raise RuntimeError('should not be rebuilt')
+        monkeypatch.setattr(PluginManifest, 'build', build)
+        pm = PluginManager()
+        pm.load(path)
+        assert pm.discovered_plugins == []
+        pm.load_command('volume')
+        assert [ p.__name__ for p in pm.discovered_plugins ] == [ 'VolumePlugin' ]
+        monkeypatch.setattr(sys, 'path', sys.path + [ str(tmp_path) ])
+        assert PluginManifest.load(path) is None
+
+    def test08_startup_importtime(self, tmp_path):
+        env = dict(os.environ, FOCKER_PLUGIN_MANIFEST=str(tmp_path / 'plugins.json'))
+        # importtime does not see importlib.import_module(),
+        # the imported plugins are listed separately
+        code = 'import sys; ' \
+            'from focker.plugin import PLUGIN_MANAGER; ' \
+            'from focker.command import create_parser; ' \
+            'PLUGIN_MANAGER.load(); ' \
+            'create_parser([ "volume", "list" ]).parse_args([ "volume", "list" ]); ' \
+            'print(" ".join(m for m in sys.modules if m.startswith("focker.cmdmodule.")))'
+        res = {}
+        for run in [ 'cold', 'warm' ]:
+            out = subprocess.run([ sys.executable, '-X', 'importtime', '-c', code ],
+                env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+            total = 0
+            for line in out.stderr.decode('utf-8').split('\n'):
+                if not line.startswith('import time:') or 'cumulative' in line:
+                    continue
+                _, cumulative, name = line[len('import time:'):].split('|')
+                if not name.startswith('  '):
+                    total += int(cumulative)
+            res[run] = ( total, out.stdout.decode('utf-8').split() )
+        print(f'Startup imports - cold: {res["cold"][0] / 1000:.1f}ms, ' \
+            f'warm: {res["warm"][0] / 1000:.1f}ms')
+        assert 'focker.cmdmodule.jail' in res['cold'][1]
+        assert 'focker.cmdmodule.volume' in res['warm'][1]
+        assert 'focker.cmdmodule.jail' not in res['warm'][1]
+        assert 'focker.cmdmodule.compose' not in res['warm'][1]
+
+    def test09_manifest_key_no_walk(self, tmp_path, monkeypatch):
+        path = str(tmp_path / 'plugins.json')
+        PluginManifest.build()[0].save(path)
+        pkg = tmp_path / 'focker_test_pkg'
+        pkg.mkdir()
+        dist = tmp_path / 'focker_test_pkg-1.0.dist-info'
+        dist.mkdir()
+        with open(path) as f:
+            data = json.load(f)
+        data['key']['modules']['focker_test_pkg'] = [ str(pkg), os.stat(pkg).st_mtime_ns ]
+        data['key']['dists'][str(dist)] = os.stat(dist).st_mtime_ns
+        with open(path, 'w') as f:
+            json.dump(data, f)
+        def walk(*args, **kwargs):
+            raise RuntimeError('should not walk the plugin sources')
+        monkeypatch.setattr(os, 'walk', walk)
+        assert PluginManifest.load(path) is not None
+        os.utime(dist, ns=( 0, 0 ))
+        assert PluginManifest.load(path) is None
+        data['key']['dists'][str(dist)] = 0
+        with open(path, 'w') as f:
+            json.dump(data, f)
+        assert PluginManifest.load(path) is not None
+        os.utime(pkg, ns=( 1, 1 ))
+        assert PluginManifest.load(path) is None
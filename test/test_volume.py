@@ -1,11 +1,33 @@
 from dataset_test_base import DatasetTestBase
 from dataset_cmd_test_base import DatasetCmdTestBase
-from focker.core import Volume
+from focker.core import Volume, \
+    OSJailSpec, \
+    clone_image_jailspec
+from contextlib import ExitStack
+import os
 
 
 class TestVolume(DatasetTestBase):
     _meta_class = Volume
 
+    def test11_list_unused_subdir_mount(self):
+        with ExitStack() as stack:
+            v = Volume.create()
+            stack.callback(v.destroy)
+            v_free = Volume.create()
+            stack.callback(v_free.destroy)
+            os.mkdir(os.path.join(v.path, 'subdir'))
+            spec, *_ = stack.enter_context(clone_image_jailspec({ 'image': 'freebsd-latest',
+                'mounts': { os.path.join(v.path, 'subdir'): '/mnt' } }))
+            ospec = OSJailSpec.from_jailspec(spec)
+            ospec.add()
+            stack.callback(ospec.remove)
+            unused = [ x.name for x in Volume.list_unused() ]
+            assert v.name not in unused
+            assert v_free.name in unused
+            assert v.in_use()
+            assert not v_free.in_use()
+
 
 class TestVolumeCmd(DatasetCmdTestBase):
     _meta_class = Volume
@@ -1,7 +1,8 @@
 from focker.core.zfs import *
 import focker.core.zfs as zfs
 import pytest
-from focker.core import Volume
+from focker.core import Volume, \
+    MemoryZfsBackend
 from contextlib import ExitStack
 
 
@@ -37,8 +38,8 @@ class TestZfs:
             zfs_destroy(name)
 
     def test04_missing_poolname(self, monkeypatch):
-        with monkeypatch.context() as c:
-            c.setattr(zfs, 'zfs_parse_output', lambda *_: [])
+        with MemoryZfsBackend() as backend:
+            monkeypatch.setattr(backend, 'list', lambda *_: [])
             with pytest.raises(RuntimeError, match='not ZFS'):
                 _ = zfs_poolname()
 
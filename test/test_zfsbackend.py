@@ -0,0 +1,319 @@
+from focker.core import ChannelProgramZfsBackend, \
+    ZfsInventory, \
+    Image, \
+    Volume, \
+    JailFs, \
+    ZfsTransaction, \
+    zfs_backend, \
+    zfs_set_props, \
+    zfs_get_property, \
+    zfs_shortest_unique_name
+from focker.core.zfsbackend.program import lua_str
+from focker.core.zfsbackend import cli
+from focker.cmdmodule.common import cmd_fobject_get, \
+    cmd_taggable_list
+from types import SimpleNamespace
+from contextlib import redirect_stdout
+from io import StringIO
+from subprocess import CalledProcessError
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import pytest
+import time
+
+
+_ROOT = 'zroot/focker'
+
+
+class TestMemoryZfsBackend:
+    def test00_selected(self, memory_zfs):
+        assert zfs_backend() is memory_zfs
+
+    def test01_datasets(self, memory_zfs):
+        memory_zfs.create(f'{_ROOT}/images/a', { 'focker:sha256': 'a' })
+        memory_zfs.snapshot(f'{_ROOT}/images/a@1')
+        memory_zfs.clone(f'{_ROOT}/images/a@1', f'{_ROOT}/jails/b')
+        assert memory_zfs.exists(f'{_ROOT}/jails/b')
+        data = memory_zfs.get([ f'{_ROOT}/jails' ], [ 'origin', 'mountpoint' ], recursive=True)
+        assert data[f'{_ROOT}/jails/b']['origin'] == f'{_ROOT}/images/a@1'
+        assert data[f'{_ROOT}/jails/b']['mountpoint'].endswith('focker/jails/b')
+        with pytest.raises(CalledProcessError):
+            memory_zfs.destroy(f'{_ROOT}/images/a')
+        memory_zfs.set(f'{_ROOT}/images', { 'focker:protect': 'on' })
+        assert memory_zfs.list([ f'{_ROOT}/images/a' ], [ 'focker:protect' ]) == [ [ 'on' ] ]
+        memory_zfs.inherit(f'{_ROOT}/images', 'focker:protect', recursive=True)
+        memory_zfs.destroy(f'{_ROOT}/jails/b')
+        memory_zfs.destroy(f'{_ROOT}/images/a')
+        assert not memory_zfs.exists(f'{_ROOT}/images/a@1')
+        assert memory_zfs.get([ f'{_ROOT}/images/a' ], [ 'name' ]) == {}
+        with pytest.raises(CalledProcessError):
+            memory_zfs.list([ f'{_ROOT}/images/a' ], [ 'name' ])
+
+    def test02_focker_objects(self, memory_zfs):
+        with ZfsInventory():
+            im = Image.create()
+            im.finalize()
+            im.add_tags([ 'base' ])
+            child = Image.clone_from(im)
+            child.finalize()
+            v = Volume.create()
+            assert Image.from_tag('base').name == im.name
+            assert child.origin.name == im.name
+            assert v.tags == set()
+            Image.prune()
+            assert not Image.exists_sha256(child.sha256)
+            assert Image.exists_sha256(im.sha256)
+
+    def test03_lineage(self, memory_zfs):
+        base = Image.create()
+        base.finalize()
+        base.add_tags([ 'base' ])
+        child = Image.clone_from(base)
+        child.finalize()
+        jails = [ JailFs.clone_from(child) for _ in range(3) ]
+        with ZfsInventory():
+            memory_zfs.log.clear()
+            lineage = jails[0].lineage()
+            assert [ ( type(ds), ds.name ) for ds in lineage ] == \
+                [ ( Image, child.name ), ( Image, base.name ) ]
+            desc = base.descendants()
+            assert desc[0].name == child.name
+            assert sorted(ds.name for ds in desc[1:]) == sorted(j.name for j in jails)
+            assert all(type(ds) is JailFs for ds in desc[1:])
+            for j in jails:
+                assert j.origin_tags == set()
+                assert child.origin_tags == { 'base' }
+                assert j.origin_sha256 == child.sha256
+                assert j.origin_mountpoint == child.mountpoint
+            assert base.origin is None
+            assert base.lineage() == []
+            # one listing for everything above
+            assert [ e[0] for e in memory_zfs.log ] == [ 'get' ]
+
+    def test04_sizes(self, memory_zfs):
+        memory_zfs.create(f'{_ROOT}/volumes/abcdef0', { 'focker:sha256': 'abcdef0',
+            'used': '1288490188', 'referenced': '98304' })
+        with ZfsInventory():
+            v = Volume.from_sha256('abcdef0')
+            assert v.size == '1.20G'
+            assert v.referred_size == '96K'
+            buf = StringIO()
+            with redirect_stdout(buf):
+                cmd_fobject_get(SimpleNamespace(reference='abcdef0',
+                    properties=[ 'used', 'referenced' ]), Volume)
+            assert buf.getvalue().split('\n')[2:4] == [ 'used        1.20G', 'referenced  96K' ]
+            buf = StringIO()
+            with redirect_stdout(buf):
+                cmd_taggable_list(SimpleNamespace(output=[ 'size' ], sort='size',
+                    tagged=False, format='jsonl'), Volume)
+            assert buf.getvalue() == '{"size": 1288490188}\n'
+
+
+class TestZfsTransaction:
+    def test00_single_set(self, memory_zfs):
+        v = Volume.create()
+        memory_zfs.log.clear()
+        zfs_set_props(v.name, { 'focker:a': '1', 'focker:b': '2' })
+        assert memory_zfs.log == [ [ 'set', 'focker:a=1', 'focker:b=2', v.name ] ]
+
+    def test01_collect(self, memory_zfs):
+        v = Volume.create()
+        memory_zfs.log.clear()
+        with ZfsTransaction() as tx:
+            v.add_tags([ 'a', 'b' ])
+            v.set_props({ 'focker:foo': 'bar' })
+            v.protect()
+            assert tx.get_property(v.name, 'focker:protect') == 'on'
+            assert zfs_get_property(v.name, 'focker:protect') == '-'
+        writes = [ e for e in memory_zfs.log if e[0] not in [ 'get', 'list' ] ]
+        assert len(writes) == 1
+        assert writes[0][0] == 'set'
+        assert v.tags == { 'a', 'b' }
+        assert v.is_protected
+
+    def test02_move_tag(self, memory_zfs):
+        v_1 = Volume.create()
+        v_1.add_tags([ 'a', 'b' ])
+        v_2 = Volume.create()
+        memory_zfs.log.clear()
+        v_2.add_tags([ 'a' ])
+        writes = [ e for e in memory_zfs.log if e[0] not in [ 'get', 'list' ] ]
+        assert sorted(e[-1] for e in writes) == sorted([ v_1.name, v_2.name ])
+        assert v_1.tags == { 'b' }
+        assert v_2.tags == { 'a' }
+
+    def test03_discard_on_error(self, memory_zfs):
+        v = Volume.create()
+        with pytest.raises(ValueError):
+            with ZfsTransaction():
+                v.set_props({ 'focker:foo': 'bar' })
+                raise ValueError
+        assert v.get_property('focker:foo') == '-'
+
+    def test04_finalize(self, memory_zfs):
+        im = Image.create()
+        memory_zfs.log.clear()
+        im.finalize()
+        assert memory_zfs.log == [ [ 'set', 'rdonly=on', im.name ], [ 'snapshot', im.snapshot_name ] ]
+
+    def test05_tag_cost_independent_of_store_size(self, memory_zfs):
+        res = {}
+        for n in [ 100, 3000 ]:
+            for i in range(len(res) * 100000, len(res) * 100000 + n):
+                memory_zfs.create(f'{_ROOT}/images/{i:07d}', { 'focker:sha256': f'{i:07d}',
+                    'focker:tags': f'tag-{i}' })
+            with ZfsInventory():
+                a, b = Image.list()[:2]
+                b_tags = b.tags
+                a.add_tags([ 'moving-tag' ])
+                memory_zfs.log.clear()
+                t_0 = time.perf_counter()
+                for _ in range(10):
+                    b.add_tags([ 'moving-tag' ])
+                    a.add_tags([ 'moving-tag' ])
+                res[n] = ( time.perf_counter() - t_0, len(memory_zfs.log) )
+                assert Image.from_tag('moving-tag').name == a.name
+                assert b.tags == b_tags
+        print(f'20 tag moves - 100 images: {res[100][0]:.3f}s, 3100 images: {res[3000][0]:.3f}s')
+        assert res[100][1] == res[3000][1]
+
+
+class TestNameAllocation:
+    def test00_parallel_clones(self, memory_zfs):
+        memory_zfs.create(f'{_ROOT}/jails/abcdef0')
+        with ZfsInventory():
+            im = Image.create()
+            im.finalize()
+            memory_zfs.log.clear()
+            rest = im.sha256[9:]
+            with ThreadPoolExecutor(max_workers=16) as ex:
+                futures = [ ex.submit(contextvars.copy_context().run, JailFs.clone_from, im,
+                    sha256=f'abcdef0{i:02d}{rest}') for i in range(100) ]
+                jails = [ f.result() for f in futures ]
+        names = [ j.name for j in jails ]
+        assert len(set(names)) == 100
+        assert f'{_ROOT}/jails/abcdef0' not in names
+        assert all(len(n.split('/')[-1]) <= 9 for n in names)
+        # one final existence check per allocated name
+        assert len([ e for e in memory_zfs.log if e[0] == 'list' ]) == 100
+
+    def test01_no_inventory(self, memory_zfs):
+        memory_zfs.create(f'{_ROOT}/volumes/abcdef0')
+        memory_zfs.create(f'{_ROOT}/volumes/abcdef01')
+        memory_zfs.log.clear()
+        name = zfs_shortest_unique_name('abcdef012345', 'volume')
+        assert name == f'{_ROOT}/volumes/abcdef012'
+        assert [ e[0] for e in memory_zfs.log ] == [ 'list', 'list' ]
+
+
+class TestSubprocessZfsBackend:
+    def test00_get_columns(self, monkeypatch):
+        out = 'zroot/a\tused\t1024\nzroot/a\tfocker:tags\tx y\n' \
+            'zroot/b\tfocker:tags\t-\nzroot/c\tused\t0\n'
+        commands = []
+        monkeypatch.setattr(cli, 'focker_subprocess_run', lambda cmd, **kwargs: \
+            commands.append(cmd) or SimpleNamespace(stdout=out.encode('utf-8')))
+        names, columns = cli.SubprocessZfsBackend().get_columns([ 'zroot' ],
+            [ 'used', 'focker:tags' ], recursive=True, zfs_type='all', parsable=True)
+        assert commands == [ [ 'zfs', 'get', '-H', '-p', '-o', 'name,property,value',
+            '-t', 'all', '-r', 'used,focker:tags', 'zroot' ] ]
+        assert names == [ 'zroot/a', 'zroot/b', 'zroot/c' ]
+        assert columns == { 'used': [ '1024', None, '0' ], 'focker:tags': [ 'x y', '-', None ] }
+
+
+class TestChannelProgramZfsBackend:
+    def test00_lua_str(self):
+        assert lua_str('zroot/focker@1') == '"zroot/focker@1"'
+        assert lua_str('a"b\\c\n') == '"a\\034b\\092c\\010"'
+        assert lua_str('é') == '"\\195\\169"'
+
+    def test01_script(self):
+        script = ChannelProgramZfsBackend.script([
+            ( 'set', 'zroot/focker/images/a', 'focker:tags', 'x y' ),
+            ( 'snapshot', 'zroot/focker/images/a@1' ),
+            ( 'destroy', 'zroot/focker/images/b' )
+        ])
+        lines = script.split('\n')
+        assert lines.index('check(zfs.check.snapshot("zroot/focker/images/a@1"), ' \
+            '"snapshot zroot/focker/images/a@1")') < \
+            lines.index('check(zfs.sync.set_prop("zroot/focker/images/a", "focker:tags", "x y"), ' \
+            '"set focker:tags zroot/focker/images/a")')
+        assert 'check_destroy_recursive("zroot/focker/images/b")' in lines
+        assert 'destroy_recursive("zroot/focker/images/b")' in lines
+        with pytest.raises(ValueError):
+            ChannelProgramZfsBackend.script([ ( 'create', 'zroot/x' ) ])
+
+    def test02_batch(self, monkeypatch):
+        backend = ChannelProgramZfsBackend()
+        programs = []
+        commands = []
+        monkeypatch.setattr(backend, 'run_program',
+            lambda pool, script: programs.append(( pool, script )))
+        monkeypatch.setattr(backend, 'run', lambda cmd: commands.append(cmd) or b'')
+        monkeypatch.setattr(backend, '_get_rows', lambda *args, **kwargs: [])
+        with backend.batch():
+            backend.set('zroot/focker/images/a', { 'focker:tags': 'x', 'rdonly': 'on' })
+            backend.snapshot('zroot/focker/images/a@1')
+            backend.destroy('zroot/focker/images/b')
+            assert programs == []
+        assert commands == [ [ 'zfs', 'set', 'rdonly=on', 'zroot/focker/images/a' ] ]
+        assert len(programs) == 1
+        assert programs[0][0] == 'zroot'
+        assert 'zfs.sync.snapshot("zroot/focker/images/a@1")' in programs[0][1]
+        backend.snapshot('zroot/focker/images/c@1')
+        assert len(programs) == 1
+        assert commands[-1] == [ 'zfs', 'snapshot', 'zroot/focker/images/c@1' ]
+
+    def test03_flush_before_read(self, monkeypatch):
+        backend = ChannelProgramZfsBackend()
+        events = []
+        monkeypatch.setattr(backend, 'run_program',
+            lambda pool, script: events.append('program'))
+        monkeypatch.setattr(backend, 'run', lambda cmd: events.append(cmd[1]) or b'')
+        monkeypatch.setattr(backend, '_get_rows', lambda *args, **kwargs: [])
+        with backend.batch():
+            backend.destroy('zroot/focker/images/b')
+            backend.exists('zroot/focker/images/b')
+            backend.snapshot('zroot/focker/images/a@1')
+        assert events == [ 'program', 'list', 'program' ]
+
+    def test04_unmount_before_destroy(self, monkeypatch):
+        backend = ChannelProgramZfsBackend()
+        events = []
+        rows = [ [ 'zroot/focker/jails/a', 'mounted', 'yes' ],
+            [ 'zroot/focker/jails/a/b', 'mounted', 'yes' ],
+            [ 'zroot/focker/volumes/c', 'mounted', 'no' ] ]
+        monkeypatch.setattr(backend, '_get_rows', lambda names, props, **kwargs: \
+            events.append(( 'get', sorted(names), props )) or rows)
+        monkeypatch.setattr(backend, 'run', lambda cmd: events.append(tuple(cmd[1:])) or b'')
+        def run_program(pool, script):
+            events.append('program')
+            raise CalledProcessError(1, 'zfs program')
+        monkeypatch.setattr(backend, 'run_program', run_program)
+        with pytest.raises(CalledProcessError):
+            with backend.batch():
+                backend.destroy('zroot/focker/jails/a')
+                backend.destroy('zroot/focker/volumes/c')
+        assert events == [
+            ( 'get', [ 'zroot/focker/jails/a', 'zroot/focker/volumes/c' ], [ 'mounted' ] ),
+            ( 'unmount', '-f', 'zroot/focker/jails/a/b' ),
+            ( 'unmount', '-f', 'zroot/focker/jails/a' ),
+            'program',
+            ( 'mount', 'zroot/focker/jails/a' ),
+            ( 'mount', 'zroot/focker/jails/a/b' )
+        ]
+
+    def test05_mixed_set_not_atomic(self, monkeypatch):
+        backend = ChannelProgramZfsBackend()
+        events = []
+        monkeypatch.setattr(backend, 'run', lambda cmd: events.append(cmd) or b'')
+        def run_program(pool, script):
+            events.append('program')
+            raise CalledProcessError(1, 'zfs program')
+        monkeypatch.setattr(backend, 'run_program', run_program)
+        with pytest.raises(CalledProcessError):
+            with backend.batch():
+                backend.set('zroot/focker/images/a', { 'focker:tags': 'x', 'rdonly': 'on' })
+                backend.snapshot('zroot/focker/images/a@1')
+        # the native property was set outside of the failed program
+        assert events == [ [ 'zfs', 'set', 'rdonly=on', 'zroot/focker/images/a' ], 'program' ]